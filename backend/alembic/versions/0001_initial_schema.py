@@ -0,0 +1,98 @@
+"""Esquema inicial (o que o Base.metadata.create_all criava)
+
+Revision ID: 0001
+Revises: 
+Create Date: 2026-10-19
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision = "0001"
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "users",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("email", sa.String(), nullable=False),
+        sa.Column("hashed_password", sa.String(), nullable=False),
+        sa.Column("is_active", sa.Boolean(), nullable=True),
+        sa.Column("is_superuser", sa.Boolean(), nullable=True),
+        sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=True),
+        sa.Column("updated_at", sa.DateTime(timezone=True), nullable=True),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index("ix_users_id", "users", ["id"])
+    op.create_index("ix_users_email", "users", ["email"], unique=True)
+
+    op.create_table(
+        "datasets",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("name", sa.String(), nullable=True),
+        sa.Column("description", sa.String(), nullable=True),
+        sa.Column("owner_id", sa.Integer(), nullable=True),
+        sa.Column("model_id", sa.String(), nullable=True),
+        sa.Column(
+            "classes_to_annotate",
+            postgresql.ARRAY(sa.String()).with_variant(sa.JSON(), "sqlite"),
+            nullable=True,
+        ),
+        sa.ForeignKeyConstraint(["owner_id"], ["users.id"]),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index("ix_datasets_id", "datasets", ["id"])
+    op.create_index("ix_datasets_name", "datasets", ["name"])
+
+    op.create_table(
+        "images",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("file_name", sa.String(), nullable=True),
+        sa.Column("file_path", sa.String(), nullable=True),
+        sa.Column("dataset_id", sa.Integer(), nullable=True),
+        sa.ForeignKeyConstraint(["dataset_id"], ["datasets.id"]),
+        sa.PrimaryKeyConstraint("id"),
+        sa.UniqueConstraint("file_path"),
+    )
+    op.create_index("ix_images_id", "images", ["id"])
+
+    op.create_table(
+        "annotations",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("annotation_type", sa.String(), nullable=False),
+        sa.Column("class_label", sa.String(), nullable=True),
+        sa.Column("geometry", sa.JSON(), nullable=True),
+        sa.Column("confidence", sa.Float(), nullable=True),
+        sa.Column("image_id", sa.Integer(), nullable=True),
+        sa.ForeignKeyConstraint(["image_id"], ["images.id"]),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index("ix_annotations_id", "annotations", ["id"])
+    op.create_index("ix_annotations_class_label", "annotations", ["class_label"])
+
+    op.create_table(
+        "custom_models",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("name", sa.String(), nullable=False),
+        sa.Column("model_type", sa.String(), nullable=False),
+        sa.Column("file_path", sa.String(), nullable=False),
+        sa.Column("owner_id", sa.Integer(), nullable=True),
+        sa.ForeignKeyConstraint(["owner_id"], ["users.id"]),
+        sa.PrimaryKeyConstraint("id"),
+        sa.UniqueConstraint("file_path"),
+    )
+    op.create_index("ix_custom_models_id", "custom_models", ["id"])
+    op.create_index("ix_custom_models_name", "custom_models", ["name"])
+
+
+def downgrade():
+    op.drop_table("custom_models")
+    op.drop_table("annotations")
+    op.drop_table("images")
+    op.drop_table("datasets")
+    op.drop_table("users")
@@ -0,0 +1,32 @@
+"""Proveniência das anotações e revisões para o cache de exportação
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-19
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = "0002"
+down_revision = "0001"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column("annotations", sa.Column("provenance", sa.String(), nullable=True))
+    op.add_column("images", sa.Column("annotation_provenance", sa.String(), nullable=True))
+    op.add_column("images", sa.Column("annotation_revision", sa.Integer(), nullable=False, server_default="0"))
+    op.add_column("datasets", sa.Column("annotation_revision", sa.Integer(), nullable=False, server_default="0"))
+
+
+def downgrade():
+    with op.batch_alter_table("datasets") as batch_op:
+        batch_op.drop_column("annotation_revision")
+    with op.batch_alter_table("images") as batch_op:
+        batch_op.drop_column("annotation_revision")
+        batch_op.drop_column("annotation_provenance")
+    with op.batch_alter_table("annotations") as batch_op:
+        batch_op.drop_column("provenance")
@@ -0,0 +1,37 @@
+"""Índices nas chaves estrangeiras e em (class_label, image_id)
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-19
+
+"""
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "0003"
+down_revision = "0002"
+branch_labels = None
+depends_on = None
+
+# (nome, tabela, colunas)
+INDEXES = [
+    ("ix_annotations_image_id", "annotations", ["image_id"]),
+    ("ix_annotations_class_label_image_id", "annotations", ["class_label", "image_id"]),
+    ("ix_images_dataset_id", "images", ["dataset_id"]),
+    ("ix_datasets_owner_id", "datasets", ["owner_id"]),
+    ("ix_custom_models_owner_id", "custom_models", ["owner_id"]),
+]
+
+
+def upgrade():
+    # No Postgres os índices são criados com CONCURRENTLY para não bloquear
+    # escritas em tabelas grandes; isso não pode correr dentro de uma transação.
+    with op.get_context().autocommit_block():
+        for name, table, columns in INDEXES:
+            op.create_index(name, table, columns, postgresql_concurrently=True, if_not_exists=True)
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        for name, table, _ in reversed(INDEXES):
+            op.drop_index(name, table_name=table, postgresql_concurrently=True, if_exists=True)
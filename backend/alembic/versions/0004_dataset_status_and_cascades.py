@@ -0,0 +1,46 @@
+"""Estado do dataset e ON DELETE CASCADE em imagens/anotações
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-19
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = "0004"
+down_revision = "0003"
+branch_labels = None
+depends_on = None
+
+# (constraint, tabela, coluna, tabela referenciada)
+FOREIGN_KEYS = [
+    ("images_dataset_id_fkey", "images", "dataset_id", "datasets"),
+    ("annotations_image_id_fkey", "annotations", "image_id", "images"),
+]
+
+
+# No SQLite as FKs não têm nome: o modo batch recria a tabela e dá-lhes este
+SQLITE_NAMING_CONVENTION = {"fk": "fk_%(table_name)s_%(column_0_name)s_%(referred_table_name)s"}
+
+
+def _recreate_foreign_keys(ondelete):
+    is_sqlite = op.get_bind().dialect.name == "sqlite"
+    for name, table, column, referred_table in FOREIGN_KEYS:
+        if is_sqlite:
+            name = f"fk_{table}_{column}_{referred_table}"
+        with op.batch_alter_table(table, naming_convention=SQLITE_NAMING_CONVENTION) as batch_op:
+            batch_op.drop_constraint(name, type_="foreignkey")
+            batch_op.create_foreign_key(name, referred_table, [column], ["id"], ondelete=ondelete)
+
+
+def upgrade():
+    op.add_column("datasets", sa.Column("status", sa.String(), nullable=False, server_default="active"))
+    _recreate_foreign_keys("CASCADE")
+
+
+def downgrade():
+    _recreate_foreign_keys(None)
+    with op.batch_alter_table("datasets") as batch_op:
+        batch_op.drop_column("status")
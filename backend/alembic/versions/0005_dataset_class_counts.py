@@ -0,0 +1,41 @@
+"""Contagens por classe materializadas (dataset_class_counts)
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-19
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = "0005"
+down_revision = "0004"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "dataset_class_counts",
+        sa.Column("dataset_id", sa.Integer(), nullable=False),
+        sa.Column("class_label", sa.String(), nullable=False),
+        sa.Column("annotation_count", sa.Integer(), nullable=False),
+        sa.Column("confidence_sum", sa.Float(), nullable=False),
+        sa.ForeignKeyConstraint(["dataset_id"], ["datasets.id"], ondelete="CASCADE"),
+        sa.PrimaryKeyConstraint("dataset_id", "class_label"),
+    )
+    # Preenche a tabela com as anotações que já existem
+    op.execute(
+        """
+        INSERT INTO dataset_class_counts (dataset_id, class_label, annotation_count, confidence_sum)
+        SELECT images.dataset_id, annotations.class_label, COUNT(annotations.id), COALESCE(SUM(annotations.confidence), 0)
+        FROM annotations JOIN images ON images.id = annotations.image_id
+        WHERE annotations.class_label IS NOT NULL AND images.dataset_id IS NOT NULL
+        GROUP BY images.dataset_id, annotations.class_label
+        """
+    )
+
+
+def downgrade():
+    op.drop_table("dataset_class_counts")
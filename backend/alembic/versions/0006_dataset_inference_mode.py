@@ -0,0 +1,28 @@
+"""Modo de inferência do dataset (imagem inteira ou mosaico)
+
+Revision ID: 0006
+Revises: 0005
+Create Date: 2026-10-19
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = "0006"
+down_revision = "0005"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column("datasets", sa.Column("inference_mode", sa.String(), nullable=False, server_default="full"))
+    op.add_column("datasets", sa.Column("tile_size", sa.Integer(), nullable=False, server_default="640"))
+    op.add_column("datasets", sa.Column("tile_overlap", sa.Float(), nullable=False, server_default="0.2"))
+
+
+def downgrade():
+    with op.batch_alter_table("datasets") as batch_op:
+        batch_op.drop_column("tile_overlap")
+        batch_op.drop_column("tile_size")
+        batch_op.drop_column("inference_mode")
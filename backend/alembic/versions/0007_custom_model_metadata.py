@@ -0,0 +1,37 @@
+"""Metadados dos modelos customizados (classes, tarefa, tamanho, hash)
+
+Revision ID: 0007
+Revises: 0006
+Create Date: 2026-10-19
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = "0007"
+down_revision = "0006"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Os modelos já existentes ficam 'pending' (ver scripts/backfill_model_metadata.py)
+    op.add_column("custom_models", sa.Column("metadata_status", sa.String(), nullable=False, server_default="pending"))
+    op.add_column("custom_models", sa.Column("class_names", sa.JSON(), nullable=True))
+    op.add_column("custom_models", sa.Column("task", sa.String(), nullable=True))
+    op.add_column("custom_models", sa.Column("input_size", sa.Integer(), nullable=True))
+    op.add_column("custom_models", sa.Column("parameter_count", sa.BigInteger(), nullable=True))
+    op.add_column("custom_models", sa.Column("file_sha256", sa.String(length=64), nullable=True))
+    op.add_column("custom_models", sa.Column("file_size", sa.BigInteger(), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table("custom_models") as batch_op:
+        batch_op.drop_column("file_size")
+        batch_op.drop_column("file_sha256")
+        batch_op.drop_column("parameter_count")
+        batch_op.drop_column("input_size")
+        batch_op.drop_column("task")
+        batch_op.drop_column("class_names")
+        batch_op.drop_column("metadata_status")
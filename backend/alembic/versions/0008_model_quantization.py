@@ -0,0 +1,31 @@
+"""Variante INT8 dos modelos customizados e precisão escolhida por dataset
+
+Revision ID: 0008
+Revises: 0007
+Create Date: 2026-10-19
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = "0008"
+down_revision = "0007"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column("custom_models", sa.Column("quantization_status", sa.String(), nullable=False, server_default="none"))
+    op.add_column("custom_models", sa.Column("quantized_file_path", sa.String(), nullable=True))
+    op.add_column("custom_models", sa.Column("quantization_report", sa.JSON(), nullable=True))
+    op.add_column("datasets", sa.Column("model_precision", sa.String(), nullable=False, server_default="fp32"))
+
+
+def downgrade():
+    with op.batch_alter_table("datasets") as batch_op:
+        batch_op.drop_column("model_precision")
+    with op.batch_alter_table("custom_models") as batch_op:
+        batch_op.drop_column("quantization_report")
+        batch_op.drop_column("quantized_file_path")
+        batch_op.drop_column("quantization_status")
@@ -0,0 +1,32 @@
+"""Parâmetros de inferência por dataset (confiança, IoU, máx. deteções, tamanho, FP16)
+
+Revision ID: 0009
+Revises: 0008
+Create Date: 2026-10-19
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = "0009"
+down_revision = "0008"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column("datasets", sa.Column("confidence_threshold", sa.Float(), nullable=False, server_default="0.1"))
+    op.add_column("datasets", sa.Column("iou_threshold", sa.Float(), nullable=False, server_default="0.7"))
+    op.add_column("datasets", sa.Column("max_detections", sa.Integer(), nullable=False, server_default="300"))
+    op.add_column("datasets", sa.Column("input_size", sa.Integer(), nullable=True))
+    op.add_column("datasets", sa.Column("half_precision", sa.Boolean(), nullable=False, server_default=sa.false()))
+
+
+def downgrade():
+    with op.batch_alter_table("datasets") as batch_op:
+        batch_op.drop_column("half_precision")
+        batch_op.drop_column("input_size")
+        batch_op.drop_column("max_detections")
+        batch_op.drop_column("iou_threshold")
+        batch_op.drop_column("confidence_threshold")
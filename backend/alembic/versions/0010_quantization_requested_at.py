@@ -0,0 +1,24 @@
+"""Instante do pedido de quantização (para detetar pedidos 'pending' perdidos)
+
+Revision ID: 0010
+Revises: 0009
+Create Date: 2026-10-19
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = "0010"
+down_revision = "0009"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column("custom_models", sa.Column("quantization_requested_at", sa.DateTime(timezone=True), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table("custom_models") as batch_op:
+        batch_op.drop_column("quantization_requested_at")
@@ -0,0 +1,35 @@
+"""Nº de anotações com confiança nas contagens por classe (média = AVG(confidence))
+
+Revision ID: 0011
+Revises: 0010
+Create Date: 2026-10-19
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = "0011"
+down_revision = "0010"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column("dataset_class_counts", sa.Column("confidence_count", sa.Integer(), nullable=False, server_default="0"))
+    # Preenche a coluna a partir das anotações que já existem
+    op.execute(
+        """
+        UPDATE dataset_class_counts SET confidence_count = (
+            SELECT COUNT(annotations.confidence)
+            FROM annotations JOIN images ON images.id = annotations.image_id
+            WHERE images.dataset_id = dataset_class_counts.dataset_id
+              AND annotations.class_label = dataset_class_counts.class_label
+        )
+        """
+    )
+
+
+def downgrade():
+    with op.batch_alter_table("dataset_class_counts") as batch_op:
+        batch_op.drop_column("confidence_count")
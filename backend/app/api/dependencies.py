@@ -1,15 +1,16 @@
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from jose import JWTError, jwt
 from app.core.config import settings 
-from app.core.database import get_db
+from app.core.database import get_async_db
 from app.models.user import User
 from app.services import user_service
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/auth/token") # O endpoint de login
 
-def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
+# Assíncrona: o lookup do utilizador não ocupa uma thread da threadpool em cada pedido
+async def get_current_user(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_async_db)):
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
@@ -19,12 +20,18 @@ def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(
         # --- 2. USAR AS CONFIGURAÇÕES ---
         payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
         email: str = payload.get("sub")
+        user_id = payload.get("uid")
         if email is None:
             raise credentials_exception
     except JWTError:
         raise credentials_exception
     
-    user = user_service.get_user_by_email(db, email=email)
+    if user_id is not None:
+        # Tokens novos trazem o ID: lookup pela chave primária, com cache
+        user = await user_service.get_user_cached_async(db, user_id=user_id)
+    else:
+        # Tokens emitidos antes do 'uid' existir
+        user = await user_service.get_user_by_email_async(db, email=email)
     if user is None:
         raise credentials_exception
     return user
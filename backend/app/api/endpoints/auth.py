@@ -1,44 +1,21 @@
-from datetime import datetime, timedelta, timezone
-from typing import Optional
 from fastapi import APIRouter, Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordRequestForm
 from sqlalchemy.orm import Session
-from jose import JWTError, jwt
-from passlib.context import CryptContext
 
 from app.core.database import get_db
+from app.core.security import create_access_token
 from app.schemas.token import Token
 from app.services import user_service
-from app.core.config import settings
 
 router = APIRouter()
 
-# --- Funções de Autenticação ---
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
-
-def verify_password(plain_password, hashed_password):
-    return pwd_context.verify(plain_password, hashed_password)
-
-def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
-    to_encode = data.copy()
-    if expires_delta:
-        expire = datetime.now(timezone.utc) + expires_delta
-    else:
-        # Usa o valor do .env (lido pelo settings)
-        expire = datetime.now(timezone.utc) + timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
-    
-    to_encode.update({"exp": expire})
-    # Usa o valor do .env (lido pelo settings)
-    encoded_jwt = jwt.encode(to_encode, settings.SECRET_KEY, algorithm=settings.ALGORITHM)
-    return encoded_jwt
-# --- Fim das Funções de Autenticação ---
-
 @router.post("/token", response_model=Token)
-def login_for_access_token(db: Session = Depends(get_db), form_data: OAuth2PasswordRequestForm = Depends()):
+async def login_for_access_token(db: Session = Depends(get_db), form_data: OAuth2PasswordRequestForm = Depends()):
     """
     Processa o formulário de login e retorna um token de acesso.
     """
-    user = user_service.authenticate_user(db, email=form_data.username, password=form_data.password)
+    # O Argon2 corre no pool de hashing; o event loop continua livre
+    user = await user_service.authenticate_user_async(db, email=form_data.username, password=form_data.password)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -47,6 +24,6 @@ def login_for_access_token(db: Session = Depends(get_db), form_data: OAuth2Passw
         )
     
     access_token = create_access_token(
-        data={"sub": user.email}
+        data={"sub": user.email, "uid": user.id}
     )
     return {"access_token": access_token, "token_type": "bearer"}
\ No newline at end of file
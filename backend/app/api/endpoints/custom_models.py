@@ -1,12 +1,16 @@
-from typing import List
-from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File, Form
+from typing import List, Optional
+from fastapi import APIRouter, BackgroundTasks, Depends, Header, HTTPException, Query, Request, status, UploadFile, File, Form
+from starlette.concurrency import run_in_threadpool
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 
 from app.api.dependencies import get_current_user
-from app.core.database import get_db
+from app.core.config import settings
+from app.core.database import get_async_db, get_db
 from app.models.user import User
-from app.schemas.custom_model import CustomModel, CustomModelCreate
-from app.services import custom_model_service
+from app.schemas.custom_model import CustomModel, CustomModelCreate, ModelQuantizationRequest
+from app.schemas.model_upload import ModelUpload, ModelUploadComplete, ModelUploadCreate
+from app.services import custom_model_service, model_metadata_service, model_quantization_service, model_upload_service
 
 router = APIRouter()
 
@@ -15,26 +19,104 @@ def upload_new_model(
     *,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user),
+    background_tasks: BackgroundTasks,
     name: str = Form(...),
     model_type: str = Form(...), # 'detection' ou 'segmentation'
+    quantize: bool = Form(False), # produz também a variante INT8 para CPU
     file: UploadFile = File(...)
 ):
     """
     Faz o upload de um novo modelo (.pt) para o usuário logado.
     """
-    if not file.filename.endswith((".pt", ".pth")):
-        raise HTTPException(status_code=400, detail="Tipo de arquivo inválido. Apenas arquivos .pt ou .pth são permitidos.")
-    
     model_in = CustomModelCreate(name=name, model_type=model_type)
     
     model = custom_model_service.create_model(
         db=db, model_in=model_in, file=file, owner_id=current_user.id
     )
+    # Carrega o .pt uma única vez, fora do pedido, para guardar as classes e a tarefa
+    background_tasks.add_task(model_metadata_service.extract_custom_model_metadata, model.id)
+    if quantize:
+        model = model_quantization_service.request_quantization(db, model)
+        background_tasks.add_task(model_quantization_service.quantize_custom_model, model.id)
     return model
 
-@router.get("/", response_model=List[CustomModel])
-def read_user_models(
+@router.post("/uploads", response_model=ModelUpload, status_code=status.HTTP_201_CREATED)
+def start_model_upload(
+    upload_in: ModelUploadCreate,
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Inicia um upload em partes (retomável) de um modelo. Para ficheiros acima do
+    limite de um pedido único (ex.: SAM-L, YOLOv8x-seg).
+    """
+    return model_upload_service.create_upload(upload_in, owner_id=current_user.id)
+
+@router.get("/uploads/{upload_id}", response_model=ModelUpload)
+def read_model_upload(
+    upload_id: str,
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Estado de um upload em partes: o offset diz a partir de onde retomar.
+    """
+    return model_upload_service.get_upload(upload_id, owner_id=current_user.id)
+
+@router.put("/uploads/{upload_id}/chunks", response_model=ModelUpload)
+async def upload_model_chunk(
+    upload_id: str,
+    request: Request,
+    offset: int = Query(..., ge=0),
+    chunk_sha256: Optional[str] = Header(None, alias="X-Chunk-SHA256"),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Envia uma parte (corpo application/octet-stream) a começar em `offset`.
+    """
+    data = bytearray()
+    async for part in request.stream():
+        data += part
+        if len(data) > settings.MODEL_UPLOAD_CHUNK_SIZE:
+            raise HTTPException(status_code=413, detail=f"Cada parte pode ter no máximo {settings.MODEL_UPLOAD_CHUNK_SIZE} bytes.")
+
+    return await run_in_threadpool(
+        model_upload_service.append_chunk, upload_id, current_user.id,
+        offset=offset, data=bytes(data), chunk_sha256=chunk_sha256,
+    )
+
+@router.post("/uploads/{upload_id}/complete", response_model=CustomModel, status_code=status.HTTP_201_CREATED)
+def complete_model_upload(
+    upload_id: str,
+    *,
     db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+    background_tasks: BackgroundTasks,
+    complete_in: Optional[ModelUploadComplete] = None
+):
+    """
+    Verifica o SHA-256 do ficheiro inteiro e regista o modelo customizado.
+    """
+    model = model_upload_service.complete_upload(
+        db, upload_id, owner_id=current_user.id, sha256=complete_in.sha256 if complete_in else None
+    )
+    background_tasks.add_task(model_metadata_service.extract_custom_model_metadata, model.id)
+    if complete_in and complete_in.quantize:
+        model = model_quantization_service.request_quantization(db, model)
+        background_tasks.add_task(model_quantization_service.quantize_custom_model, model.id)
+    return model
+
+@router.delete("/uploads/{upload_id}", status_code=status.HTTP_204_NO_CONTENT)
+def abort_model_upload(
+    upload_id: str,
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Cancela um upload em partes e apaga o que já foi recebido.
+    """
+    model_upload_service.abort_upload(upload_id, owner_id=current_user.id)
+
+@router.get("/", response_model=List[CustomModel])
+async def read_user_models(
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_user)
 ):
     """
@@ -42,7 +124,25 @@ def read_user_models(
     (Esta é a rota que o seu Modal vai chamar)
     """
     
-    return custom_model_service.get_models_by_owner(db=db, owner_id=current_user.id)
+    return await custom_model_service.get_models_by_owner_async(db=db, owner_id=current_user.id)
+
+@router.post("/{model_id}/quantization", response_model=CustomModel, status_code=status.HTTP_202_ACCEPTED)
+def quantize_user_model(
+    model_id: int,
+    background_tasks: BackgroundTasks,
+    quantization_in: Optional[ModelQuantizationRequest] = None,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Produz em segundo plano a variante INT8 (ONNX Runtime) de um modelo customizado,
+    calibrada com imagens do usuário. O relatório fica em quantization_report.
+    """
+    db_model = custom_model_service.get_model(db=db, model_id=model_id, owner_id=current_user.id)
+    dataset_id = quantization_in.dataset_id if quantization_in else None
+    db_model = model_quantization_service.request_quantization(db, db_model)
+    background_tasks.add_task(model_quantization_service.quantize_custom_model, db_model.id, dataset_id)
+    return db_model
 
 @router.delete("/{model_id}", status_code=status.HTTP_204_NO_CONTENT)
 def delete_user_model(
@@ -1,17 +1,29 @@
-from typing import List
-from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File, BackgroundTasks 
+from typing import List, Optional
+from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File, Form, BackgroundTasks, Header, Response, Query
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 import os 
-import io
+import re
+import shutil
+import tempfile
 from app.api.dependencies import get_current_user
-from app.core.database import get_db
+from app.core.database import get_async_db, get_db
 from app.models.user import User
-from app.schemas.dataset import Dataset, DatasetCreate, Image as SchemaImage
+from app.schemas.dataset import Dataset, DatasetCreate, DatasetReannotate, Image as SchemaImage
 from app.models.dataset import Image as ModelImage
 from app.services import dataset_service
 from app.services import ia_service 
-from app.services.dataset_service import UPLOAD_DIRECTORY
-from fastapi.responses import StreamingResponse
+from app.services import export_cache_service
+from app.services import export_job_service
+from app.services import import_job_service
+from app.services import dataset_stats_service
+from app.services import video_service
+from app.core.config import settings
+from app.core import http_cache, tracing
+from app.schemas.dataset_stats import DatasetStats
+from app.schemas.export_job import ExportJob, ExportJobCreate
+from app.schemas.import_job import ImportJob
+from fastapi.responses import FileResponse, StreamingResponse
 
 router = APIRouter()
 
@@ -28,38 +40,63 @@ def create_new_dataset(
     return dataset
 
 @router.get("/", response_model=List[Dataset])
-def read_user_datasets(
-    db: Session = Depends(get_db),
+async def read_user_datasets(
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_user),
     skip: int = 0,
     limit: int = 100,
 ):
-    datasets = dataset_service.get_datasets_by_owner(
+    datasets = await dataset_service.get_datasets_by_owner_async(
         db=db, owner_id=current_user.id, skip=skip, limit=limit
     )
-    return datasets
+    # Serializado em streaming a partir da BD, sem passar pelo response_model
+    return StreamingResponse(dataset_service.aiter_datasets_json(db, datasets), media_type="application/json")
 
 @router.get("/{dataset_id}", response_model=Dataset)
-def get_dataset_details(
+async def get_dataset_details(
+    dataset_id: int,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: User = Depends(get_current_user),
+):
+    db_dataset = await dataset_service.get_dataset_async(db, dataset_id=dataset_id)
+    if not db_dataset:
+        raise HTTPException(status_code=404, detail="Dataset não encontrado")
+    if db_dataset.owner_id != current_user.id:
+        raise HTTPException(status_code=403, detail="Não autorizado")
+    return StreamingResponse(dataset_service.aiter_dataset_json(db, db_dataset), media_type="application/json")
+    
+@router.get("/{dataset_id}/stats", response_model=DatasetStats)
+def read_dataset_stats(
     dataset_id: int,
+    bins: int = Query(10, ge=1, le=100),
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user),
 ):
+    """
+    Estatísticas do dataset (contagens por classe, densidade de anotações por
+    imagem, histograma de confiança), calculadas na BD com GROUP BY.
+    """
     db_dataset = dataset_service.get_dataset(db, dataset_id=dataset_id)
     if not db_dataset:
         raise HTTPException(status_code=404, detail="Dataset não encontrado")
     if db_dataset.owner_id != current_user.id:
         raise HTTPException(status_code=403, detail="Não autorizado")
-    return db_dataset
-    
-@router.delete("/{dataset_id}", status_code=status.HTTP_204_NO_CONTENT)
+    return dataset_stats_service.get_dataset_stats(db, db_dataset, bins=bins)
+
+@router.delete("/{dataset_id}", status_code=status.HTTP_202_ACCEPTED)
 def delete_dataset(
     dataset_id: int,
+    background_tasks: BackgroundTasks,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user),
 ):
-    dataset_service.delete_dataset(db=db, dataset_id=dataset_id, owner_id=current_user.id)
-    return {"ok": True} 
+    """
+    Marca o dataset para remoção e responde de imediato; as linhas e os
+    ficheiros são apagados em segundo plano.
+    """
+    db_dataset = dataset_service.delete_dataset(db=db, dataset_id=dataset_id, owner_id=current_user.id)
+    background_tasks.add_task(dataset_service.purge_deleted_datasets)
+    return {"id": db_dataset.id, "status": db_dataset.status}
 
 @router.post("/{dataset_id}/images/", response_model=List[SchemaImage])
 def upload_images_to_dataset(
@@ -79,6 +116,43 @@ def upload_images_to_dataset(
     )
     return new_images
 
+@router.post("/{dataset_id}/videos/", status_code=status.HTTP_202_ACCEPTED)
+def upload_video_to_dataset(
+    dataset_id: int,
+    background_tasks: BackgroundTasks,
+    file: UploadFile = File(...),
+    sample_fps: float = Query(settings.VIDEO_SAMPLE_FPS, gt=0, le=60),
+    dedup_threshold: int = Query(settings.VIDEO_DEDUP_THRESHOLD, ge=0, le=64),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+):
+    """
+    Recebe um vídeo e extrai em segundo plano os frames amostrados (sample_fps),
+    sem duplicados consecutivos, como imagens do dataset.
+    """
+    db_dataset = dataset_service.get_dataset(db, dataset_id=dataset_id)
+    if not db_dataset:
+        raise HTTPException(status_code=404, detail="Dataset não encontrado")
+    if db_dataset.owner_id != current_user.id:
+        raise HTTPException(status_code=403, detail="Não autorizado")
+    if not video_service.is_video_filename(file.filename):
+        raise HTTPException(status_code=400, detail="Formato de vídeo não suportado.")
+
+    # O OpenCV precisa de um caminho no disco; o ficheiro é apagado no fim da tarefa
+    suffix = os.path.splitext(file.filename)[1].lower()
+    with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as tmp:
+        shutil.copyfileobj(file.file, tmp)
+
+    background_tasks.add_task(
+        video_service.ingest_video,
+        dataset_id=dataset_id,
+        video_path=tmp.name,
+        video_name=file.filename,
+        sample_fps=sample_fps,
+        dedup_threshold=dedup_threshold
+    )
+    return {"message": "Extração de frames iniciada em segundo plano.", "video": file.filename}
+
 @router.post("/{dataset_id}/annotate", status_code=status.HTTP_202_ACCEPTED)
 def start_annotation_route(
     dataset_id: int,
@@ -97,96 +171,253 @@ def start_annotation_route(
 
     background_tasks.add_task(
         dataset_service.run_annotation_for_dataset, 
-        dataset_id=dataset_id 
+        dataset_id=dataset_id,
+        trace_context=tracing.inject_context() # A tarefa fica no trace deste pedido
     )
 
     return {"message": "Processo de anotação iniciado em segundo plano."}
 
-
-@router.get("/{dataset_id}/export/yolo", response_class=StreamingResponse)
-def export_dataset_annotations_yolo(
+@router.post("/{dataset_id}/reannotate", status_code=status.HTTP_202_ACCEPTED)
+def start_reannotation_route(
     dataset_id: int,
+    background_tasks: BackgroundTasks,
+    config_in: Optional[DatasetReannotate] = None,
+    include_imported: bool = Query(False),
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user),
 ):
+    """
+    Altera (opcionalmente) o modelo/classes do dataset e re-anota em segundo plano
+    apenas as imagens cuja proveniência difere da nova configuração.
+    As anotações importadas só são substituídas com include_imported=true.
+    """
+    db_dataset = dataset_service.get_dataset(db, dataset_id=dataset_id)
+    if not db_dataset:
+        raise HTTPException(status_code=404, detail="Dataset não encontrado")
+    if db_dataset.owner_id != current_user.id:
+        raise HTTPException(status_code=403, detail="Não autorizado")
+
+    if config_in is not None:
+        db_dataset = dataset_service.update_annotation_config(db, db_dataset=db_dataset, config_in=config_in)
+    if not db_dataset.model_id:
+        raise HTTPException(status_code=400, detail="O dataset não tem um modelo definido.")
+
+    background_tasks.add_task(
+        dataset_service.run_reannotation_for_dataset,
+        dataset_id=dataset_id,
+        trace_context=tracing.inject_context(),
+        include_imported=include_imported,
+    )
+
+    return {
+        "message": "Processo de re-anotação iniciado em segundo plano.",
+        "provenance": dataset_service.get_annotation_provenance(db_dataset),
+    }
+
+
+def _export_dataset(dataset_id: int, export_format: str, db: Session, current_user: User, if_none_match: Optional[str], pretty: bool = True):
     dataset = dataset_service.get_dataset(db, dataset_id=dataset_id)
     if not dataset:
         raise HTTPException(status_code=404, detail="Dataset não encontrado")
     if dataset.owner_id != current_user.id:
         raise HTTPException(status_code=403, detail="Não tem permissão para acessar este dataset")
 
-    zip_bytes = dataset_service.export_annotations_yolo(db, db_dataset=dataset)
+    # O cliente já tem a versão atual: não é preciso montar nem enviar nada
+    etag = export_cache_service.get_export_etag(dataset, export_format, pretty=pretty)
+    cache_headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if http_cache.etag_matches(if_none_match, etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=cache_headers)
+
+    artifact_path = export_cache_service.get_export_artifact(
+        db, db_dataset=dataset, export_format=export_format, pretty=pretty
+    )
     
-    filename = f"{dataset.name.replace(' ', '_')}_yolo.zip"
+    filename = f"{dataset.name.replace(' ', '_')}_{export_format}.zip"
     
-    return StreamingResponse(
-        io.BytesIO(zip_bytes),
+    return FileResponse(
+        artifact_path,
         media_type="application/x-zip-compressed",
-        headers={"Content-Disposition": f"attachment; filename={filename}"}
+        filename=filename,
+        headers=cache_headers,
     )
 
-@router.get("/{dataset_id}/export/labelme", response_class=StreamingResponse)
+@router.get("/{dataset_id}/export/yolo", response_class=FileResponse)
+def export_dataset_annotations_yolo(
+    dataset_id: int,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+    if_none_match: Optional[str] = Header(None),
+):
+    return _export_dataset(dataset_id, "yolo", db, current_user, if_none_match)
+
+@router.get("/{dataset_id}/export/labelme", response_class=FileResponse)
 def export_dataset_annotations_labelme(
     dataset_id: int,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user),
+    if_none_match: Optional[str] = Header(None),
 ):
-    dataset = dataset_service.get_dataset(db, dataset_id=dataset_id)
-    if not dataset:
-        raise HTTPException(status_code=404, detail="Dataset não encontrado")
-    if dataset.owner_id != current_user.id:
-        raise HTTPException(status_code=403, detail="Não tem permissão para acessar este dataset")
+    return _export_dataset(dataset_id, "labelme", db, current_user, if_none_match)
 
-    zip_bytes = dataset_service.export_annotations_labelme(db, db_dataset=dataset)
-    
-    filename = f"{dataset.name.replace(' ', '_')}_labelme.zip"
-    
+@router.get("/{dataset_id}/export/coco", response_class=FileResponse)
+def export_dataset_annotations_coco(
+    dataset_id: int,
+    pretty: bool = True, # False = JSON compacto (sem indentação)
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+    if_none_match: Optional[str] = Header(None),
+):
+    return _export_dataset(dataset_id, "coco", db, current_user, if_none_match, pretty=pretty)
+
+@router.get("/{dataset_id}/export/cvat", response_class=FileResponse)
+def export_dataset_annotations_cvat(
+    dataset_id: int,
+    pretty: bool = True, # False = XML sem indentação
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+    if_none_match: Optional[str] = Header(None),
+):
+    return _export_dataset(dataset_id, "cvat", db, current_user, if_none_match, pretty=pretty)
+
+
+# --- Exportações assíncronas ---
+
+def _ranged_file_response(path: str, range_header: Optional[str], filename: str):
+    """
+    Serve um ficheiro com suporte a HTTP Range (um único intervalo), para que
+    downloads grandes interrompidos possam ser retomados.
+    """
+    file_size = os.path.getsize(path)
+    headers = {"Accept-Ranges": "bytes"}
+
+    match = re.fullmatch(r"bytes=(\d*)-(\d*)", range_header.strip()) if range_header else None
+    if not match or match.groups() == ("", ""):
+        # Sem Range (ou Range que não suportamos): ficheiro completo
+        return FileResponse(path, media_type="application/x-zip-compressed", filename=filename, headers=headers)
+
+    start_str, end_str = match.groups()
+    if start_str == "":
+        # Sufixo: "bytes=-500" = últimos 500 bytes
+        start = max(file_size - int(end_str), 0)
+        end = file_size - 1
+    else:
+        start = int(start_str)
+        end = min(int(end_str), file_size - 1) if end_str else file_size - 1
+
+    if start >= file_size or start > end:
+        raise HTTPException(
+            status_code=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE,
+            detail="Intervalo inválido.",
+            headers={"Content-Range": f"bytes */{file_size}"},
+        )
+
+    def iter_range(chunk_size: int = 64 * 1024):
+        with open(path, "rb") as f:
+            f.seek(start)
+            remaining = end - start + 1
+            while remaining > 0:
+                chunk = f.read(min(chunk_size, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                yield chunk
+
+    headers.update({
+        "Content-Range": f"bytes {start}-{end}/{file_size}",
+        "Content-Length": str(end - start + 1),
+        "Content-Disposition": f'attachment; filename="{filename}"',
+    })
     return StreamingResponse(
-        io.BytesIO(zip_bytes),
+        iter_range(),
+        status_code=status.HTTP_206_PARTIAL_CONTENT,
         media_type="application/x-zip-compressed",
-        headers={"Content-Disposition": f"attachment; filename={filename}"}
+        headers=headers,
     )
 
-@router.get("/{dataset_id}/export/coco", response_class=StreamingResponse)
-def export_dataset_annotations_coco(
+@router.post("/{dataset_id}/export-jobs", response_model=ExportJob, status_code=status.HTTP_202_ACCEPTED)
+def submit_export_job(
     dataset_id: int,
+    job_in: ExportJobCreate,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user),
 ):
+    """
+    Pede uma exportação em segundo plano. Pedidos iguais para a mesma revisão
+    do dataset devolvem a mesma tarefa.
+    """
     dataset = dataset_service.get_dataset(db, dataset_id=dataset_id)
     if not dataset:
         raise HTTPException(status_code=404, detail="Dataset não encontrado")
     if dataset.owner_id != current_user.id:
         raise HTTPException(status_code=403, detail="Não tem permissão para acessar este dataset")
 
-    zip_bytes = dataset_service.export_annotations_coco(db, db_dataset=dataset)
-    
-    filename = f"{dataset.name.replace(' ', '_')}_coco.zip"
-    
-    return StreamingResponse(
-        io.BytesIO(zip_bytes),
-        media_type="application/x-zip-compressed",
-        headers={"Content-Disposition": f"attachment; filename={filename}"}
-    )
+    return export_job_service.submit_export_job(dataset, job_in.export_format, pretty=job_in.pretty)
 
-@router.get("/{dataset_id}/export/cvat", response_class=StreamingResponse)
-def export_dataset_annotations_cvat(
+@router.get("/{dataset_id}/export-jobs/{job_id}", response_model=ExportJob)
+def read_export_job(
+    dataset_id: int,
+    job_id: str,
+    current_user: User = Depends(get_current_user),
+):
+    """
+    Estado de uma tarefa de exportação.
+    """
+    job = export_job_service.get_export_job(job_id, owner_id=current_user.id)
+    if job["dataset_id"] != dataset_id:
+        raise HTTPException(status_code=404, detail="Tarefa de exportação não encontrada.")
+    return job
+
+@router.get("/{dataset_id}/export-jobs/{job_id}/download", response_class=FileResponse)
+def download_export_job(
+    dataset_id: int,
+    job_id: str,
+    range_header: Optional[str] = Header(None, alias="Range"),
+    current_user: User = Depends(get_current_user),
+):
+    """
+    Descarrega o .zip de uma tarefa concluída (suporta HTTP Range).
+    """
+    job = export_job_service.get_export_job(job_id, owner_id=current_user.id)
+    if job["dataset_id"] != dataset_id:
+        raise HTTPException(status_code=404, detail="Tarefa de exportação não encontrada.")
+
+    artifact_path = export_job_service.get_artifact_path(job_id, owner_id=current_user.id)
+    if artifact_path is None:
+        raise HTTPException(status_code=409, detail=f"A exportação ainda não está disponível (estado: {job['status']}).")
+
+    return _ranged_file_response(artifact_path, range_header, job["filename"])
+
+@router.post("/{dataset_id}/import-jobs", response_model=ImportJob, status_code=status.HTTP_202_ACCEPTED)
+def submit_import_job(
     dataset_id: int,
+    import_format: str = Form(...), # 'yolo', 'labelme', 'coco' ou 'cvat'
+    file: UploadFile = File(...),
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user),
 ):
+    """
+    Importa em segundo plano as anotações de um .zip nos formatos YOLO, LabelMe,
+    COCO ou CVAT. Os ficheiros de anotações são associados às imagens do dataset
+    pelo nome; as imagens encontradas ficam só com as anotações importadas.
+    """
     dataset = dataset_service.get_dataset(db, dataset_id=dataset_id)
     if not dataset:
         raise HTTPException(status_code=404, detail="Dataset não encontrado")
     if dataset.owner_id != current_user.id:
         raise HTTPException(status_code=403, detail="Não tem permissão para acessar este dataset")
 
-    zip_bytes = dataset_service.export_annotations_cvat(db, db_dataset=dataset)
-    
-    filename = f"{dataset.name.replace(' ', '_')}_cvat.zip"
-    
-    return StreamingResponse(
-        io.BytesIO(zip_bytes),
-        media_type="application/x-zip-compressed",
-        headers={"Content-Disposition": f"attachment; filename={filename}"}
-    )
\ No newline at end of file
+    return import_job_service.submit_import_job(dataset, import_format, file)
+
+@router.get("/{dataset_id}/import-jobs/{job_id}", response_model=ImportJob)
+def read_import_job(
+    dataset_id: int,
+    job_id: str,
+    current_user: User = Depends(get_current_user),
+):
+    """
+    Estado de uma importação, com as contagens e o débito (anotações/s) até ao momento.
+    """
+    job = import_job_service.get_import_job(job_id, owner_id=current_user.id)
+    if job["dataset_id"] != dataset_id:
+        raise HTTPException(status_code=404, detail="Tarefa de importação não encontrada.")
+    return job
@@ -0,0 +1,32 @@
+from fastapi import APIRouter, Depends, Response, status
+from sqlalchemy import text
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import Session
+
+from app.api.dependencies import get_current_active_superuser
+from app.core.database import get_db, get_pool_status
+from app.models.user import User
+
+router = APIRouter()
+
+@router.get("/db")
+def read_db_health(response: Response, db: Session = Depends(get_db)):
+    """
+    Verifica a ligação à BD. Rota pública (load balancers, sondas): só diz se a
+    BD está acessível; as estatísticas do pool ficam em /health/db/pool.
+    """
+    try:
+        db.execute(text("SELECT 1"))
+    except SQLAlchemyError as e:
+        print(f"Verificação de saúde da BD falhou: {e}")
+        response.status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+        return {"status": "down"}
+    return {"status": "ok"}
+
+@router.get("/db/pool")
+def read_db_pool_status(current_user: User = Depends(get_current_active_superuser)):
+    """
+    Estado do pool de ligações (ligações em uso, overflow, esperas e timeouts de
+    checkout). Só para superutilizadores: expõe detalhes da infraestrutura.
+    """
+    return get_pool_status()
@@ -0,0 +1,56 @@
+import os
+from typing import Literal, Optional
+from fastapi import APIRouter, Depends, HTTPException, Header, Query, Response, status
+from fastapi.responses import FileResponse
+from sqlalchemy.orm import Session
+
+from app.core import http_cache
+from app.core.database import get_db
+from app.models.dataset import Image as ModelImage
+from app.services import dataset_service, image_derivative_service
+
+router = APIRouter()
+
+# As variantes são imutáveis para um mesmo ID de imagem: o browser pode guardá-las,
+# mas não caches partilhadas (a imagem é do usuário, o token é que dá acesso)
+CACHE_CONTROL = "private, max-age=604800"
+
+@router.get("/{image_id}/{variant}", response_class=FileResponse)
+def read_image_derivative(
+    image_id: int,
+    variant: Literal["thumbnail", "preview"],
+    token: str = Query(...),
+    db: Session = Depends(get_db),
+    if_none_match: Optional[str] = Header(None),
+):
+    """
+    Serve a miniatura ou a pré-visualização de uma imagem, gerando-a se estiver em falta.
+    Para poder ser usada em <img> não pede o cabeçalho Authorization: o acesso é dado
+    pelo token assinado do URL (thumbnail_url/preview_url nas respostas das imagens).
+    """
+    if not image_derivative_service.is_valid_derivative_token(image_id, variant, token):
+        raise HTTPException(status_code=404, detail="Imagem não encontrada")
+
+    etag = f'"{image_id}-{variant}-{image_derivative_service.DERIVATIVE_SIZES[variant]}"'
+    headers = {"ETag": etag, "Cache-Control": CACHE_CONTROL}
+    if http_cache.etag_matches(if_none_match, etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+    db_image = db.query(ModelImage).filter(ModelImage.id == image_id).first()
+    if not db_image:
+        raise HTTPException(status_code=404, detail="Imagem não encontrada")
+
+    derivative_path = image_derivative_service.get_or_create_derivative(
+        db_image.dataset_id,
+        db_image.id,
+        os.path.join(dataset_service.UPLOAD_DIRECTORY, db_image.file_path),
+        variant,
+    )
+    if derivative_path is None:
+        raise HTTPException(status_code=404, detail="Ficheiro da imagem não encontrado")
+
+    return FileResponse(
+        derivative_path,
+        media_type=image_derivative_service.DERIVATIVE_MEDIA_TYPE,
+        headers=headers,
+    )
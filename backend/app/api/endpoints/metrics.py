@@ -0,0 +1,12 @@
+from fastapi import APIRouter, Response
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
+
+router = APIRouter()
+
+@router.get("/metrics", include_in_schema=False)
+def read_metrics():
+    """
+    Métricas no formato de texto do Prometheus (latência por rota, inferência,
+    carregamento de modelos, exportações e filas em segundo plano).
+    """
+    return Response(content=generate_latest(), media_type=CONTENT_TYPE_LATEST)
@@ -1,22 +1,29 @@
-from fastapi import APIRouter, Depends
-from sqlalchemy.orm import Session
-from typing import List
+from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Optional
 from pydantic import BaseModel
 
-from app.core.database import get_db
+from app.core.database import get_async_db
 
 from app.api import dependencies as deps
 
 from app.models.user import User
-from app.services import custom_model_service 
+from app.services import custom_model_service, model_metadata_service
 
 class ModelOptionSchema(BaseModel):
     id: str | int # O ID pode ser um nome (ex: 'yolov8n') ou um número (ex: 1)
     name: str
+    task: Optional[str] = None # 'detect', 'segment', ... (None enquanto os metadados não forem extraídos)
     
     class Config:
         from_attributes = True
 
+class ModelClassesSchema(BaseModel):
+    id: str | int
+    task: Optional[str] = None
+    metadata_status: str # 'pending', 'ready' ou 'failed'
+    classes: List[str] # o índice de cada nome é o ID da classe no modelo
+
 router = APIRouter()
 
 @router.get(
@@ -24,8 +31,8 @@ router = APIRouter()
     response_model=List[ModelOptionSchema],
     summary="Listar todos os modelos disponíveis (Padrão e Customizados)"
 )
-def get_available_models(
-    db: Session = Depends(get_db),
+async def get_available_models(
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(deps.get_current_user)
 ):
     """
@@ -34,20 +41,55 @@ def get_available_models(
     """
     
     # 1. Modelos Padrão (Hardcoded)
+    standard = model_metadata_service.STANDARD_MODEL_METADATA
     standard_models = [
-        ModelOptionSchema(id="yolov8n_det", name="YOLOv8n (Detecção)"),
-        ModelOptionSchema(id="yolov8n_seg", name="YOLOv8n (Segmentação)"),
-        ModelOptionSchema(id="sam", name="Segment Anything (SAM)"),
+        ModelOptionSchema(id="yolov8n_det", name="YOLOv8n (Detecção)", task=standard["yolov8n_det"]["task"]),
+        ModelOptionSchema(id="yolov8n_seg", name="YOLOv8n (Segmentação)", task=standard["yolov8n_seg"]["task"]),
+        ModelOptionSchema(id="sam", name="Segment Anything (SAM)", task=standard["sam"]["task"]),
     ]
     
-    # 2. Modelos Customizados (Buscados do banco de dados)
-    custom_models = custom_model_service.get_models_by_owner(db, owner_id=current_user.id)
+    # 2. Modelos Customizados (Buscados do banco de dados, sem carregar os pesos)
+    custom_models = await custom_model_service.get_models_by_owner_async(db, owner_id=current_user.id)
     
     # 3. Converter modelos customizados para o formato ModelOptionSchema
     custom_models_options = [
-        ModelOptionSchema(id=model.id, name=f"{model.name} (Customizado)")
+        ModelOptionSchema(id=model.id, name=f"{model.name} (Customizado)", task=model.task)
         for model in custom_models
     ]
     
     # 4. Combinar as listas e retornar
-    return standard_models + custom_models_options
\ No newline at end of file
+    return standard_models + custom_models_options
+
+@router.get(
+    "/{model_id}/classes",
+    response_model=ModelClassesSchema,
+    summary="Listar as classes de um modelo (Padrão ou Customizado)"
+)
+async def get_model_classes(
+    model_id: str,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: User = Depends(deps.get_current_user)
+):
+    """
+    Devolve as classes de um modelo, para o filtro de classes da interface.
+    Os modelos padrão usam as classes do COCO; as dos customizados foram
+    guardadas na BD após o upload, por isso nenhum modelo é carregado.
+    """
+    if model_id in model_metadata_service.STANDARD_MODEL_METADATA:
+        return ModelClassesSchema(
+            id=model_id,
+            task=model_metadata_service.STANDARD_MODEL_METADATA[model_id]["task"],
+            metadata_status=model_metadata_service.METADATA_STATUS_READY,
+            classes=model_metadata_service.class_names_to_list(model_metadata_service.COCO_CLASS_NAMES),
+        )
+    if not model_id.isdigit():
+        raise HTTPException(status_code=404, detail="Modelo não encontrado ou acesso negado.")
+
+    custom_model = await custom_model_service.get_model_async(db, model_id=int(model_id), owner_id=current_user.id)
+    return ModelClassesSchema(
+        id=custom_model.id,
+        task=custom_model.task,
+        metadata_status=custom_model.metadata_status,
+        classes=custom_model.class_names or [],
+    )
+
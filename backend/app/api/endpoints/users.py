@@ -1,6 +1,7 @@
 from typing import List
 from fastapi import APIRouter, Depends, HTTPException, status
 from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
 
 from app.schemas.user import User, UserCreate
 from app.services import user_service
@@ -11,17 +12,17 @@ from app.schemas.user import User, UserCreate, UserUpdate
 router = APIRouter()
 
 @router.post("/", response_model=User, status_code=status.HTTP_201_CREATED)
-def create_new_user(user: UserCreate, db: Session = Depends(get_db)):
+async def create_new_user(user: UserCreate, db: Session = Depends(get_db)):
     """
     Endpoint para registrar um novo usuário.
     """
-    db_user = user_service.get_user_by_email(db, email=user.email)
+    db_user = await run_in_threadpool(user_service.get_user_by_email, db, user.email)
     if db_user:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Email já registrado.",
         )
-    return user_service.create_user(db=db, user=user)
+    return await user_service.create_user_async(db=db, user=user)
 
 @router.get("/me", response_model=User)
 def read_users_me(current_user: User = Depends(get_current_user)):
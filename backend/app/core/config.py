@@ -11,6 +11,83 @@ class Settings(BaseSettings):
     ALGORITHM: str
     ACCESS_TOKEN_EXPIRE_MINUTES: int
 
+    # Pool de ligações à BD (ignorado no SQLite)
+    DB_POOL_SIZE: int = 5
+    DB_MAX_OVERFLOW: int = 10
+    DB_POOL_TIMEOUT: int = 30 # segundos à espera de uma ligação livre
+    DB_POOL_PRE_PING: bool = True
+    DB_POOL_RECYCLE: int = 1800
+
+    # Cache em memória dos utilizadores autenticados (por processo)
+    USER_CACHE_TTL_SECONDS: int = 60
+    USER_CACHE_MAX_SIZE: int = 1024
+
+    # Custo do Argon2 (memory_cost em KiB) e pool dedicado ao hashing de senhas
+    ARGON2_TIME_COST: int = 3
+    ARGON2_MEMORY_COST: int = 65536
+    ARGON2_PARALLELISM: int = 4
+    PASSWORD_HASH_WORKERS: int = 2
+    PASSWORD_HASH_MAX_PENDING: int = 32 # acima disto, o login responde 503
+
+    # Contagens por classe materializadas (False = calculadas sempre com GROUP BY)
+    DATASET_STATS_MATERIALIZED: bool = True
+
+    # No arranque, o janitor apaga os datasets que ficaram em 'deleting' (ex.: reinício a meio de uma remoção)
+    DATASET_JANITOR_ON_STARTUP: bool = True
+
+    # Motor de inferência: 'ultralytics' (modelos reais) ou 'stub' (caixas fixas, sem pesos,
+    # para testes de carga), com INFERENCE_STUB_LATENCY_MS de latência simulada por imagem
+    INFERENCE_BACKEND: str = "ultralytics"
+    INFERENCE_STUB_LATENCY_MS: float = 50
+
+    # Inferência em mosaico: mosaicos por chamada ao modelo e IoU do NMS entre mosaicos
+    TILE_BATCH_SIZE: int = 8
+    TILE_NMS_IOU: float = 0.5
+    # A imagem é descodificada inteira: acima deste número de píxeis é recusada
+    # (250 MP são ~750 MB em BGR; o OpenCV recusa sozinho acima de CV_IO_MAX_IMAGE_PIXELS)
+    TILE_MAX_IMAGE_PIXELS: int = 250_000_000
+
+    # Ingestão de vídeo: frames amostrados por segundo, distância máxima (bits de dHash)
+    # para um frame ser considerado duplicado do anterior, e limite de frames por vídeo
+    VIDEO_SAMPLE_FPS: float = 0.5
+    VIDEO_DEDUP_THRESHOLD: int = 6
+    VIDEO_JPEG_QUALITY: int = 90
+    VIDEO_MAX_FRAMES: int = 5000
+
+    # Tracing OpenTelemetry: 'none', 'console' ou 'file' (um span JSON por linha em TRACING_FILE)
+    TRACING_EXPORTER: str = "none"
+    TRACING_FILE: str = "traces.jsonl"
+
+    # Exportações assíncronas
+    EXPORT_JOB_WORKERS: int = 2
+    EXPORT_ARTIFACT_TTL_SECONDS: int = 3600
+
+    # Importação de anotações (YOLO/COCO/LabelMe/CVAT): workers, anotações por
+    # INSERT/commit e quanto tempo o estado de uma importação terminada fica disponível
+    IMPORT_JOB_WORKERS: int = 1
+    IMPORT_BATCH_SIZE: int = 5000
+    IMPORT_JOB_TTL_SECONDS: int = 3600
+
+    # Upload de modelos em partes (retomável): tamanho máximo de cada parte (abaixo do
+    # client_max_body_size do nginx), tamanho máximo do .pt e validade de um upload parado
+    MODEL_UPLOAD_CHUNK_SIZE: int = 8 * 1024 * 1024
+    MODEL_UPLOAD_MAX_SIZE: int = 4 * 1024 * 1024 * 1024
+    MODEL_UPLOAD_TTL_SECONDS: int = 24 * 3600
+
+    # Quantização INT8 (ONNX Runtime) dos modelos customizados: imagens do usuário usadas
+    # na calibração e, separadas destas, na comparação de latência/concordância com o FP32
+    MODEL_QUANTIZATION_CALIBRATION_IMAGES: int = 32
+    MODEL_QUANTIZATION_EVAL_IMAGES: int = 16
+    # Um pedido 'pending' há mais tempo do que isto é considerado perdido e pode ser refeito
+    MODEL_QUANTIZATION_TIMEOUT_SECONDS: int = 2 * 3600
+
+    # Miniaturas e pré-visualizações das imagens (lado maior, em píxeis)
+    THUMBNAIL_SIZE: int = 256
+    PREVIEW_SIZE: int = 1024
+    DERIVATIVE_FORMAT: str = "webp" # 'webp' ou 'jpeg'
+    DERIVATIVE_QUALITY: int = 80
+    DERIVATIVE_WORKERS: int = 2
+
     class Config:
         # Aponta para o .env na raiz do backend
         env_file = ".env" 
@@ -1,16 +1,144 @@
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
+import time
+import threading
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import URL, make_url
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.orm import sessionmaker, scoped_session
+from sqlalchemy.pool import QueuePool
 from app.core.base import Base
 from app.core.config import settings 
 
+# --- Estatísticas do pool de ligações ---
+_pool_stats = {
+    "checkouts": 0,
+    "max_checked_out": 0,
+    "waits": 0,
+    "wait_seconds_total": 0.0,
+    "wait_seconds_max": 0.0,
+    "timeouts": 0,
+}
+_pool_stats_lock = threading.Lock()
+_checked_out = 0
+
+class InstrumentedQueuePool(QueuePool):
+    """QueuePool que mede quanto tempo cada checkout espera por uma ligação livre."""
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        except PoolTimeoutError:
+            with _pool_stats_lock:
+                _pool_stats["timeouts"] += 1
+            raise
+        finally:
+            waited = time.perf_counter() - start
+            # Só contam como espera os checkouts que não foram imediatos
+            if waited > 0.001:
+                with _pool_stats_lock:
+                    _pool_stats["waits"] += 1
+                    _pool_stats["wait_seconds_total"] += waited
+                    _pool_stats["wait_seconds_max"] = max(_pool_stats["wait_seconds_max"], waited)
+
+def _get_engine_options() -> dict:
+    if settings.DATABASE_URL.startswith("sqlite"):
+        # O SQLite não usa um pool de ligações de rede: mantém os valores por omissão
+        return {}
+    return {
+        "poolclass": InstrumentedQueuePool,
+        "pool_size": settings.DB_POOL_SIZE,
+        "max_overflow": settings.DB_MAX_OVERFLOW,
+        "pool_timeout": settings.DB_POOL_TIMEOUT,
+        "pool_pre_ping": settings.DB_POOL_PRE_PING,
+        "pool_recycle": settings.DB_POOL_RECYCLE,
+    }
+
 # Usar a URL do objeto settings
-engine = create_engine(settings.DATABASE_URL, pool_recycle=1800)
+engine = create_engine(settings.DATABASE_URL, **_get_engine_options())
+
+@event.listens_for(engine, "checkout")
+def _on_checkout(dbapi_connection, connection_record, connection_proxy):
+    global _checked_out
+    with _pool_stats_lock:
+        _checked_out += 1
+        _pool_stats["checkouts"] += 1
+        _pool_stats["max_checked_out"] = max(_pool_stats["max_checked_out"], _checked_out)
+
+@event.listens_for(engine, "checkin")
+def _on_checkin(dbapi_connection, connection_record):
+    global _checked_out
+    with _pool_stats_lock:
+        _checked_out = max(_checked_out - 1, 0)
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# Sessão das tarefas em segundo plano: uma por thread, partilhada por todas as
+# funções chamadas pela tarefa. Quem abre a tarefa deve chamar BackgroundSession.remove().
+BackgroundSession = scoped_session(SessionLocal)
+
+# --- Acesso assíncrono (endpoints de leitura) ---
+# Os endpoints de leitura mais frequentes (listagem/detalhe dos datasets, listagem
+# dos modelos, autenticação) usam uma AsyncSession e não ocupam a threadpool
+# enquanto esperam pela BD. As tarefas em segundo plano continuam no motor síncrono.
+# Atenção: cada motor tem o seu pool, por isso o nº máximo de ligações por
+# processo passa a ser 2 x (DB_POOL_SIZE + DB_MAX_OVERFLOW).
+
+# Driver assíncrono de cada dialeto do DATABASE_URL
+_ASYNC_DRIVERS = {"postgresql": "asyncpg", "sqlite": "aiosqlite"}
+
+def get_async_database_url(database_url: str) -> URL:
+    """Converte o DATABASE_URL (síncrono) no URL equivalente com o driver assíncrono."""
+    url = make_url(database_url)
+    backend = url.get_backend_name()
+    if backend not in _ASYNC_DRIVERS:
+        raise ValueError(f"Sem driver assíncrono para a base de dados '{backend}'.")
+    url = url.set(drivername=f"{backend}+{_ASYNC_DRIVERS[backend]}")
+
+    if backend == "postgresql":
+        # O asyncpg não conhece os parâmetros do libpq (ex.: '?sslmode=require&channel_binding=require')
+        query = dict(url.query)
+        sslmode = query.pop("sslmode", None)
+        query.pop("channel_binding", None)
+        if sslmode:
+            query["ssl"] = sslmode
+        url = url.set(query=query)
+    return url
+
+def _get_async_engine_options() -> dict:
+    options = _get_engine_options()
+    # O pool do motor assíncrono é o AsyncAdaptedQueuePool (o instrumentado é só síncrono)
+    options.pop("poolclass", None)
+    return options
+
+async_engine = create_async_engine(get_async_database_url(settings.DATABASE_URL), **_get_async_engine_options())
+
+# expire_on_commit=False: os objetos devolvidos continuam legíveis depois do commit/fecho,
+# sem novos carregamentos implícitos (que numa AsyncSession não são permitidos)
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
+def get_pool_status() -> dict:
+    """Estado atual do pool de ligações e estatísticas acumuladas de checkout/espera."""
+    pool = engine.pool
+    with _pool_stats_lock:
+        status = dict(_pool_stats, checked_out=_checked_out)
+    status["pool_class"] = type(pool).__name__
+    if isinstance(pool, QueuePool):
+        status.update({
+            "pool_size": pool.size(),
+            "checked_in": pool.checkedin(),
+            "overflow": pool.overflow(),
+            "max_overflow": settings.DB_MAX_OVERFLOW,
+        })
+    return status
+
 def get_db():
     db = SessionLocal()
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
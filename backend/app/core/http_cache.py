@@ -0,0 +1,13 @@
+from typing import Optional
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """
+    Avalia o If-None-Match (RFC 9110, 13.1.2): "*" ou uma lista de ETags separados
+    por vírgulas, comparados de forma fraca (o prefixo W/ é ignorado).
+    """
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    weak_etag = etag.removeprefix("W/")
+    return any(candidate.strip().removeprefix("W/") == weak_etag for candidate in if_none_match.split(","))
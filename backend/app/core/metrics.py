@@ -0,0 +1,112 @@
+import time
+from prometheus_client import Counter, Gauge, Histogram
+
+# --- Métricas Prometheus (expostas em GET /metrics) ---
+# Os rótulos têm sempre cardinalidade limitada: rotas pelo template
+# ('/datasets/{dataset_id}'), nunca pelo caminho concreto.
+
+REQUEST_LATENCY = Histogram(
+    "adaptlabelx_http_request_duration_seconds",
+    "Latência dos pedidos HTTP por rota",
+    ["method", "route", "status"],
+)
+
+MODEL_LOAD_SECONDS = Histogram(
+    "adaptlabelx_model_load_seconds",
+    "Tempo a carregar um modelo do disco",
+    ["model"],
+    buckets=(0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60),
+)
+
+MODEL_CACHE_REQUESTS = Counter(
+    "adaptlabelx_model_cache_requests_total",
+    "Pedidos ao cache de modelos customizados (result='hit' ou 'miss')",
+    ["result"],
+)
+
+INFERENCE_SECONDS = Histogram(
+    "adaptlabelx_inference_seconds",
+    "Latência da inferência por imagem",
+    ["model_id", "mode"],
+    buckets=(0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30),
+)
+
+ANNOTATION_WRITE_SECONDS = Histogram(
+    "adaptlabelx_annotation_write_seconds",
+    "Tempo a gravar um lote de anotações (DELETE + INSERT + commit)",
+)
+
+EXPORT_SECONDS = Histogram(
+    "adaptlabelx_export_build_seconds",
+    "Tempo a montar o .zip de uma exportação (só quando não vem do cache)",
+    ["format"],
+    buckets=(0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120),
+)
+
+EXPORT_BYTES = Histogram(
+    "adaptlabelx_export_size_bytes",
+    "Tamanho do .zip de uma exportação",
+    ["format"],
+    buckets=(1e4, 1e5, 1e6, 1e7, 1e8, 1e9, 1e10),
+)
+
+IMPORT_ANNOTATIONS = Counter(
+    "adaptlabelx_import_annotations_total",
+    "Anotações gravadas pelas importações de arquivos",
+    ["format"],
+)
+
+BACKGROUND_QUEUE_DEPTH = Gauge(
+    "adaptlabelx_background_queue_depth",
+    "Tarefas em segundo plano em espera ou a correr, por fila",
+    ["queue"],
+)
+
+def get_route_template(scope) -> str:
+    """
+    Template completo da rota que tratou o pedido ('/datasets/{dataset_id}').
+    O router preenche scope["route"], mas nas rotas de um APIRouter incluído
+    com prefixo o path da rota não traz o prefixo: recupera-se o prefixo
+    procurando a parte do caminho concreto que a expressão da rota reconhece.
+    """
+    route = scope.get("route")
+    path_regex = getattr(route, "path_regex", None)
+    if path_regex is None:
+        return "unmatched"
+    path = scope["path"]
+    for i, char in enumerate(path):
+        if char == "/" and path_regex.match(path[i:]):
+            return path[:i] + route.path
+    return route.path
+
+class MetricsMiddleware:
+    """
+    Middleware ASGI (sem o custo do BaseHTTPMiddleware) que mede a latência
+    de cada pedido HTTP e a regista pelo template da rota.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        status_code = 500
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            REQUEST_LATENCY.labels(
+                method=scope["method"],
+                route=get_route_template(scope),
+                status=str(status_code),
+            ).observe(time.perf_counter() - start)
@@ -0,0 +1,114 @@
+from contextlib import contextmanager, nullcontext
+from typing import Dict, Optional
+
+from app.core.config import settings
+from app.core.metrics import get_route_template
+
+try:
+    from opentelemetry import context as otel_context, propagate, trace
+    from opentelemetry.sdk.resources import Resource
+    from opentelemetry.sdk.trace import TracerProvider
+    from opentelemetry.sdk.trace.export import BatchSpanProcessor, ConsoleSpanExporter
+except ImportError: # O OpenTelemetry é opcional: sem ele os spans não fazem nada
+    trace = None
+
+# --- Tracing (OpenTelemetry) ---
+# Spans por pedido HTTP e por etapa do pipeline de anotação/exportação,
+# exportados para a consola ou para um ficheiro JSON-lines (TRACING_EXPORTER).
+# O contexto do pedido é passado explicitamente às tarefas em segundo plano
+# (inject_context/use_context), para que fiquem no mesmo trace.
+
+_tracer = None
+
+def setup_tracing():
+    """Configura o TracerProvider e o exportador. Sem efeito se TRACING_EXPORTER='none'."""
+    global _tracer
+    if trace is None or settings.TRACING_EXPORTER == "none" or _tracer is not None:
+        return
+
+    if settings.TRACING_EXPORTER == "file":
+        # Um span por linha, para poder ser filtrado com jq/grep depois do facto
+        exporter = ConsoleSpanExporter(
+            out=open(settings.TRACING_FILE, "a", encoding="utf-8"),
+            formatter=lambda span: span.to_json(indent=None) + "\n",
+        )
+    else:
+        exporter = ConsoleSpanExporter()
+
+    provider = TracerProvider(resource=Resource.create({"service.name": "adaptlabelx-backend"}))
+    provider.add_span_processor(BatchSpanProcessor(exporter))
+    trace.set_tracer_provider(provider)
+    _tracer = trace.get_tracer("adaptlabelx")
+    print(f"Tracing ativo (exportador: {settings.TRACING_EXPORTER}).")
+
+def span(name: str, **attributes):
+    """Context manager que abre um span filho do span atual (no-op sem tracing)."""
+    if _tracer is None:
+        return nullcontext()
+    return _tracer.start_as_current_span(
+        name, attributes={key: value for key, value in attributes.items() if value is not None}
+    )
+
+def set_attributes(**attributes):
+    """Acrescenta atributos ao span atual."""
+    if _tracer is None:
+        return
+    current = trace.get_current_span()
+    for key, value in attributes.items():
+        if value is not None:
+            current.set_attribute(key, value)
+
+def inject_context() -> Optional[Dict[str, str]]:
+    """Serializa o contexto atual (W3C traceparent) para o passar a uma tarefa em segundo plano."""
+    if _tracer is None:
+        return None
+    carrier: Dict[str, str] = {}
+    propagate.inject(carrier)
+    return carrier
+
+@contextmanager
+def use_context(carrier: Optional[Dict[str, str]]):
+    """Torna atual, na thread da tarefa, o contexto recebido de inject_context()."""
+    if _tracer is None or not carrier:
+        yield
+        return
+    token = otel_context.attach(propagate.extract(carrier))
+    try:
+        yield
+    finally:
+        otel_context.detach(token)
+
+class TracingMiddleware:
+    """
+    Middleware ASGI que abre um span por pedido HTTP. O nome final
+    ('GET /datasets/{dataset_id}') só é conhecido depois do routing.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or _tracer is None:
+            await self.app(scope, receive, send)
+            return
+
+        status_code = 500
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        with _tracer.start_as_current_span(
+            f"{scope['method']} {scope['path']}",
+            kind=trace.SpanKind.SERVER,
+            attributes={"http.request.method": scope["method"], "url.path": scope["path"]},
+        ) as request_span:
+            try:
+                await self.app(scope, receive, send_wrapper)
+            finally:
+                route = get_route_template(scope)
+                request_span.update_name(f"{scope['method']} {route}")
+                request_span.set_attribute("http.route", route)
+                request_span.set_attribute("http.response.status_code", status_code)
@@ -1,9 +1,13 @@
-from sqlalchemy import Column, Integer, String, Float, ForeignKey, JSON
+from sqlalchemy import Column, Integer, String, Float, ForeignKey, JSON, Index
 from sqlalchemy.orm import relationship
 from app.core.base import Base
 
 class Annotation(Base):
     __tablename__ = "annotations"
+    __table_args__ = (
+        # Exportações e estatísticas filtram por classe e juntam com a imagem
+        Index("ix_annotations_class_label_image_id", "class_label", "image_id"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     
@@ -19,6 +23,9 @@ class Annotation(Base):
     
     # Confiança do modelo na detecção
     confidence = Column(Float) 
+
+    # Assinatura (modelo + filtro de classes) que gerou esta anotação
+    provenance = Column(String, nullable=True)
     
-    image_id = Column(Integer, ForeignKey("images.id"))
+    image_id = Column(Integer, ForeignKey("images.id", ondelete="CASCADE"), index=True)
     image = relationship("Image", back_populates="annotations")
\ No newline at end of file
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, ForeignKey
+from sqlalchemy import Column, Integer, BigInteger, String, ForeignKey, JSON, DateTime
 from sqlalchemy.orm import relationship
 from app.core.base import Base
 
@@ -9,6 +9,25 @@ class CustomModel(Base):
     name = Column(String, index=True, nullable=False)
     model_type = Column(String, nullable=False) # 'detection' ou 'segmentation'
     file_path = Column(String, nullable=False, unique=True) # Caminho no servidor
+
+    # Metadados lidos uma única vez, após o upload (ver model_metadata_service), para que
+    # listar modelos ou as suas classes nunca obrigue a carregar os pesos
+    metadata_status = Column(String, nullable=False, default="pending", server_default="pending")
+    class_names = Column(JSON, nullable=True) # lista de nomes; o índice é o ID da classe
+    task = Column(String, nullable=True) # tarefa do ultralytics: 'detect', 'segment', ...
+    input_size = Column(Integer, nullable=True) # imgsz do treino
+    parameter_count = Column(BigInteger, nullable=True)
+    file_sha256 = Column(String(64), nullable=True)
+    file_size = Column(BigInteger, nullable=True)
+
+    # Variante INT8 opcional para inferência em CPU (ver model_quantization_service):
+    # 'none', 'pending', 'ready' ou 'failed'; o relatório compara latência e concordância com o FP32
+    quantization_status = Column(String, nullable=False, default="none", server_default="none")
+    quantized_file_path = Column(String, nullable=True)
+    quantization_report = Column(JSON, nullable=True)
+    # Quando a quantização foi pedida: um 'pending' mais antigo que MODEL_QUANTIZATION_TIMEOUT_SECONDS
+    # é de uma tarefa que morreu (ex.: reinício do servidor) e não bloqueia um novo pedido
+    quantization_requested_at = Column(DateTime(timezone=True), nullable=True)
     
-    owner_id = Column(Integer, ForeignKey("users.id"))
+    owner_id = Column(Integer, ForeignKey("users.id"), index=True)
     owner = relationship("User")
\ No newline at end of file
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, ForeignKey, Text
+from sqlalchemy import Column, Integer, String, Float, Boolean, ForeignKey, Text, JSON, false
 from sqlalchemy.orm import relationship
 from sqlalchemy.dialects.postgresql import ARRAY
 
@@ -10,14 +10,39 @@ class Dataset(Base):
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String, index=True)
     description = Column(String)
-    owner_id = Column(Integer, ForeignKey("users.id"))
+    owner_id = Column(Integer, ForeignKey("users.id"), index=True)
 
     owner = relationship("User", back_populates="datasets")
-    images = relationship("Image", back_populates="dataset", cascade="all, delete-orphan")
+    # passive_deletes: as linhas filhas são apagadas pelo ON DELETE CASCADE da BD,
+    # sem as carregar para memória
+    images = relationship("Image", back_populates="dataset", cascade="all, delete-orphan", passive_deletes=True)
     
     model_id = Column(String, nullable=True) 
 
-    classes_to_annotate = Column(ARRAY(String), nullable=True)
+    # ARRAY só existe no Postgres; no SQLite (testes) guardamos a lista como JSON
+    classes_to_annotate = Column(ARRAY(String).with_variant(JSON(), "sqlite"), nullable=True)
+
+    # Incrementado sempre que imagens ou anotações do dataset mudam (usado como ETag das exportações)
+    annotation_revision = Column(Integer, nullable=False, default=0, server_default="0")
+
+    # 'full' (imagem inteira) ou 'tiled' (mosaicos sobrepostos, para imagens muito grandes)
+    inference_mode = Column(String, nullable=False, default="full", server_default="full")
+    tile_size = Column(Integer, nullable=False, default=640, server_default="640")
+    tile_overlap = Column(Float, nullable=False, default=0.2, server_default="0.2")
+
+    # 'fp32' ou 'int8' (variante quantizada do modelo customizado, se estiver pronta)
+    model_precision = Column(String, nullable=False, default="fp32", server_default="fp32")
+
+    # Parâmetros da chamada ao modelo: confiança mínima, IoU do NMS, máximo de deteções por
+    # imagem, tamanho de entrada (NULL = o do modelo) e FP16 (só tem efeito em GPU)
+    confidence_threshold = Column(Float, nullable=False, default=0.10, server_default="0.1")
+    iou_threshold = Column(Float, nullable=False, default=0.7, server_default="0.7")
+    max_detections = Column(Integer, nullable=False, default=300, server_default="300")
+    input_size = Column(Integer, nullable=True)
+    half_precision = Column(Boolean, nullable=False, default=False, server_default=false())
+
+    # 'active' ou 'deleting' (a remoção das linhas e ficheiros corre em segundo plano)
+    status = Column(String, nullable=False, default="active", server_default="active")
 
 
 class Image(Base):
@@ -26,7 +51,30 @@ class Image(Base):
     id = Column(Integer, primary_key=True, index=True)
     file_name = Column(String)
     file_path = Column(String, unique=True)
-    dataset_id = Column(Integer, ForeignKey("datasets.id"))
+    dataset_id = Column(Integer, ForeignKey("datasets.id", ondelete="CASCADE"), index=True)
+
+    # Assinatura (modelo + filtro de classes) que produziu as anotações atuais.
+    # NULL = imagem ainda não passou pelo anotador automático.
+    annotation_provenance = Column(String, nullable=True)
+
+    # Incrementado sempre que as anotações desta imagem mudam (chave dos fragmentos de exportação)
+    annotation_revision = Column(Integer, nullable=False, default=0, server_default="0")
 
     dataset = relationship("Dataset", back_populates="images")
-    annotations = relationship("Annotation", back_populates="image", cascade="all, delete-orphan")
\ No newline at end of file
+    annotations = relationship("Annotation", back_populates="image", cascade="all, delete-orphan", passive_deletes=True)
+
+
+class DatasetClassCount(Base):
+    """
+    Contagens por classe materializadas (atualizadas a cada escrita de anotações),
+    para que as estatísticas do dataset não tenham de percorrer todas as anotações.
+    """
+    __tablename__ = "dataset_class_counts"
+
+    dataset_id = Column(Integer, ForeignKey("datasets.id", ondelete="CASCADE"), primary_key=True)
+    class_label = Column(String, primary_key=True)
+    annotation_count = Column(Integer, nullable=False, default=0)
+    # Anotações com confiança e soma das confianças (a média é confidence_sum / confidence_count;
+    # as anotações sem confiança, ex. manuais ou importadas, não entram nela)
+    confidence_count = Column(Integer, nullable=False, default=0, server_default="0")
+    confidence_sum = Column(Float, nullable=False, default=0.0)
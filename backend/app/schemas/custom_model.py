@@ -1,5 +1,5 @@
 from pydantic import BaseModel, ConfigDict
-from typing import Optional
+from typing import Any, Dict, List, Optional
 
 class CustomModelBase(BaseModel):
     name: str
@@ -13,4 +13,21 @@ class CustomModel(CustomModelBase):
     file_path: str
     owner_id: int
 
-    model_config = ConfigDict(from_attributes=True)
\ No newline at end of file
+    # Metadados extraídos após o upload ('pending' até a extração terminar)
+    metadata_status: str = "pending"
+    class_names: Optional[List[str]] = None
+    task: Optional[str] = None
+    input_size: Optional[int] = None
+    parameter_count: Optional[int] = None
+    file_sha256: Optional[str] = None
+    file_size: Optional[int] = None
+
+    # Variante INT8 ('none', 'pending', 'ready' ou 'failed') e o seu relatório de latência/concordância
+    quantization_status: str = "none"
+    quantization_report: Optional[Dict[str, Any]] = None
+
+    model_config = ConfigDict(from_attributes=True)
+
+class ModelQuantizationRequest(BaseModel):
+    # Dataset de onde vêm as imagens de calibração e de avaliação (por omissão, todos os do usuário)
+    dataset_id: Optional[int] = None
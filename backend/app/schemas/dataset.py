@@ -1,6 +1,7 @@
-from pydantic import BaseModel, ConfigDict
-from typing import List, Optional, Any
+from pydantic import BaseModel, ConfigDict, Field, computed_field
+from typing import List, Literal, Optional, Any
 from .annotation import Annotation
+from app.services import image_derivative_service
 
 # --- Schemas para Imagem ---
 class ImageBase(BaseModel):
@@ -16,6 +17,17 @@ class Image(ImageBase):
 
     model_config = ConfigDict(from_attributes=True)
 
+    # URLs assinados das miniaturas (a rota /images não usa o cabeçalho Authorization)
+    @computed_field
+    @property
+    def thumbnail_url(self) -> str:
+        return image_derivative_service.get_derivative_url(self.id, "thumbnail")
+
+    @computed_field
+    @property
+    def preview_url(self) -> str:
+        return image_derivative_service.get_derivative_url(self.id, "preview")
+
 
 # --- Schemas para Dataset ---
 class DatasetBase(BaseModel):
@@ -25,10 +37,37 @@ class DatasetBase(BaseModel):
 class DatasetCreate(DatasetBase):
     model_id: Optional[str] = None 
     classes_to_annotate: Optional[List[str]] = None
+    # Inferência na imagem inteira ou em mosaicos (tile_size em píxeis, tile_overlap em fração)
+    inference_mode: Literal["full", "tiled"] = "full"
+    tile_size: int = Field(640, ge=128, le=4096)
+    tile_overlap: float = Field(0.2, ge=0.0, lt=0.9)
+    # 'int8' usa a variante quantizada do modelo customizado (se existir); os padrão correm sempre em FP32
+    model_precision: Literal["fp32", "int8"] = "fp32"
+    # Parâmetros da inferência: deteções abaixo da confiança (ou além de max_detections)
+    # são descartadas antes de qualquer conversão para anotações
+    confidence_threshold: float = Field(0.10, ge=0.0, le=1.0)
+    iou_threshold: float = Field(0.7, gt=0.0, le=1.0)
+    max_detections: int = Field(300, ge=1, le=10000)
+    input_size: Optional[int] = Field(None, ge=32, le=4096, multiple_of=32) # None = o do modelo
+    half_precision: bool = False
 
 class DatasetUpdate(DatasetBase):
     pass
 
+class DatasetReannotate(BaseModel):
+    # Campos omitidos mantêm a configuração atual do dataset
+    model_id: Optional[str] = None
+    classes_to_annotate: Optional[List[str]] = None
+    inference_mode: Optional[Literal["full", "tiled"]] = None
+    tile_size: Optional[int] = Field(None, ge=128, le=4096)
+    tile_overlap: Optional[float] = Field(None, ge=0.0, lt=0.9)
+    model_precision: Optional[Literal["fp32", "int8"]] = None
+    confidence_threshold: Optional[float] = Field(None, ge=0.0, le=1.0)
+    iou_threshold: Optional[float] = Field(None, gt=0.0, le=1.0)
+    max_detections: Optional[int] = Field(None, ge=1, le=10000)
+    input_size: Optional[int] = Field(None, ge=32, le=4096, multiple_of=32) # null volta ao do modelo
+    half_precision: Optional[bool] = None
+
 class Dataset(DatasetBase):
     id: int
     owner_id: int
@@ -36,5 +75,17 @@ class Dataset(DatasetBase):
     
     # Adicionar o model_id à resposta (para que o frontend saiba qual modelo foi salvo)
     model_id: Optional[str] = None 
+    inference_mode: str = "full"
+    tile_size: int = 640
+    tile_overlap: float = 0.2
+    model_precision: str = "fp32"
+    confidence_threshold: float = 0.10
+    iou_threshold: float = 0.7
+    max_detections: int = 300
+    input_size: Optional[int] = None
+    half_precision: bool = False
+
+    # 'active' ou 'deleting'
+    status: str = "active"
 
     model_config = ConfigDict(from_attributes=True)
\ No newline at end of file
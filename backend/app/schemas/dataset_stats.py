@@ -0,0 +1,28 @@
+from pydantic import BaseModel
+from typing import List, Optional
+
+class ClassCount(BaseModel):
+    class_label: str
+    count: int
+    mean_confidence: Optional[float] = None
+
+class DensityBucket(BaseModel):
+    annotations: int # nº de anotações por imagem
+    images: int # quantas imagens têm esse nº de anotações
+
+class ConfidenceBucket(BaseModel):
+    lower: float
+    upper: float
+    count: int
+
+class DatasetStats(BaseModel):
+    dataset_id: int
+    image_count: int
+    annotated_image_count: int
+    unannotated_image_count: int
+    annotation_count: int
+    mean_annotations_per_image: float
+    max_annotations_per_image: int
+    class_counts: List[ClassCount]
+    density: List[DensityBucket]
+    confidence_histogram: List[ConfidenceBucket]
@@ -0,0 +1,17 @@
+from pydantic import BaseModel
+from typing import Literal, Optional
+
+class ExportJobCreate(BaseModel):
+    export_format: Literal["yolo", "labelme", "coco", "cvat"]
+    pretty: bool = True # False = JSON/XML sem indentação (COCO e CVAT)
+
+class ExportJob(BaseModel):
+    id: str
+    dataset_id: int
+    export_format: str
+    pretty: bool
+    status: str # 'pending', 'running', 'done' ou 'failed'
+    error: Optional[str] = None
+    size: Optional[int] = None
+    created_at: float
+    finished_at: Optional[float] = None
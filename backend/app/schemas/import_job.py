@@ -0,0 +1,17 @@
+from pydantic import BaseModel
+from typing import Optional
+
+class ImportJob(BaseModel):
+    id: str
+    dataset_id: int
+    import_format: str
+    status: str # 'pending', 'running', 'done' ou 'failed'
+    error: Optional[str] = None
+    images_matched: int # imagens do dataset encontradas no arquivo
+    images_unmatched: int # ficheiros de anotações sem imagem correspondente
+    annotations_imported: int
+    annotations_skipped: int # tipos sem equivalente, classes desconhecidas, geometria inválida
+    elapsed_seconds: float
+    annotations_per_second: float
+    created_at: float
+    finished_at: Optional[float] = None
@@ -0,0 +1,27 @@
+from pydantic import BaseModel, Field
+from typing import Optional
+
+from app.schemas.custom_model import CustomModelCreate
+
+SHA256_PATTERN = r"^[0-9a-fA-F]{64}$"
+
+class ModelUploadCreate(CustomModelCreate):
+    filename: str
+    file_size: int = Field(gt=0) # tamanho total do .pt, em bytes
+    sha256: Optional[str] = Field(None, pattern=SHA256_PATTERN) # hash do ficheiro inteiro, verificado no fim
+
+class ModelUploadComplete(BaseModel):
+    sha256: Optional[str] = Field(None, pattern=SHA256_PATTERN) # se não foi indicado no início
+    quantize: bool = False # produz também a variante INT8 para CPU
+
+class ModelUpload(BaseModel):
+    id: str
+    name: str
+    model_type: str
+    filename: str
+    file_size: int
+    offset: int # bytes já recebidos: a próxima parte começa aqui
+    chunk_size: int # tamanho máximo de cada parte
+    sha256: Optional[str] = None
+    created_at: float
+    expires_at: float # sem partes novas até esta data, o upload é apagado
@@ -0,0 +1,376 @@
+import io
+import os
+import time
+import zipfile
+import posixpath
+from xml.etree.ElementTree import iterparse
+from typing import Callable, Dict, Iterator, List, Optional, Set, Tuple
+
+import yaml
+from PIL import Image as PILImage
+from sqlalchemy import insert
+from sqlalchemy.orm import Session
+
+from app.core import metrics, tracing
+from app.core.config import settings
+from app.models.annotation import Annotation
+from app.models.dataset import Dataset, Image
+from app.services import dataset_service, dataset_stats_service
+
+try:
+    import ijson
+except ImportError: # O ijson é opcional: sem ele o JSON do COCO é carregado inteiro para memória
+    ijson = None
+
+IMPORT_FORMATS = ("yolo", "labelme", "coco", "cvat")
+
+# Cada parser produz pares (image_id, linha da anotação). Uma linha None só
+# indica que a imagem aparece no arquivo (ex.: uma imagem sem anotações).
+ImportRow = Tuple[int, Optional[dict]]
+
+# --- Correspondência entre os ficheiros do arquivo e as imagens do dataset ---
+
+class _ImageMatcher:
+    """
+    Índice nome -> imagem do dataset (pelo nome completo e pelo nome sem extensão).
+    A memória usada depende do nº de imagens, não do nº de anotações.
+    """
+
+    def __init__(self, db: Session, dataset_id: int):
+        self.by_name: Dict[str, Tuple[int, str]] = {}
+        self.by_stem: Dict[str, Tuple[int, str]] = {}
+        self._sizes: Dict[int, Tuple[int, int]] = {}
+        rows = db.query(Image.id, Image.file_name, Image.file_path).filter(
+            Image.dataset_id == dataset_id
+        ).order_by(Image.id)
+        for row in rows:
+            self.by_name.setdefault(row.file_name, (row.id, row.file_path))
+            self.by_stem.setdefault(os.path.splitext(row.file_name)[0], (row.id, row.file_path))
+
+    def match(self, name: Optional[str]) -> Optional[Tuple[int, str]]:
+        """Procura pelo nome base (ignorando pastas, também as do Windows) e depois sem a extensão."""
+        if not name:
+            return None
+        base = posixpath.basename(name.replace("\\", "/"))
+        return self.by_name.get(base) or self.by_stem.get(os.path.splitext(base)[0])
+
+    def image_size(self, image: Tuple[int, str], width, height) -> Tuple[int, int]:
+        """Dimensões declaradas no arquivo ou, se faltarem, lidas do cabeçalho do ficheiro da imagem."""
+        if width and height:
+            return int(width), int(height)
+        image_id, file_path = image
+        if image_id not in self._sizes:
+            try:
+                with PILImage.open(os.path.join(dataset_service.UPLOAD_DIRECTORY, file_path)) as img:
+                    self._sizes[image_id] = img.size
+            except (FileNotFoundError, OSError):
+                self._sizes[image_id] = (0, 0)
+        return self._sizes[image_id]
+
+# --- Geometria (sempre normalizada, como a que o anotador grava) ---
+
+def _box_geometry(x_min: float, y_min: float, x_max: float, y_max: float, width: int, height: int) -> dict:
+    return {
+        "x": (x_min + x_max) / 2 / width,
+        "y": (y_min + y_max) / 2 / height,
+        "width": abs(x_max - x_min) / width,
+        "height": abs(y_max - y_min) / height,
+    }
+
+def _polygon_geometry(points: List[Tuple[float, float]], width: int, height: int) -> list:
+    return [[x / width, y / height] for x, y in points]
+
+def _row(class_label: str, annotation_type: str, geometry, confidence: Optional[float] = None) -> dict:
+    return {
+        "annotation_type": annotation_type,
+        "class_label": class_label,
+        "geometry": geometry,
+        "confidence": confidence,
+    }
+
+def _members(zip_file: zipfile.ZipFile, extension: str) -> List[str]:
+    """Ficheiros do arquivo com a extensão indicada (ignora pastas e lixo do macOS)."""
+    return sorted(
+        name for name in zip_file.namelist()
+        if name.lower().endswith(extension) and not name.endswith("/")
+        and "__MACOSX/" not in name and not posixpath.basename(name).startswith(".")
+    )
+
+# --- YOLO: labels/*.txt (caixas ou polígonos normalizados) + data.yaml ---
+
+def _read_yolo_class_names(zip_file: zipfile.ZipFile) -> Dict[int, str]:
+    for name in _members(zip_file, ".yaml") + _members(zip_file, ".yml"):
+        data = yaml.safe_load(zip_file.read(name)) or {}
+        names = data.get("names") if isinstance(data, dict) else None
+        if isinstance(names, dict):
+            return {int(k): str(v) for k, v in names.items()}
+        if isinstance(names, list):
+            return {i: str(v) for i, v in enumerate(names)}
+    for name in _members(zip_file, "classes.txt") + _members(zip_file, ".names"):
+        lines = zip_file.read(name).decode("utf-8").splitlines()
+        return {i: line.strip() for i, line in enumerate(lines) if line.strip()}
+    return {}
+
+def _parse_yolo(zip_file: zipfile.ZipFile, matcher: _ImageMatcher, report: dict) -> Iterator[ImportRow]:
+    class_names = _read_yolo_class_names(zip_file)
+    label_files = [
+        name for name in _members(zip_file, ".txt")
+        if posixpath.basename(name) not in ("classes.txt", "README.txt")
+    ]
+    for name in label_files:
+        image = matcher.match(posixpath.basename(name))
+        if image is None:
+            report["images_unmatched"] += 1
+            continue
+        yield image[0], None
+
+        with zip_file.open(name) as raw:
+            for line in io.TextIOWrapper(raw, encoding="utf-8"):
+                parts = line.split()
+                if not parts:
+                    continue
+                try:
+                    class_id = int(float(parts[0]))
+                    values = [float(v) for v in parts[1:]]
+                except ValueError:
+                    report["annotations_skipped"] += 1
+                    continue
+                class_label = class_names.get(class_id, str(class_id))
+
+                if len(values) in (4, 5):
+                    # x_centro y_centro largura altura [confiança]
+                    x, y, w, h = values[:4]
+                    geometry = {"x": x, "y": y, "width": w, "height": h}
+                    confidence = values[4] if len(values) == 5 else None
+                    yield image[0], _row(class_label, "detection", geometry, confidence)
+                elif len(values) >= 6 and len(values) % 2 == 0:
+                    points = [[values[i], values[i + 1]] for i in range(0, len(values), 2)]
+                    yield image[0], _row(class_label, "segmentation", points)
+                else:
+                    report["annotations_skipped"] += 1
+
+# --- LabelMe: um .json por imagem ---
+
+def _parse_labelme(zip_file: zipfile.ZipFile, matcher: _ImageMatcher, report: dict) -> Iterator[ImportRow]:
+    for name in _members(zip_file, ".json"):
+        # Cada ficheiro descreve uma única imagem, por isso o tamanho de cada leitura é limitado
+        data = dataset_service._json_loads(zip_file.read(name))
+        if not isinstance(data, dict) or "shapes" not in data:
+            continue
+        image = matcher.match(data.get("imagePath")) or matcher.match(posixpath.basename(name))
+        if image is None:
+            report["images_unmatched"] += 1
+            continue
+        yield image[0], None
+
+        width, height = matcher.image_size(image, data.get("imageWidth"), data.get("imageHeight"))
+        for shape in data["shapes"]:
+            points = shape.get("points") or []
+            shape_type = shape.get("shape_type") or "polygon"
+            if not width or not height:
+                report["annotations_skipped"] += 1
+            elif shape_type == "rectangle" and len(points) == 2:
+                (x1, y1), (x2, y2) = points
+                geometry = _box_geometry(min(x1, x2), min(y1, y2), max(x1, x2), max(y1, y2), width, height)
+                yield image[0], _row(shape.get("label"), "detection", geometry)
+            elif shape_type == "polygon" and len(points) >= 3:
+                yield image[0], _row(shape.get("label"), "segmentation", _polygon_geometry(points, width, height))
+            else:
+                # Círculos, linhas e pontos não têm equivalente nas anotações do AdaptLabelX
+                report["annotations_skipped"] += 1
+
+# --- COCO: annotations.json (lido em streaming com o ijson) ---
+
+def _iter_json_items(zip_file: zipfile.ZipFile, name: str, prefix: str) -> Iterator[dict]:
+    """Elementos de um array de topo do JSON ('images', 'annotations', ...), um a um."""
+    with zip_file.open(name) as stream:
+        if ijson is not None:
+            yield from ijson.items(stream, f"{prefix}.item", use_float=True)
+        else:
+            yield from dataset_service._json_loads(stream.read()).get(prefix) or []
+
+def _coco_segmentation(annotation: dict, width: int, height: int) -> Optional[list]:
+    segmentation = annotation.get("segmentation")
+    # Só polígonos; as máscaras RLE ficam como caixa. Com vários polígonos fica o maior.
+    if not isinstance(segmentation, list) or not segmentation:
+        return None
+    polygon = max(segmentation, key=len) if isinstance(segmentation[0], list) else segmentation
+    if len(polygon) < 6:
+        return None
+    return _polygon_geometry(zip(polygon[0::2], polygon[1::2]), width, height)
+
+def _parse_coco(zip_file: zipfile.ZipFile, matcher: _ImageMatcher, report: dict) -> Iterator[ImportRow]:
+    # Três passagens por ficheiro (categorias, imagens, anotações): assim a ordem das
+    # chaves no JSON não importa e só as imagens e categorias ficam em memória
+    for name in _members(zip_file, ".json"):
+        categories = {item["id"]: item["name"] for item in _iter_json_items(zip_file, name, "categories")}
+
+        images: Dict[int, Tuple[int, int, int]] = {}
+        for item in _iter_json_items(zip_file, name, "images"):
+            image = matcher.match(item.get("file_name"))
+            if image is None:
+                report["images_unmatched"] += 1
+                continue
+            width, height = matcher.image_size(image, item.get("width"), item.get("height"))
+            images[item["id"]] = (image[0], width, height)
+            yield image[0], None
+
+        for annotation in _iter_json_items(zip_file, name, "annotations"):
+            image = images.get(annotation.get("image_id"))
+            class_label = categories.get(annotation.get("category_id"))
+            bbox = annotation.get("bbox")
+            if image is None or class_label is None or not image[1] or not image[2]:
+                report["annotations_skipped"] += 1
+                continue
+            image_id, width, height = image
+            confidence = annotation.get("score")
+
+            polygon = _coco_segmentation(annotation, width, height)
+            if polygon is not None:
+                yield image_id, _row(class_label, "segmentation", polygon, confidence)
+            elif bbox and len(bbox) == 4:
+                x, y, w, h = bbox
+                yield image_id, _row(class_label, "detection", _box_geometry(x, y, x + w, y + h, width, height), confidence)
+            else:
+                report["annotations_skipped"] += 1
+
+# --- CVAT for images: annotations.xml (iterparse, um <image> de cada vez) ---
+
+def _parse_cvat(zip_file: zipfile.ZipFile, matcher: _ImageMatcher, report: dict) -> Iterator[ImportRow]:
+    for name in _members(zip_file, ".xml"):
+        with zip_file.open(name) as stream:
+            root = None
+            for event, element in iterparse(stream, events=("start", "end")):
+                if root is None:
+                    root = element
+                if event != "end" or element.tag != "image":
+                    continue
+
+                image = matcher.match(element.get("name"))
+                if image is None:
+                    report["images_unmatched"] += 1
+                else:
+                    yield image[0], None
+                    yield from _cvat_image_rows(element, image, matcher, report)
+                # Liberta o <image> já processado: a árvore nunca cresce além de uma imagem
+                root.clear()
+
+def _cvat_image_rows(element, image: Tuple[int, str], matcher: _ImageMatcher, report: dict) -> Iterator[ImportRow]:
+    width, height = matcher.image_size(image, element.get("width"), element.get("height"))
+    for shape in element:
+        label = shape.get("label")
+        try:
+            if not width or not height:
+                raise ValueError("imagem sem dimensões")
+            if shape.tag == "box":
+                geometry = _box_geometry(
+                    float(shape.get("xtl")), float(shape.get("ytl")),
+                    float(shape.get("xbr")), float(shape.get("ybr")), width, height
+                )
+                yield image[0], _row(label, "detection", geometry)
+            elif shape.tag == "polygon":
+                points = [tuple(float(v) for v in point.split(",")) for point in shape.get("points", "").split(";")]
+                if len(points) < 3:
+                    raise ValueError("polígono com menos de 3 pontos")
+                yield image[0], _row(label, "segmentation", _polygon_geometry(points, width, height))
+            else:
+                # Polilinhas, pontos, máscaras e tags não têm equivalente
+                report["annotations_skipped"] += 1
+        except (TypeError, ValueError):
+            report["annotations_skipped"] += 1
+
+_PARSERS: Dict[str, Callable[[zipfile.ZipFile, _ImageMatcher, dict], Iterator[ImportRow]]] = {
+    "yolo": _parse_yolo,
+    "labelme": _parse_labelme,
+    "coco": _parse_coco,
+    "cvat": _parse_cvat,
+}
+
+# --- Gravação em massa ---
+
+def _write_batch(db: Session, dataset_id: int, rows: List[dict], touched_ids: List[int], seen_ids: Set[int], provenance: str):
+    """
+    Grava um lote numa transação. As imagens que aparecem pela primeira vez na
+    importação perdem as anotações anteriores; as seguintes só acrescentam
+    (no COCO as anotações de uma imagem podem estar espalhadas pelo ficheiro).
+    """
+    new_ids = [image_id for image_id in touched_ids if image_id not in seen_ids]
+    if new_ids:
+        dataset_stats_service.record_annotations_replaced(db, dataset_id, new_ids, [])
+        db.query(Annotation).filter(Annotation.image_id.in_(new_ids)).delete(synchronize_session=False)
+        db.query(Image).filter(Image.id.in_(new_ids)).update(
+            {Image.annotation_provenance: provenance}, synchronize_session=False
+        )
+        seen_ids.update(new_ids)
+    if rows:
+        dataset_stats_service.record_annotations_added(db, dataset_id, rows)
+        db.execute(insert(Annotation), rows)
+    dataset_service.mark_annotations_changed(db, dataset_id=dataset_id, image_ids=touched_ids)
+    db.commit()
+
+def import_annotations(
+    db: Session, db_dataset: Dataset, archive_path: str, import_format: str,
+    progress: Optional[Callable[[dict], None]] = None, batch_size: Optional[int] = None,
+) -> dict:
+    """
+    Importa as anotações de um arquivo .zip exportado por outra ferramenta (ou por
+    nós). O arquivo é lido em streaming e as anotações são gravadas em lotes de
+    batch_size (IMPORT_BATCH_SIZE), um commit por lote: a memória usada depende do
+    nº de imagens do dataset, não do nº de anotações do arquivo.
+    As imagens que aparecem no arquivo ficam só com as anotações importadas.
+    Devolve o relatório (contagens, duração e débito); progress recebe-o após cada lote.
+    """
+    if import_format not in _PARSERS:
+        raise ValueError(f"Formato de importação desconhecido: {import_format}")
+
+    batch_size = batch_size or settings.IMPORT_BATCH_SIZE
+    provenance = f"{dataset_service.IMPORT_PROVENANCE_PREFIX}:{import_format}"
+    imported = metrics.IMPORT_ANNOTATIONS.labels(format=import_format)
+    report = {
+        "images_matched": 0,
+        "images_unmatched": 0,
+        "annotations_imported": 0,
+        "annotations_skipped": 0,
+        "elapsed_seconds": 0.0,
+        "annotations_per_second": 0.0,
+    }
+    start = time.perf_counter()
+    seen_ids: Set[int] = set()
+    rows: List[dict] = []
+    touched: Dict[int, None] = {} # imagens do lote, por ordem
+
+    def update_report():
+        report["images_matched"] = len(seen_ids)
+        report["elapsed_seconds"] = time.perf_counter() - start
+        report["annotations_per_second"] = report["annotations_imported"] / max(report["elapsed_seconds"], 1e-9)
+
+    def flush():
+        with tracing.span("import.batch", images=len(touched), annotations=len(rows)):
+            _write_batch(db, db_dataset.id, rows, list(touched), seen_ids, provenance)
+        imported.inc(len(rows))
+        report["annotations_imported"] += len(rows)
+        update_report()
+        rows.clear()
+        touched.clear()
+        if progress is not None:
+            progress(dict(report))
+
+    matcher = _ImageMatcher(db, db_dataset.id)
+    with zipfile.ZipFile(archive_path) as zip_file:
+        for image_id, row in _PARSERS[import_format](zip_file, matcher, report):
+            touched[image_id] = None
+            if row is not None:
+                if not row["class_label"]:
+                    report["annotations_skipped"] += 1
+                    continue
+                rows.append({**row, "provenance": provenance, "image_id": image_id})
+            if len(rows) >= batch_size or len(touched) >= batch_size:
+                flush()
+    if touched:
+        flush()
+    update_report()
+
+    print(f"Importação {import_format} no dataset {db_dataset.id}: {report['annotations_imported']} anotações "
+          f"em {report['images_matched']} imagens, {report['elapsed_seconds']:.1f}s "
+          f"({report['annotations_per_second']:.0f} anotações/s).")
+    return report
@@ -1,6 +1,8 @@
 import os
-import shutil
+import hashlib
 from fastapi import UploadFile, HTTPException
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 from typing import List
 
@@ -11,48 +13,84 @@ from app.schemas.custom_model import CustomModelCreate
 UPLOAD_DIR = "custom_models_user"
 os.makedirs(UPLOAD_DIR, exist_ok=True)
 
-def create_model(db: Session, *, model_in: CustomModelCreate, file: UploadFile, owner_id: int) -> CustomModel:
+# Extensões aceites para os ficheiros de pesos
+MODEL_FILE_EXTENSIONS = (".pt", ".pth")
+
+def get_model_file_path(owner_id: int, filename: str) -> str:
     """
-    Salva um arquivo de modelo enviado e cria um registro no banco de dados.
+    Valida o nome do ficheiro e devolve o caminho onde o modelo do usuário será guardado.
     """
+    if not filename.endswith(MODEL_FILE_EXTENSIONS):
+        raise HTTPException(status_code=400, detail="Tipo de arquivo inválido. Apenas arquivos .pt ou .pth são permitidos.")
+
     # Garante que o nome do arquivo é seguro
-    if ".." in file.filename:
+    if ".." in filename or "/" in filename or "\\" in filename:
         raise HTTPException(status_code=400, detail="Nome de arquivo inválido.")
 
     # Cria um subdiretório para o usuário para evitar conflitos de nome
     user_model_dir = os.path.join(UPLOAD_DIR, str(owner_id))
     os.makedirs(user_model_dir, exist_ok=True)
 
-    file_path = os.path.join(user_model_dir, file.filename)
+    file_path = os.path.join(user_model_dir, filename)
 
     if os.path.exists(file_path):
         raise HTTPException(status_code=400, detail="Um modelo com este nome já existe.")
+    return file_path
 
-    # Salva o arquivo no disco
-    try:
-        with open(file_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
-    finally:
-        file.file.close()
-
-    # Cria o registro no banco de dados
+def register_model(
+    db: Session, *, model_in: CustomModelCreate, file_path: str, owner_id: int, file_sha256: str, file_size: int
+) -> CustomModel:
+    """
+    Cria o registro de um modelo já gravado em disco. As classes, a tarefa e o nº de
+    parâmetros são extraídos depois, em segundo plano (model_metadata_service).
+    """
     db_model = CustomModel(
         name=model_in.name,
         model_type=model_in.model_type,
         file_path=file_path, # Salva o caminho relativo
-        owner_id=owner_id
+        owner_id=owner_id,
+        file_sha256=file_sha256,
+        file_size=file_size,
     )
     db.add(db_model)
     db.commit()
     db.refresh(db_model)
     return db_model
 
+def create_model(db: Session, *, model_in: CustomModelCreate, file: UploadFile, owner_id: int) -> CustomModel:
+    """
+    Salva um arquivo de modelo enviado e cria um registro no banco de dados.
+    """
+    file_path = get_model_file_path(owner_id, file.filename)
+
+    # Salva o arquivo no disco, calculando o hash e o tamanho na mesma passagem
+    sha256 = hashlib.sha256()
+    file_size = 0
+    try:
+        with open(file_path, "wb") as buffer:
+            while chunk := file.file.read(1024 * 1024):
+                sha256.update(chunk)
+                file_size += len(chunk)
+                buffer.write(chunk)
+    finally:
+        file.file.close()
+
+    return register_model(
+        db, model_in=model_in, file_path=file_path, owner_id=owner_id,
+        file_sha256=sha256.hexdigest(), file_size=file_size,
+    )
+
 def get_models_by_owner(db: Session, *, owner_id: int) -> List[CustomModel]:
     """
     Lista todos os modelos pertencentes a um usuário específico.
     """
     return db.query(CustomModel).filter(CustomModel.owner_id == owner_id).all()
 
+async def get_models_by_owner_async(db: AsyncSession, *, owner_id: int) -> List[CustomModel]:
+    """Versão de get_models_by_owner para uma AsyncSession."""
+    result = await db.scalars(select(CustomModel).where(CustomModel.owner_id == owner_id))
+    return list(result)
+
 def get_model(db: Session, *, model_id: int, owner_id: int) -> CustomModel:
     """
     Obtém um modelo específico, verificando se o usuário é o proprietário.
@@ -62,15 +100,23 @@ def get_model(db: Session, *, model_id: int, owner_id: int) -> CustomModel:
         raise HTTPException(status_code=404, detail="Modelo não encontrado ou acesso negado.")
     return db_model
 
+async def get_model_async(db: AsyncSession, *, model_id: int, owner_id: int) -> CustomModel:
+    """Versão de get_model para uma AsyncSession."""
+    db_model = await db.scalar(select(CustomModel).where(CustomModel.id == model_id, CustomModel.owner_id == owner_id))
+    if not db_model:
+        raise HTTPException(status_code=404, detail="Modelo não encontrado ou acesso negado.")
+    return db_model
+
 def delete_model(db: Session, *, model_id: int, owner_id: int):
     """
     Exclui um modelo do banco de dados e do sistema de arquivos.
     """
     db_model = get_model(db=db, model_id=model_id, owner_id=owner_id)
 
-    # Remove o arquivo do disco
-    if os.path.exists(db_model.file_path):
-        os.remove(db_model.file_path)
+    # Remove o arquivo do disco (e a variante INT8, se existir)
+    for file_path in (db_model.file_path, db_model.quantized_file_path):
+        if file_path and os.path.exists(file_path):
+            os.remove(file_path)
 
     # Remove do banco de dados
     db.delete(db_model)
@@ -1,25 +1,68 @@
 import os
 import shutil
+import threading
 from fastapi import UploadFile, HTTPException
+from sqlalchemy import Text, and_, cast, insert, or_, select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from typing import List, Optional
+from typing import AsyncIterator, Iterable, Iterator, List, Optional
 from app.services import ia_service
+from app.services import image_derivative_service
+from app.services import dataset_stats_service
 
-from app.models.dataset import Dataset, Image
-from app.schemas.dataset import DatasetCreate
+from app.models.dataset import Dataset, DatasetClassCount, Image
+from app.models.annotation import Annotation
+from app.schemas.dataset import DatasetCreate, DatasetReannotate
 import io              
 import zipfile
 import json
+import tempfile
 from PIL import Image as PILImage
 import datetime 
+import time
 import numpy as np 
-import xml.etree.ElementTree as ET 
-from xml.dom import minidom 
+from xml.sax.saxutils import XMLGenerator
+
+try:
+    import orjson
+except ImportError: # O orjson é opcional: sem ele usamos o json da stdlib
+    orjson = None
 
 # --- 1. ADICIONAR IMPORT PARA A SESSÃO "VIVA" ---
-from app.core.database import SessionLocal
+from app.core.database import BackgroundSession
+from app.core import metrics, tracing
 
 UPLOAD_DIRECTORY = "uploads"
+EXPORT_CACHE_DIRECTORY = "export_cache"
+
+# Quantas imagens são inferidas antes de cada DELETE+INSERT/commit em massa
+ANNOTATION_BATCH_SIZE = 32
+
+# Campos do dataset que escolhem entre inferência na imagem inteira e em mosaico
+INFERENCE_SETTINGS = (
+    "inference_mode", "tile_size", "tile_overlap", "model_precision",
+    "confidence_threshold", "iou_threshold", "max_detections", "half_precision",
+)
+
+# Estados de um dataset: 'deleting' fica invisível até o janitor o remover
+DATASET_STATUS_ACTIVE = "active"
+DATASET_STATUS_DELETING = "deleting"
+
+# Quantas imagens (e respetivas anotações) são apagadas por transação
+DELETE_BATCH_SIZE = 1000
+
+# Quantas imagens são lidas da BD e escritas por cada pedaço da resposta em streaming
+DETAIL_IMAGE_CHUNK_SIZE = 500
+
+# Campos do dataset na resposta JSON (os mesmos do schema Dataset, sem 'images')
+DATASET_RESPONSE_FIELDS = (
+    "name", "description", "id", "owner_id", "model_id",
+    "inference_mode", "tile_size", "tile_overlap", "model_precision",
+    "confidence_threshold", "iou_threshold", "max_detections", "input_size", "half_precision", "status",
+)
+
+# Só um janitor de cada vez percorre os datasets marcados para remoção
+_janitor_lock = threading.Lock()
 
 # --- Funções de CRUD ---
 def create_dataset(db: Session, dataset: DatasetCreate, owner_id: int):
@@ -31,12 +74,129 @@ def create_dataset(db: Session, dataset: DatasetCreate, owner_id: int):
     return db_dataset
 
 def get_dataset(db: Session, dataset_id: int):
-    """Busca um único dataset pelo ID."""
-    return db.query(Dataset).filter(Dataset.id == dataset_id).first()
+    """Busca um único dataset pelo ID (ignora os que estão a ser apagados)."""
+    return db.query(Dataset).filter(
+        Dataset.id == dataset_id, Dataset.status != DATASET_STATUS_DELETING
+    ).first()
 
 def get_datasets_by_owner(db: Session, owner_id: int, skip: int = 0, limit: int = 100):
     """Lista todos os datasets de um usuário."""
-    return db.query(Dataset).filter(Dataset.owner_id == owner_id).offset(skip).limit(limit).all()
+    return db.query(Dataset).filter(
+        Dataset.owner_id == owner_id, Dataset.status != DATASET_STATUS_DELETING
+    ).offset(skip).limit(limit).all()
+
+async def get_dataset_async(db: AsyncSession, dataset_id: int) -> Optional[Dataset]:
+    """Versão de get_dataset para uma AsyncSession."""
+    return await db.scalar(select(Dataset).where(
+        Dataset.id == dataset_id, Dataset.status != DATASET_STATUS_DELETING
+    ).limit(1))
+
+async def get_datasets_by_owner_async(db: AsyncSession, owner_id: int, skip: int = 0, limit: int = 100) -> List[Dataset]:
+    """Versão de get_datasets_by_owner para uma AsyncSession."""
+    result = await db.scalars(select(Dataset).where(
+        Dataset.owner_id == owner_id, Dataset.status != DATASET_STATUS_DELETING
+    ).offset(skip).limit(limit))
+    return list(result)
+
+# --- Resposta JSON em streaming (listagem e detalhe) ---
+# Os dados vêm diretamente da BD (não são validados de novo pelo Pydantic) e a
+# geometria é copiada como texto JSON, sem ser descodificada e recodificada.
+# As consultas e a serialização são partilhadas pela versão síncrona e pela assíncrona.
+
+def _image_chunk_query(dataset_id: int, last_id: int, chunk_size: int):
+    return select(Image.id, Image.file_name, Image.file_path).where(
+        Image.dataset_id == dataset_id, Image.id > last_id
+    ).order_by(Image.id).limit(chunk_size)
+
+def _chunk_annotations_query(image_ids: List[int]):
+    return select(
+        Annotation.id, Annotation.image_id, Annotation.class_label, Annotation.confidence,
+        Annotation.annotation_type, cast(Annotation.geometry, Text).label("geometry")
+    ).where(Annotation.image_id.in_(image_ids)).order_by(Annotation.image_id, Annotation.id)
+
+def _image_chunk_json(images, annotation_rows) -> bytes:
+    annotations_by_image = {image.id: [] for image in images}
+    for row in annotation_rows:
+        head = _json_dumps({
+            "class_label": row.class_label,
+            "confidence": row.confidence,
+            "id": row.id,
+            "image_id": row.image_id,
+            "annotation_type": row.annotation_type,
+        }, pretty=False)
+        geometry = row.geometry.encode("utf-8") if row.geometry is not None else b"null"
+        annotations_by_image[row.image_id].append(head[:-1] + b',"geometry":' + geometry + b"}")
+
+    parts = []
+    for image in images:
+        head = _json_dumps({
+            "file_name": image.file_name,
+            "id": image.id,
+            "file_path": image.file_path,
+            "thumbnail_url": image_derivative_service.get_derivative_url(image.id, "thumbnail"),
+            "preview_url": image_derivative_service.get_derivative_url(image.id, "preview"),
+        }, pretty=False)
+        parts.append(head[:-1] + b',"annotations":[' + b",".join(annotations_by_image[image.id]) + b"]}")
+    return b",".join(parts)
+
+def _dataset_json_head(db_dataset: Dataset) -> bytes:
+    head = _json_dumps({field: getattr(db_dataset, field) for field in DATASET_RESPONSE_FIELDS}, pretty=False)
+    return head[:-1] + b',"images":['
+
+def _iter_image_chunks_json(db: Session, dataset_id: int, chunk_size: int) -> Iterator[bytes]:
+    last_id = 0
+    while True:
+        images = db.execute(_image_chunk_query(dataset_id, last_id, chunk_size)).all()
+        if not images:
+            return
+        rows = db.execute(_chunk_annotations_query([image.id for image in images]))
+        yield (b"," if last_id else b"") + _image_chunk_json(images, rows)
+        last_id = images[-1].id
+
+async def _aiter_image_chunks_json(db: AsyncSession, dataset_id: int, chunk_size: int) -> AsyncIterator[bytes]:
+    last_id = 0
+    while True:
+        images = (await db.execute(_image_chunk_query(dataset_id, last_id, chunk_size))).all()
+        if not images:
+            return
+        rows = await db.execute(_chunk_annotations_query([image.id for image in images]))
+        yield (b"," if last_id else b"") + _image_chunk_json(images, rows)
+        last_id = images[-1].id
+
+def iter_dataset_json(db: Session, db_dataset: Dataset, chunk_size: int = DETAIL_IMAGE_CHUNK_SIZE) -> Iterator[bytes]:
+    """
+    Serializa um dataset com as suas imagens e anotações (o mesmo JSON do schema
+    Dataset) em pedaços de chunk_size imagens, sem carregar a árvore no ORM.
+    """
+    yield _dataset_json_head(db_dataset)
+    yield from _iter_image_chunks_json(db, db_dataset.id, chunk_size)
+    yield b"]}"
+
+def iter_datasets_json(db: Session, datasets: Iterable[Dataset]) -> Iterator[bytes]:
+    """Lista de datasets em streaming (um array JSON com iter_dataset_json de cada um)."""
+    yield b"["
+    for i, db_dataset in enumerate(datasets):
+        if i:
+            yield b","
+        yield from iter_dataset_json(db, db_dataset)
+    yield b"]"
+
+async def aiter_dataset_json(db: AsyncSession, db_dataset: Dataset, chunk_size: int = DETAIL_IMAGE_CHUNK_SIZE) -> AsyncIterator[bytes]:
+    """Versão de iter_dataset_json para uma AsyncSession (usada pelo endpoint de detalhe)."""
+    yield _dataset_json_head(db_dataset)
+    async for chunk in _aiter_image_chunks_json(db, db_dataset.id, chunk_size):
+        yield chunk
+    yield b"]}"
+
+async def aiter_datasets_json(db: AsyncSession, datasets: Iterable[Dataset]) -> AsyncIterator[bytes]:
+    """Versão de iter_datasets_json para uma AsyncSession (usada pelo endpoint de listagem)."""
+    yield b"["
+    for i, db_dataset in enumerate(datasets):
+        if i:
+            yield b","
+        async for chunk in aiter_dataset_json(db, db_dataset):
+            yield chunk
+    yield b"]"
 
 def save_uploaded_images(db: Session, db_dataset: Dataset, files: List[UploadFile]) -> List[Image]:
     """Salva os arquivos de imagem no disco e cria os registros no banco."""
@@ -60,338 +220,770 @@ def save_uploaded_images(db: Session, db_dataset: Dataset, files: List[UploadFil
         db.add(db_image)
         new_images.append(db_image)
         
+    mark_annotations_changed(db, dataset_id=db_dataset.id)
     db.commit()
     for img in new_images:
         db.refresh(img)
+        image_derivative_service.schedule_derivatives(
+            db_dataset.id, img.id, os.path.join(UPLOAD_DIRECTORY, img.file_path)
+        )
     return new_images
 
-def delete_dataset(db: Session, dataset_id: int, owner_id: int):
-    """Exclui um dataset e todas as suas imagens e anotações."""
-    db_dataset = db.query(Dataset).filter(Dataset.id == dataset_id, Dataset.owner_id == owner_id).first()
+def delete_dataset(db: Session, dataset_id: int, owner_id: int) -> Dataset:
+    """
+    Marca um dataset como 'deleting' e devolve-o de imediato. As imagens,
+    anotações e ficheiros são removidos em segundo plano por purge_deleted_datasets.
+    """
+    db_dataset = db.query(Dataset).filter(
+        Dataset.id == dataset_id,
+        Dataset.owner_id == owner_id,
+        Dataset.status != DATASET_STATUS_DELETING
+    ).first()
     if not db_dataset:
         raise HTTPException(status_code=404, detail="Dataset não encontrado")
-    
-    dataset_dir = os.path.join(UPLOAD_DIRECTORY, str(dataset_id))
-    if os.path.exists(dataset_dir):
-        shutil.rmtree(dataset_dir)
-        
-    db.delete(db_dataset)
+
+    db_dataset.status = DATASET_STATUS_DELETING
     db.commit()
-    return True
+    db.refresh(db_dataset)
+    return db_dataset
 
-# --- 2. FUNÇÃO "GERENTE" ---
-def run_annotation_for_dataset(dataset_id: int): 
+def _purge_dataset_rows(db: Session, dataset_id: int):
     """
-    O "Gerente": Pega no dataset, faz o loop e chama o "Trabalhador de IA"
-    com o filtro de classes correto.
-    Esta função CRIA A SUA PRÓPRIA SESSÃO de BD.
+    Apaga as linhas do dataset com DELETEs por conjunto, pela ordem das FKs
+    (anotações -> imagens -> contagens/dataset), em lotes de DELETE_BATCH_SIZE imagens
+    para manter as transações curtas. Nada é carregado para o ORM.
     """
-    print(f"Iniciando tarefa de anotação para dataset {dataset_id}")
-    
-    db = SessionLocal() # Cria uma nova sessão "viva"
-    
-    try:
-        db_dataset = get_dataset(db, dataset_id=dataset_id)
-        if not db_dataset or not db_dataset.model_id:
-            print(f"Dataset {dataset_id} não encontrado ou sem modelo.")
-            return
+    while True:
+        image_ids = [row.id for row in db.query(Image.id).filter(
+            Image.dataset_id == dataset_id
+        ).limit(DELETE_BATCH_SIZE)]
+        if not image_ids:
+            break
+        db.query(Annotation).filter(Annotation.image_id.in_(image_ids)).delete(synchronize_session=False)
+        db.query(Image).filter(Image.id.in_(image_ids)).delete(synchronize_session=False)
+        db.commit()
+
+    db.query(DatasetClassCount).filter(DatasetClassCount.dataset_id == dataset_id).delete(synchronize_session=False)
+    db.query(Dataset).filter(Dataset.id == dataset_id).delete(synchronize_session=False)
+    db.commit()
 
-        # Busca as imagens que ainda não têm anotações
-        images_to_annotate = db.query(Image).filter(
-            Image.dataset_id == dataset_id,
-            ~Image.annotations.any() 
-        ).all()
-        
-        if not images_to_annotate:
-            print(f"Não há imagens novas para anotar no dataset {dataset_id}.")
-            return
+def _get_dataset_file_directories():
+    return (UPLOAD_DIRECTORY, EXPORT_CACHE_DIRECTORY, image_derivative_service.DERIVATIVE_DIRECTORY)
+
+def remove_dataset_files(dataset_id: int):
+    """Remove os uploads, o cache de exportação e as miniaturas de um dataset."""
+    for directory in _get_dataset_file_directories():
+        shutil.rmtree(os.path.join(directory, str(dataset_id)), ignore_errors=True)
+
+def _sweep_orphaned_files(db: Session):
+    """Remove pastas de datasets que já não existem (ex.: servidor reiniciado a meio de uma remoção)."""
+    existing_ids = {str(row.id) for row in db.query(Dataset.id)}
+    for directory in _get_dataset_file_directories():
+        if not os.path.isdir(directory):
+            continue
+        for entry in os.listdir(directory):
+            if entry.isdigit() and entry not in existing_ids:
+                print(f"Janitor: a remover ficheiros órfãos em {os.path.join(directory, entry)}")
+                shutil.rmtree(os.path.join(directory, entry), ignore_errors=True)
+
+def purge_deleted_datasets():
+    """
+    O "Janitor": remove da BD e do disco todos os datasets marcados como
+    'deleting' (incluindo os que ficaram pendentes de execuções anteriores)
+    e limpa ficheiros órfãos.
+    Usa a sessão de segundo plano da thread (BackgroundSession).
+    """
+    with _janitor_lock:
+        db = BackgroundSession()
+        try:
+            while True:
+                dataset_ids = [row.id for row in db.query(Dataset.id).filter(
+                    Dataset.status == DATASET_STATUS_DELETING
+                )]
+                if not dataset_ids:
+                    break
+                for dataset_id in dataset_ids:
+                    print(f"Janitor: a apagar o dataset {dataset_id}...")
+                    _purge_dataset_rows(db, dataset_id)
+                    remove_dataset_files(dataset_id)
+
+            _sweep_orphaned_files(db)
+        except Exception as e:
+            print(f"Erro no janitor de datasets: {e}")
+            db.rollback()
+        finally:
+            BackgroundSession.remove()
+
+def update_annotation_config(db: Session, db_dataset: Dataset, config_in: DatasetReannotate) -> Dataset:
+    """
+    Altera o modelo, o filtro de classes e/ou o modo de inferência usados na anotação automática.
+    Recusa (400, sem gravar nada) uma configuração que deixe o dataset sem modelo.
+    """
+    update_data = config_in.model_dump(exclude_unset=True)
+    if not update_data.get("model_id", db_dataset.model_id):
+        raise HTTPException(status_code=400, detail="O dataset não tem um modelo definido.")
+    for key, value in update_data.items():
+        # Só o model_id, o filtro de classes e o input_size podem ser limpos com null
+        if value is None and key in INFERENCE_SETTINGS:
+            continue
+        setattr(db_dataset, key, value)
+    db.add(db_dataset)
+    db.commit()
+    db.refresh(db_dataset)
+    return db_dataset
 
-        print(f"Anotando {len(images_to_annotate)} imagens...")
+# --- Proveniência das anotações ---
+
+# Proveniência das imagens/anotações importadas ("import:coco"). Como já têm
+# anotações, nem o anotador automático nem a re-anotação voltam a passar por
+# elas, a menos que a re-anotação o peça explicitamente (include_imported).
+IMPORT_PROVENANCE_PREFIX = "import"
+
+def get_annotation_provenance(db_dataset: Dataset) -> str:
+    """
+    Assinatura "modelo|classes" que identifica a configuração de anotação do dataset.
+    Os modelos customizados ignoram o filtro de classes, por isso ele não entra na assinatura.
+    No modo em mosaico acrescenta "|tiled:tamanho:sobreposição", com a variante
+    quantizada de um modelo customizado "|int8" e, se os parâmetros de inferência
+    não forem os por omissão, "|conf=...,iou=...,max_det=...".
+    """
+    classes = ""
+    if db_dataset.model_id in ia_service.STANDARD_MODEL_IDS and db_dataset.classes_to_annotate:
+        classes = ",".join(sorted(db_dataset.classes_to_annotate))
+    provenance = f"{db_dataset.model_id}|{classes}"
+    if db_dataset.inference_mode == "tiled" and db_dataset.model_id != "sam":
+        provenance += f"|tiled:{db_dataset.tile_size}:{db_dataset.tile_overlap:g}"
+    if db_dataset.model_precision == "int8" and db_dataset.model_id not in ia_service.STANDARD_MODEL_IDS:
+        provenance += "|int8"
+    inference_args = get_inference_args(db_dataset)
+    if inference_args != ia_service.DEFAULT_INFERENCE_ARGS:
+        provenance += "|" + ",".join(f"{key}={value:g}" for key, value in sorted(inference_args.items()))
+    return provenance
+
+def get_inference_args(db_dataset: Dataset) -> dict:
+    """
+    Argumentos da chamada ao modelo (conf, iou, max_det, half e, se definido, imgsz) do dataset.
+    Colunas ainda sem valor (dataset por gravar) ficam com os valores por omissão.
+    """
+    inference_args = dict(ia_service.DEFAULT_INFERENCE_ARGS)
+    for key, column in (
+        ("conf", "confidence_threshold"), ("iou", "iou_threshold"),
+        ("max_det", "max_detections"), ("half", "half_precision"),
+    ):
+        value = getattr(db_dataset, column)
+        if value is not None:
+            inference_args[key] = value
+    if db_dataset.input_size:
+        inference_args["imgsz"] = db_dataset.input_size
+    return inference_args
+
+def mark_annotations_changed(db: Session, dataset_id: int, image_ids: Optional[List[int]] = None):
+    """
+    Incrementa os contadores de revisão do dataset (e das imagens indicadas),
+    invalidando as exportações em cache. Não faz commit.
+    """
+    if image_ids:
+        db.query(Image).filter(Image.id.in_(image_ids)).update(
+            {Image.annotation_revision: Image.annotation_revision + 1}, synchronize_session=False
+        )
+    db.query(Dataset).filter(Dataset.id == dataset_id).update(
+        {Dataset.annotation_revision: Dataset.annotation_revision + 1}, synchronize_session=False
+    )
 
-        for db_image in images_to_annotate:
-            image_path = os.path.join(UPLOAD_DIRECTORY, db_image.file_path)
-            if not os.path.exists(image_path):
-                print(f"Imagem não encontrada: {image_path}")
-                continue
-                
+def replace_image_annotations(db: Session, dataset_id: int, image_ids: List[int], rows: List[dict], provenance: str):
+    """
+    Substitui em massa as anotações de um lote de imagens: um DELETE, um INSERT
+    e um UPDATE da proveniência. Não faz commit.
+    """
+    if not image_ids:
+        return
+    dataset_stats_service.record_annotations_replaced(db, dataset_id, image_ids, rows)
+    db.query(Annotation).filter(Annotation.image_id.in_(image_ids)).delete(synchronize_session=False)
+    if rows:
+        db.execute(insert(Annotation), rows)
+    db.query(Image).filter(Image.id.in_(image_ids)).update(
+        {Image.annotation_provenance: provenance}, synchronize_session=False
+    )
+    mark_annotations_changed(db, dataset_id=dataset_id, image_ids=image_ids)
+
+def _annotate_images_in_batches(db: Session, db_dataset: Dataset, image_ids: List[int]):
+    """
+    Corre o modelo sobre as imagens indicadas, em lotes de ANNOTATION_BATCH_SIZE,
+    e grava os resultados de cada lote numa única transação.
+    """
+    provenance = get_annotation_provenance(db_dataset)
+    inference_seconds = metrics.INFERENCE_SECONDS.labels(
+        model_id=db_dataset.model_id, mode=db_dataset.inference_mode or "full"
+    )
+
+    for start in range(0, len(image_ids), ANNOTATION_BATCH_SIZE):
+        with tracing.span("annotation.batch", dataset_id=db_dataset.id, batch_start=start):
+            _annotate_batch(
+                db, db_dataset, image_ids[start:start + ANNOTATION_BATCH_SIZE], provenance, inference_seconds
+            )
+
+def _annotate_batch(db: Session, db_dataset: Dataset, batch_ids: List[int], provenance: str, inference_seconds):
+    """Infere e grava um lote de imagens (um span por imagem e um pela escrita na BD)."""
+    batch = db.query(Image).filter(Image.id.in_(batch_ids)).all()
+    inference_args = get_inference_args(db_dataset)
+
+    rows = []
+    done_ids = []
+    for db_image in batch:
+        image_path = os.path.join(UPLOAD_DIRECTORY, db_image.file_path)
+        if not os.path.exists(image_path):
+            print(f"Imagem não encontrada: {image_path}")
+            continue
+
+        with tracing.span("annotation.image", image_id=db_image.id, model_id=db_dataset.model_id):
             try:
+                inference_start = time.perf_counter()
                 # Passar o owner_id para o "Trabalhador de IA"
-                results = ia_service.run_model_on_image(
-                    image_path=image_path,
-                    model_type=db_dataset.model_id, 
-                    selected_classes=db_dataset.classes_to_annotate,
-                    owner_id=db_dataset.owner_id 
-                )
-                
-                ia_service.create_annotations_from_results(
-                    db, 
+                if db_dataset.inference_mode == "tiled":
+                    results = ia_service.run_tiled_inference(
+                        db,
+                        image_path=image_path,
+                        model_type=db_dataset.model_id,
+                        selected_classes=db_dataset.classes_to_annotate,
+                        owner_id=db_dataset.owner_id,
+                        tile_size=db_dataset.tile_size,
+                        tile_overlap=db_dataset.tile_overlap,
+                        precision=db_dataset.model_precision,
+                        inference_args=inference_args
+                    )
+                else:
+                    results = ia_service.run_model_on_image(
+                        db,
+                        image_path=image_path,
+                        model_type=db_dataset.model_id, 
+                        selected_classes=db_dataset.classes_to_annotate,
+                        owner_id=db_dataset.owner_id,
+                        precision=db_dataset.model_precision,
+                        inference_args=inference_args
+                    )
+                inference_seconds.observe(time.perf_counter() - inference_start)
+                image_rows = ia_service.build_annotation_rows(
+                    db,
                     results, 
                     db_image, 
                     db_dataset.model_id,
-                    owner_id=db_dataset.owner_id 
+                    owner_id=db_dataset.owner_id,
+                    provenance=provenance,
+                    min_confidence=inference_args["conf"],
+                    max_detections=inference_args["max_det"]
                 )
-                
-                db.commit() 
-                
+                tracing.set_attributes(annotations=len(image_rows))
+                rows.extend(image_rows)
+                done_ids.append(db_image.id)
             except Exception as e:
                 print(f"Erro ao processar a imagem {db_image.file_name}: {e}")
-                db.rollback() 
 
+    try:
+        with tracing.span("annotation.db_write", images=len(done_ids), annotations=len(rows)), \
+                metrics.ANNOTATION_WRITE_SECONDS.time():
+            replace_image_annotations(db, db_dataset.id, done_ids, rows, provenance)
+            db.commit()
+        print(f"Lote gravado: {len(done_ids)} imagens, {len(rows)} anotações.")
     except Exception as e:
-        print(f"Erro geral na tarefa de anotação: {e}")
+        print(f"Erro ao gravar o lote de anotações: {e}")
         db.rollback()
-    finally:
-        print(f"Tarefa de anotação concluída para o dataset {dataset_id}.")
-        db.close() # Fecha a sessão "viva"
 
-# --- Funções de Exportação ---
+# --- 2. FUNÇÃO "GERENTE" ---
+def run_annotation_for_dataset(dataset_id: int, trace_context: Optional[dict] = None): 
+    """
+    O "Gerente": Pega no dataset, faz o loop e chama o "Trabalhador de IA"
+    com o filtro de classes correto.
+    Usa a sessão de segundo plano da thread (BackgroundSession).
+    trace_context: contexto do pedido que agendou a tarefa (tracing.inject_context()).
+    """
+    with tracing.use_context(trace_context), tracing.span("annotation.run", dataset_id=dataset_id):
+        print(f"Iniciando tarefa de anotação para dataset {dataset_id}")
+    
+        db = BackgroundSession() # Sessão da tarefa, partilhada com o ia_service
+        queue_depth = metrics.BACKGROUND_QUEUE_DEPTH.labels(queue="annotation")
+        queue_depth.inc()
+    
+        try:
+            db_dataset = get_dataset(db, dataset_id=dataset_id)
+            if not db_dataset or not db_dataset.model_id:
+                print(f"Dataset {dataset_id} não encontrado ou sem modelo.")
+                return
+
+            # Busca as imagens que nunca passaram pelo anotador
+            image_ids = [row.id for row in db.query(Image.id).filter(
+                Image.dataset_id == dataset_id,
+                Image.annotation_provenance.is_(None),
+                ~Image.annotations.any() 
+            ).order_by(Image.id)]
+        
+            if not image_ids:
+                print(f"Não há imagens novas para anotar no dataset {dataset_id}.")
+                return
+
+            print(f"Anotando {len(image_ids)} imagens...")
+            _annotate_images_in_batches(db, db_dataset, image_ids)
+
+        except Exception as e:
+            print(f"Erro geral na tarefa de anotação: {e}")
+            db.rollback()
+        finally:
+            print(f"Tarefa de anotação concluída para o dataset {dataset_id}.")
+            queue_depth.dec()
+            BackgroundSession.remove() # Fecha a sessão e devolve a ligação ao pool
+
+def run_reannotation_for_dataset(dataset_id: int, trace_context: Optional[dict] = None, include_imported: bool = False):
+    """
+    Re-anotação incremental: volta a correr o modelo apenas nas imagens cuja
+    proveniência difere da configuração atual do dataset (modelo/classes),
+    substituindo as anotações antigas lote a lote.
+    As imagens com anotações importadas só são substituídas com include_imported.
+    Usa a sessão de segundo plano da thread (BackgroundSession).
+    trace_context: contexto do pedido que agendou a tarefa (tracing.inject_context()).
+    """
+    with tracing.use_context(trace_context), tracing.span("annotation.rerun", dataset_id=dataset_id):
+        print(f"Iniciando re-anotação para dataset {dataset_id}")
 
-def export_annotations_yolo(db: Session, db_dataset: Dataset):
-    zip_buffer = io.BytesIO()
+        db = BackgroundSession()
+        queue_depth = metrics.BACKGROUND_QUEUE_DEPTH.labels(queue="annotation")
+        queue_depth.inc()
+
+        try:
+            db_dataset = get_dataset(db, dataset_id=dataset_id)
+            if not db_dataset or not db_dataset.model_id:
+                print(f"Dataset {dataset_id} não encontrado ou sem modelo.")
+                return
+
+            provenance = get_annotation_provenance(db_dataset)
+            stale = [Image.annotation_provenance != provenance]
+            if not include_imported:
+                stale.append(Image.annotation_provenance.not_like(f"{IMPORT_PROVENANCE_PREFIX}:%"))
+            image_ids = [row.id for row in db.query(Image.id).filter(
+                Image.dataset_id == dataset_id,
+                or_(Image.annotation_provenance.is_(None), and_(*stale))
+            ).order_by(Image.id)]
+
+            if not image_ids:
+                print(f"Todas as imagens do dataset {dataset_id} já estão anotadas com '{provenance}'.")
+                return
+
+            print(f"Re-anotando {len(image_ids)} imagens com '{provenance}'...")
+            _annotate_images_in_batches(db, db_dataset, image_ids)
+
+        except Exception as e:
+            print(f"Erro geral na tarefa de re-anotação: {e}")
+            db.rollback()
+        finally:
+            print(f"Re-anotação concluída para o dataset {dataset_id}.")
+            queue_depth.dec()
+            BackgroundSession.remove()
+
+# --- Funções de Exportação ---
+# Cada exportação é feita em duas fases: um "fragmento" por imagem (o conteúdo
+# que depende só da imagem e das suas anotações) e a montagem do arquivo .zip.
+# O export_cache_service reaproveita os fragmentos das imagens que não mudaram.
+
+def get_export_class_names(db: Session, db_dataset: Dataset) -> List[str]:
+    """Lista ordenada das classes presentes nas anotações do dataset (SELECT DISTINCT)."""
+    rows = db.query(Annotation.class_label).join(Image).filter(
+        Image.dataset_id == db_dataset.id
+    ).distinct()
+    return sorted(row.class_label for row in rows)
+
+def get_export_class_map(export_format: str, class_names: List[str]) -> dict:
+    """Mapa classe -> ID (o YOLO começa em 0, o COCO em 1)."""
+    offset = 1 if export_format == "coco" else 0
+    return {name: i + offset for i, name in enumerate(class_names)}
+
+def _get_image_size(image: Image):
+    try:
+        img_path = os.path.join(UPLOAD_DIRECTORY, image.file_path)
+        with PILImage.open(img_path) as img:
+            return img.size
+    except FileNotFoundError:
+        return 0, 0
+
+def _build_yolo_fragment(image: Image, class_map: dict) -> str:
+    txt_content = []
     
-    class_names = sorted(list(set(ann.class_label for img in db_dataset.images for ann in img.annotations)))
-    class_map = {name: i for i, name in enumerate(class_names)}
+    for ann in image.annotations:
+        class_id = class_map.get(ann.class_label)
+        if class_id is None:
+            continue 
 
-    with zipfile.ZipFile(zip_buffer, 'w', zipfile.ZIP_DEFLATED) as zip_file:
-        yaml_content = f"names: {class_names}\nnc: {len(class_names)}\n"
-        zip_file.writestr("data.yaml", yaml_content)
+        if ann.annotation_type == 'detection' and isinstance(ann.geometry, dict): 
+            geo = ann.geometry
+        
+            x = geo.get('x', 0)
+            y = geo.get('y', 0)
+            w = geo.get('width', 0)
+            h = geo.get('height', 0)
+            txt_content.append(f"{class_id} {x:.6f} {y:.6f} {w:.6f} {h:.6f}")
         
-        for image in db_dataset.images:
-            txt_filename = os.path.splitext(image.file_name)[0] + ".txt"
-            txt_content = []
+        elif ann.annotation_type == 'segmentation' and isinstance(ann.geometry, list):
+            geo = ann.geometry 
             
-            for ann in image.annotations:
-                class_id = class_map.get(ann.class_label)
-                if class_id is None:
-                    continue 
-
-                if ann.annotation_type == 'detection' and isinstance(ann.geometry, dict): 
-                    geo = ann.geometry
-                
-                    x = geo.get('x', 0)
-                    y = geo.get('y', 0)
-                    w = geo.get('width', 0)
-                    h = geo.get('height', 0)
-                    txt_content.append(f"{class_id} {x:.6f} {y:.6f} {w:.6f} {h:.6f}")
-                
-                elif ann.annotation_type == 'segmentation' and isinstance(ann.geometry, list):
-                    geo = ann.geometry 
-                    
-                    points_str = " ".join([f"{coord:.6f}" for point in geo for coord in point])
-                    
-                    if points_str:
-                        txt_content.append(f"{class_id} {points_str}")
-                
-            if txt_content:
-                zip_file.writestr(f"labels/{txt_filename}", "\n".join(txt_content))
+            points_str = " ".join([f"{coord:.6f}" for point in geo for coord in point])
+            
+            if points_str:
+                txt_content.append(f"{class_id} {points_str}")
 
-    zip_buffer.seek(0)
-    return zip_buffer.getvalue()
+    return "\n".join(txt_content)
 
+def _build_labelme_fragment(image: Image) -> str:
+    img_width, img_height = _get_image_size(image)
+    
+    labelme_data = {
+        "version": "5.0.1",
+        "flags": {},
+        "shapes": [],
+        "imagePath": image.file_name,
+        "imageData": None, 
+        "imageHeight": img_height,
+        "imageWidth": img_width,
+    }
 
-def export_annotations_labelme(db: Session, db_dataset: Dataset):
-    zip_buffer = io.BytesIO()
-    with zipfile.ZipFile(zip_buffer, 'w', zipfile.ZIP_DEFLATED) as zip_file:
-        for image in db_dataset.images:
-            json_filename = os.path.splitext(image.file_name)[0] + ".json"
+    for ann in image.annotations:
+        shape = {
+            "label": ann.class_label,
+            "group_id": None,
+            "flags": {},
+        }
+        
+        if ann.annotation_type == 'segmentation':
+            shape["shape_type"] = "polygon"
+
+            points = [
+                [p[0] * img_width, p[1] * img_height] for p in ann.geometry
+            ]
+            shape["points"] = points
+        
+        elif ann.annotation_type == 'detection':
+            shape["shape_type"] = "rectangle"
+            geo = ann.geometry
+            x_min = (geo['x'] - geo['width'] / 2) * img_width
+            y_min = (geo['y'] - geo['height'] / 2) * img_height
+            x_max = (geo['x'] + geo['width'] / 2) * img_width
+            y_max = (geo['y'] + geo['height'] / 2) * img_height
+            shape["points"] = [[x_min, y_min], [x_max, y_max]]
+
+        labelme_data["shapes"].append(shape)
+
+    return json.dumps(labelme_data, indent=2)
+
+def _build_coco_fragment(image: Image, class_map: dict) -> str:
+    """Entrada 'images' + entradas 'annotations' (ainda sem 'id') de uma imagem."""
+    img_width, img_height = _get_image_size(image)
+        
+    image_info = {
+        "id": image.id,
+        "file_name": image.file_name,
+        "width": img_width,
+        "height": img_height,
+    }
+    annotations = []
+
+    for ann in image.annotations:
+        class_id = class_map[ann.class_label]
+        ann_info = {
+            "image_id": image.id,
+            "category_id": class_id,
+            "iscrowd": 0,
+        }
+        
+        if ann.annotation_type == 'segmentation':
+            segmentation_flat = []
+            for p in ann.geometry:
+                segmentation_flat.extend([p[0] * img_width, p[1] * img_height])
             
-            try:
-                img_path = os.path.join(UPLOAD_DIRECTORY, image.file_path)
-                with PILImage.open(img_path) as img:
-                    img_width, img_height = img.size
-            except FileNotFoundError:
-                img_width, img_height = 0, 0 
+            x_coords = [p[0] * img_width for p in ann.geometry]
+            y_coords = [p[1] * img_height for p in ann.geometry]
+            x_min = min(x_coords)
+            y_min = min(y_coords)
+            width = max(x_coords) - x_min
+            height = max(y_coords) - y_min
+            bbox = [x_min, y_min, width, height]
+            area = width * height 
             
-            labelme_data = {
-                "version": "5.0.1",
-                "flags": {},
-                "shapes": [],
-                "imagePath": image.file_name,
-                "imageData": None, 
-                "imageHeight": img_height,
-                "imageWidth": img_width,
-            }
-
-            for ann in image.annotations:
-                shape = {
-                    "label": ann.class_label,
-                    "group_id": None,
-                    "flags": {},
-                }
-                
-                if ann.annotation_type == 'segmentation':
-                    shape["shape_type"] = "polygon"
+            ann_info["segmentation"] = [segmentation_flat]
+            ann_info["bbox"] = bbox
+            ann_info["area"] = area
+
+        elif ann.annotation_type == 'detection':
+            geo = ann.geometry
+            width = geo['width'] * img_width
+            height = geo['height'] * img_height
+            x_min = (geo['x'] * img_width) - (width / 2)
+            y_min = (geo['y'] * img_height) - (height / 2)
+            bbox = [x_min, y_min, width, height]
+            area = width * height
+            
+            ann_info["bbox"] = bbox
+            ann_info["area"] = area
+        
+        annotations.append(ann_info)
+
+    return json.dumps({"image": image_info, "annotations": annotations})
+
+def _build_cvat_fragment(image: Image, pretty: bool = True) -> str:
+    """Elemento <image> do CVAT, serializado com o XMLGenerator."""
+    img_width, img_height = _get_image_size(image)
+
+    buffer = io.StringIO()
+    xml = XMLGenerator(buffer, encoding="utf-8", short_empty_elements=True)
+    xml.startElement('image', {
+        "id": str(image.id),
+        "name": image.file_name,
+        "width": str(img_width),
+        "height": str(img_height),
+    })
     
-                    points = [
-                        [p[0] * img_width, p[1] * img_height] for p in ann.geometry
-                    ]
-                    shape["points"] = points
-                
-                elif ann.annotation_type == 'detection':
-                    shape["shape_type"] = "rectangle"
-                    geo = ann.geometry
-                    x_min = (geo['x'] - geo['width'] / 2) * img_width
-                    y_min = (geo['y'] - geo['height'] / 2) * img_height
-                    x_max = (geo['x'] + geo['width'] / 2) * img_width
-                    y_max = (geo['y'] + geo['height'] / 2) * img_height
-                    shape["points"] = [[x_min, y_min], [x_max, y_max]]
-
-                labelme_data["shapes"].append(shape)
-
-            zip_file.writestr(json_filename, json.dumps(labelme_data, indent=2))
+    for ann in image.annotations:
+        ann_attrs = {
+            "label": ann.class_label,
+            "occluded": "0",
+            "source": "model",
+        }
+        
+        if ann.annotation_type == 'segmentation':
+            points_list = []
+            for p in ann.geometry: 
+                x_abs = p[0] * img_width
+                y_abs = p[1] * img_height
+                points_list.append(f"{x_abs:.2f},{y_abs:.2f}")
+            points_str = ";".join(points_list)
+            ann_attrs["points"] = points_str
+            tag = 'polygon'
+
+        else: # 'detection'
+            geo = ann.geometry
+            x_min = (geo['x'] - geo['width'] / 2) * img_width
+            y_min = (geo['y'] - geo['height'] / 2) * img_height
+            x_max = (geo['x'] + geo['width'] / 2) * img_width
+            y_max = (geo['y'] + geo['height'] / 2) * img_height
+            
+            ann_attrs["xtl"] = f"{x_min:.2f}"
+            ann_attrs["ytl"] = f"{y_min:.2f}"
+            ann_attrs["xbr"] = f"{x_max:.2f}"
+            ann_attrs["ybr"] = f"{y_max:.2f}"
+            tag = 'box'
+
+        if pretty:
+            xml.ignorableWhitespace("\n    ")
+        xml.startElement(tag, ann_attrs)
+        xml.endElement(tag)
+
+    if pretty and image.annotations:
+        xml.ignorableWhitespace("\n  ")
+    xml.endElement('image')
+    return buffer.getvalue()
+
+def _write_cvat_archive(zip_file: zipfile.ZipFile, db_dataset: Dataset, class_names: List[str], fragments, pretty: bool = True):
+    """
+    Escreve o annotations.xml do CVAT em streaming dentro da entrada do .zip:
+    o cabeçalho é gerado com o XMLGenerator e cada <image> é copiado tal como
+    vem do fragmento, sem montar a árvore XML em memória.
+    """
+    # O tamanho final não é conhecido ao abrir a entrada: ZIP64 para poder passar dos 2 GiB
+    with zip_file.open("annotations.xml", "w", force_zip64=True) as raw_stream:
+        stream = io.TextIOWrapper(raw_stream, encoding="utf-8")
+        xml = XMLGenerator(stream, encoding="utf-8", short_empty_elements=True)
+
+        def indent(depth: int):
+            if pretty:
+                xml.ignorableWhitespace("\n" + "  " * depth)
+
+        def text_element(tag: str, text: str, depth: int):
+            indent(depth)
+            xml.startElement(tag, {})
+            xml.characters(text)
+            xml.endElement(tag)
+
+        xml.startDocument()
+        xml.startElement('annotations', {})
+        text_element('version', '1.1', 1)
+
+        indent(1)
+        xml.startElement('meta', {})
+        indent(2)
+        xml.startElement('task', {})
+        text_element('name', db_dataset.name, 3)
+        indent(3)
+        xml.startElement('labels', {})
+        for name in class_names:
+            indent(4)
+            xml.startElement('label', {})
+            text_element('name', name, 5)
+            indent(4)
+            xml.endElement('label')
+        if class_names:
+            indent(3)
+        xml.endElement('labels')
+        indent(2)
+        xml.endElement('task')
+        indent(1)
+        xml.endElement('meta')
+
+        for image, fragment in fragments:
+            indent(1)
+            stream.write(fragment)
+
+        indent(0)
+        xml.endElement('annotations')
+        xml.endDocument()
+        if pretty:
+            stream.write("\n")
+        stream.flush()
+        stream.detach()
+
+def build_export_fragment(export_format: str, image: Image, class_map: dict, pretty: bool = True) -> str:
+    """Gera o fragmento de uma imagem no formato pedido."""
+    if export_format == "yolo":
+        return _build_yolo_fragment(image, class_map)
+    if export_format == "labelme":
+        return _build_labelme_fragment(image)
+    if export_format == "coco":
+        return _build_coco_fragment(image, class_map)
+    if export_format == "cvat":
+        return _build_cvat_fragment(image, pretty=pretty)
+    raise ValueError(f"Formato de exportação desconhecido: {export_format}")
+
+def _json_dumps(obj, pretty: bool) -> bytes:
+    """Serializa para JSON com o orjson, se estiver instalado, ou com a stdlib."""
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2 if pretty else 0)
+    if pretty:
+        return json.dumps(obj, indent=2).encode("utf-8")
+    return json.dumps(obj, separators=(",", ":")).encode("utf-8")
+
+def _json_loads(data: str):
+    return orjson.loads(data) if orjson is not None else json.loads(data)
+
+class _JsonArrayWriter:
+    """Escreve os elementos de um array JSON, um a um, num stream binário."""
+
+    def __init__(self, stream, pretty: bool):
+        self.stream = stream
+        self.pretty = pretty
+        self.count = 0
+
+    def write(self, obj):
+        data = _json_dumps(obj, self.pretty)
+        if self.pretty:
+            # Elementos de um array dentro do objeto de topo: 4 espaços
+            data = b"\n    " + data.replace(b"\n", b"\n    ")
+        self.stream.write((b"," if self.count else b"") + data)
+        self.count += 1
+
+def _write_coco_archive(zip_file: zipfile.ZipFile, db_dataset: Dataset, class_names: List[str], fragments, pretty: bool = True):
+    """
+    Escreve o annotations.json do COCO em streaming dentro da entrada do .zip.
+    As 'images' vão direto para o zip; as 'annotations' vão para um ficheiro
+    temporário e são copiadas a seguir, pelo que a memória usada não depende
+    do tamanho do dataset.
+    """
+    newline = b"\n" if pretty else b""
+    indent = b"  " if pretty else b""
+    colon = b": " if pretty else b":"
 
-    zip_buffer.seek(0)
-    return zip_buffer.getvalue()
+    # O tamanho final não é conhecido ao abrir a entrada: ZIP64 para poder passar dos 2 GiB
+    with zip_file.open("annotations.json", "w", force_zip64=True) as stream, tempfile.TemporaryFile() as annotations_file:
+        def write_key(key: str, first: bool = False):
+            stream.write((b"{" if first else b",") + newline + indent + _json_dumps(key, False) + colon)
 
+        def close_array(writer: _JsonArrayWriter):
+            stream.write((newline + indent if writer.count else b"") + b"]")
 
-def export_annotations_coco(db: Session, db_dataset: Dataset):
-    coco_data = {
-        "info": {
+        info = {
             "description": db_dataset.name,
             "date_created": datetime.datetime.utcnow().isoformat()
-        },
-        "licenses": [],
-        "images": [],
-        "annotations": [],
-        "categories": [],
-    }
-
-    class_names = sorted(list(set(ann.class_label for img in db_dataset.images for ann in img.annotations)))
-    class_map = {name: i + 1 for i, name in enumerate(class_names)} 
-    for name, class_id in class_map.items():
-        coco_data["categories"].append({
-            "id": class_id,
-            "name": name,
-            "supercategory": "object",
-        })
-
-    ann_id_counter = 1
-    for image in db_dataset.images:
-        try:
-            img_path = os.path.join(UPLOAD_DIRECTORY, image.file_path)
-            with PILImage.open(img_path) as img:
-                img_width, img_height = img.size
-        except FileNotFoundError:
-            img_width, img_height = 0, 0
-            
-        image_info = {
-            "id": image.id,
-            "file_name": image.file_name,
-            "width": img_width,
-            "height": img_height,
         }
-        coco_data["images"].append(image_info)
-
-        for ann in image.annotations:
-            class_id = class_map[ann.class_label]
-            ann_info = {
-                "id": ann_id_counter,
-                "image_id": image.id,
-                "category_id": class_id,
-                "iscrowd": 0,
-            }
-            
-            if ann.annotation_type == 'segmentation':
-                segmentation_flat = []
-                for p in ann.geometry:
-                    segmentation_flat.extend([p[0] * img_width, p[1] * img_height])
-                
-                x_coords = [p[0] * img_width for p in ann.geometry]
-                y_coords = [p[1] * img_height for p in ann.geometry]
-                x_min = min(x_coords)
-                y_min = min(y_coords)
-                width = max(x_coords) - x_min
-                height = max(y_coords) - y_min
-                bbox = [x_min, y_min, width, height]
-                area = width * height 
-                
-                ann_info["segmentation"] = [segmentation_flat]
-                ann_info["bbox"] = bbox
-                ann_info["area"] = area
-
-            elif ann.annotation_type == 'detection':
-                geo = ann.geometry
-                width = geo['width'] * img_width
-                height = geo['height'] * img_height
-                x_min = (geo['x'] * img_width) - (width / 2)
-                y_min = (geo['y'] * img_height) - (height / 2)
-                bbox = [x_min, y_min, width, height]
-                area = width * height
-                
-                ann_info["bbox"] = bbox
-                ann_info["area"] = area
-            
-            coco_data["annotations"].append(ann_info)
-            ann_id_counter += 1
+        write_key("info", first=True)
+        stream.write(_json_dumps(info, pretty).replace(b"\n", newline + indent))
+        write_key("licenses")
+        stream.write(b"[]")
+
+        write_key("images")
+        stream.write(b"[")
+        images_writer = _JsonArrayWriter(stream, pretty)
+        annotations_writer = _JsonArrayWriter(annotations_file, pretty)
+        for image, fragment in fragments:
+            entry = _json_loads(fragment)
+            images_writer.write(entry["image"])
+            for ann_info in entry["annotations"]:
+                annotations_writer.write({"id": annotations_writer.count + 1, **ann_info})
+        close_array(images_writer)
+
+        write_key("annotations")
+        stream.write(b"[")
+        annotations_file.seek(0)
+        shutil.copyfileobj(annotations_file, stream)
+        close_array(annotations_writer)
+
+        write_key("categories")
+        stream.write(b"[")
+        categories_writer = _JsonArrayWriter(stream, pretty)
+        for class_id, name in enumerate(class_names, start=1):
+            categories_writer.write({
+                "id": class_id,
+                "name": name,
+                "supercategory": "object",
+            })
+        close_array(categories_writer)
+
+        stream.write(newline + b"}")
+
+def write_export_archive(zip_file: zipfile.ZipFile, export_format: str, db_dataset: Dataset, class_names: List[str], fragments, pretty: bool = True):
+    """
+    Monta o conteúdo do .zip a partir de um iterável de pares (imagem, fragmento).
+    'pretty=False' gera o JSON do COCO e o XML do CVAT sem indentação.
+    """
+    if export_format == "yolo":
+        yaml_content = f"names: {class_names}\nnc: {len(class_names)}\n"
+        zip_file.writestr("data.yaml", yaml_content)
+
+        for image, fragment in fragments:
+            if fragment:
+                txt_filename = os.path.splitext(image.file_name)[0] + ".txt"
+                zip_file.writestr(f"labels/{txt_filename}", fragment)
+
+    elif export_format == "labelme":
+        for image, fragment in fragments:
+            json_filename = os.path.splitext(image.file_name)[0] + ".json"
+            zip_file.writestr(json_filename, fragment)
+
+    elif export_format == "coco":
+        _write_coco_archive(zip_file, db_dataset, class_names, fragments, pretty=pretty)
+
+    elif export_format == "cvat":
+        _write_cvat_archive(zip_file, db_dataset, class_names, fragments, pretty=pretty)
+
+    else:
+        raise ValueError(f"Formato de exportação desconhecido: {export_format}")
+
+def _export_annotations(db: Session, db_dataset: Dataset, export_format: str, pretty: bool = True) -> bytes:
+    """Exportação completa (sem cache) para um .zip em memória."""
+    class_names = get_export_class_names(db, db_dataset)
+    class_map = get_export_class_map(export_format, class_names)
 
-    json_string = json.dumps(coco_data, indent=2)
     zip_buffer = io.BytesIO()
     with zipfile.ZipFile(zip_buffer, 'w', zipfile.ZIP_DEFLATED) as zip_file:
-        zip_file.writestr("annotations.json", json_string)
-        
+        fragments = (
+            (image, build_export_fragment(export_format, image, class_map, pretty=pretty))
+            for image in db_dataset.images
+        )
+        write_export_archive(zip_file, export_format, db_dataset, class_names, fragments, pretty=pretty)
+
     zip_buffer.seek(0)
     return zip_buffer.getvalue()
 
+def export_annotations_yolo(db: Session, db_dataset: Dataset):
+    return _export_annotations(db, db_dataset, "yolo")
 
-def export_annotations_cvat(db: Session, db_dataset: Dataset):
-    root = ET.Element('annotations')
-    ET.SubElement(root, 'version').text = '1.1'
-    
-    meta = ET.SubElement(root, 'meta')
-    task = ET.SubElement(meta, 'task')
-    ET.SubElement(task, 'name').text = db_dataset.name
-    labels = ET.SubElement(task, 'labels')
-    class_names = sorted(list(set(ann.class_label for img in db_dataset.images for ann in img.annotations)))
-    for name in class_names:
-        label = ET.SubElement(labels, 'label')
-        ET.SubElement(label, 'name').text = name
-
-    for image in db_dataset.images:
-        try:
-            img_path = os.path.join(UPLOAD_DIRECTORY, image.file_path)
-            with PILImage.open(img_path) as img:
-                img_width, img_height = img.size
-        except FileNotFoundError:
-            img_width, img_height = 0, 0
-            
-        image_element = ET.SubElement(root, 'image', id=str(image.id), name=image.file_name, width=str(img_width), height=str(img_height))
-        
-        for ann in image.annotations:
-            ann_attrs = {
-                "label": ann.class_label,
-                "occluded": "0",
-                "source": "model",
-            }
-            
-            if ann.annotation_type == 'segmentation':
-                points_list = []
-                for p in ann.geometry: 
-                    x_abs = p[0] * img_width
-                    y_abs = p[1] * img_height
-                    points_list.append(f"{x_abs:.2f},{y_abs:.2f}")
-                points_str = ";".join(points_list)
-                ann_attrs["points"] = points_str
-                ET.SubElement(image_element, 'polygon', ann_attrs)
-
-            else: # 'detection'
-                geo = ann.geometry
-                x_min = (geo['x'] - geo['width'] / 2) * img_width
-                y_min = (geo['y'] - geo['height'] / 2) * img_height
-                x_max = (geo['x'] + geo['width'] / 2) * img_width
-                y_max = (geo['y'] + geo['height'] / 2) * img_height
-                
-                ann_attrs["xtl"] = f"{x_min:.2f}"
-                ann_attrs["ytl"] = f"{y_min:.2f}"
-                ann_attrs["xbr"] = f"{x_max:.2f}"
-                ann_attrs["ybr"] = f"{y_max:.2f}"
-                ET.SubElement(image_element, 'box', ann_attrs)
-                
-    xml_str = ET.tostring(root, 'utf-8')
-    pretty_xml_str = minidom.parseString(xml_str).toprettyxml(indent="  ")
-    
-    zip_buffer = io.BytesIO()
-    with zipfile.ZipFile(zip_buffer, 'w', zipfile.ZIP_DEFLATED) as zip_file:
-        zip_file.writestr("annotations.xml", pretty_xml_str)
-        
-    zip_buffer.seek(0)
-    return zip_buffer.getvalue()
\ No newline at end of file
+def export_annotations_labelme(db: Session, db_dataset: Dataset):
+    return _export_annotations(db, db_dataset, "labelme")
+
+def export_annotations_coco(db: Session, db_dataset: Dataset, pretty: bool = True):
+    return _export_annotations(db, db_dataset, "coco", pretty=pretty)
+
+def export_annotations_cvat(db: Session, db_dataset: Dataset, pretty: bool = True):
+    return _export_annotations(db, db_dataset, "cvat", pretty=pretty)
@@ -0,0 +1,221 @@
+from typing import Dict, List, Tuple
+from sqlalchemy import Integer, case, cast, func, insert
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.models.dataset import Dataset, DatasetClassCount, Image
+from app.models.annotation import Annotation
+
+# --- Contagens por classe materializadas ---
+
+# Por classe: (nº de anotações, nº de anotações com confiança, soma das confianças).
+# A média é a soma a dividir pelas que têm confiança, como o AVG(confidence) do SQL
+ClassCounts = Tuple[int, int, float]
+
+def _class_count_columns():
+    return (
+        func.count(Annotation.id),
+        func.count(Annotation.confidence),
+        func.coalesce(func.sum(Annotation.confidence), 0.0),
+    )
+
+def _count_by_class(db: Session, image_ids: List[int]) -> Dict[str, ClassCounts]:
+    rows = db.query(Annotation.class_label, *_class_count_columns()).filter(
+        Annotation.image_id.in_(image_ids), Annotation.class_label.isnot(None)
+    ).group_by(Annotation.class_label)
+    return {
+        label: (count, confidence_count, float(confidence_sum))
+        for label, count, confidence_count, confidence_sum in rows
+    }
+
+# INSERT ... ON CONFLICT de cada dialeto suportado
+_DIALECT_INSERTS = {"postgresql": postgresql.insert, "sqlite": sqlite.insert}
+
+def _upsert_class_counts(db: Session, values: List[dict]):
+    """
+    Soma as contagens às linhas existentes ou cria-as, numa única instrução
+    (INSERT ... ON CONFLICT DO UPDATE): duas tarefas que criem a mesma classe
+    ao mesmo tempo não colidem na chave primária.
+    """
+    dialect = db.get_bind().dialect.name
+    if dialect not in _DIALECT_INSERTS:
+        raise NotImplementedError(f"Contagens materializadas não suportadas no dialeto {dialect}.")
+    stmt = _DIALECT_INSERTS[dialect](DatasetClassCount)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[DatasetClassCount.dataset_id, DatasetClassCount.class_label],
+        set_={
+            "annotation_count": DatasetClassCount.annotation_count + stmt.excluded.annotation_count,
+            "confidence_count": DatasetClassCount.confidence_count + stmt.excluded.confidence_count,
+            "confidence_sum": DatasetClassCount.confidence_sum + stmt.excluded.confidence_sum,
+        },
+    )
+    db.execute(stmt, values)
+
+def apply_class_count_deltas(db: Session, dataset_id: int, deltas: Dict[str, ClassCounts]):
+    """
+    Soma (ou subtrai) as diferenças de contagem/confiança de cada classe.
+    Tudo é relativo (coluna + delta, ou upsert para as classes que podem ser
+    novas), por isso duas tarefas em paralelo não se sobrepõem. Não faz commit.
+    """
+    upserts = []
+    # Ordem fixa das classes: transações concorrentes bloqueiam as linhas pela mesma ordem
+    for class_label, (count_delta, confidence_count_delta, confidence_delta) in sorted(deltas.items()):
+        if count_delta == 0 and confidence_count_delta == 0 and confidence_delta == 0:
+            continue
+        if count_delta > 0:
+            upserts.append({
+                "dataset_id": dataset_id,
+                "class_label": class_label,
+                "annotation_count": count_delta,
+                "confidence_count": confidence_count_delta,
+                "confidence_sum": confidence_delta,
+            })
+            continue
+        # Sem anotações novas, a linha já existe (ou não há nada a subtrair)
+        db.query(DatasetClassCount).filter(
+            DatasetClassCount.dataset_id == dataset_id,
+            DatasetClassCount.class_label == class_label
+        ).update({
+            DatasetClassCount.annotation_count: DatasetClassCount.annotation_count + count_delta,
+            DatasetClassCount.confidence_count: DatasetClassCount.confidence_count + confidence_count_delta,
+            DatasetClassCount.confidence_sum: DatasetClassCount.confidence_sum + confidence_delta,
+        }, synchronize_session=False)
+    if upserts:
+        _upsert_class_counts(db, upserts)
+
+    db.query(DatasetClassCount).filter(
+        DatasetClassCount.dataset_id == dataset_id, DatasetClassCount.annotation_count <= 0
+    ).delete(synchronize_session=False)
+
+def record_annotations_replaced(db: Session, dataset_id: int, image_ids: List[int], new_rows: List[dict]):
+    """
+    Atualiza as contagens materializadas antes de as anotações das imagens
+    indicadas serem substituídas por new_rows. Tem de correr antes do DELETE.
+    """
+    if not settings.DATASET_STATS_MATERIALIZED:
+        return
+
+    deltas: Dict[str, ClassCounts] = {}
+    for class_label, (count, confidence_count, confidence_sum) in _count_by_class(db, image_ids).items():
+        deltas[class_label] = (-count, -confidence_count, -confidence_sum)
+    _add_row_deltas(deltas, new_rows)
+
+    apply_class_count_deltas(db, dataset_id, deltas)
+
+def record_annotations_added(db: Session, dataset_id: int, new_rows: List[dict]):
+    """Atualiza as contagens materializadas com anotações acrescentadas (sem substituir nenhuma)."""
+    if not settings.DATASET_STATS_MATERIALIZED:
+        return
+
+    deltas: Dict[str, ClassCounts] = {}
+    _add_row_deltas(deltas, new_rows)
+    apply_class_count_deltas(db, dataset_id, deltas)
+
+def _add_row_deltas(deltas: Dict[str, ClassCounts], rows: List[dict]):
+    for row in rows:
+        class_label = row.get("class_label")
+        if class_label is None:
+            continue
+        count, confidence_count, confidence_sum = deltas.get(class_label, (0, 0, 0.0))
+        # Anotações sem confiança (manuais, LabelMe/CVAT importados) contam, mas não entram na média
+        confidence = row.get("confidence")
+        if confidence is None:
+            deltas[class_label] = (count + 1, confidence_count, confidence_sum)
+        else:
+            deltas[class_label] = (count + 1, confidence_count + 1, confidence_sum + confidence)
+
+def rebuild_class_counts(db: Session, dataset_id: int):
+    """Recalcula do zero as contagens materializadas de um dataset. Não faz commit."""
+    db.query(DatasetClassCount).filter(DatasetClassCount.dataset_id == dataset_id).delete(synchronize_session=False)
+    rows = db.query(Annotation.class_label, *_class_count_columns()).join(Image).filter(
+        Image.dataset_id == dataset_id, Annotation.class_label.isnot(None)
+    ).group_by(Annotation.class_label)
+    values = [
+        {"dataset_id": dataset_id, "class_label": label, "annotation_count": count,
+         "confidence_count": confidence_count, "confidence_sum": float(confidence_sum)}
+        for label, count, confidence_count, confidence_sum in rows
+    ]
+    if values:
+        db.execute(insert(DatasetClassCount), values)
+
+# --- Estatísticas do dataset ---
+
+def _get_class_counts(db: Session, dataset_id: int) -> List[dict]:
+    if settings.DATASET_STATS_MATERIALIZED:
+        rows = db.query(
+            DatasetClassCount.class_label, DatasetClassCount.annotation_count,
+            DatasetClassCount.confidence_count, DatasetClassCount.confidence_sum
+        ).filter(DatasetClassCount.dataset_id == dataset_id)
+    else:
+        rows = db.query(Annotation.class_label, *_class_count_columns()).join(Image).filter(
+            Image.dataset_id == dataset_id, Annotation.class_label.isnot(None)
+        ).group_by(Annotation.class_label)
+
+    class_counts = [
+        {
+            "class_label": label,
+            "count": count,
+            "mean_confidence": confidence_sum / confidence_count if confidence_count else None,
+        }
+        for label, count, confidence_count, confidence_sum in rows
+    ]
+    return sorted(class_counts, key=lambda item: (-item["count"], item["class_label"]))
+
+def _confidence_bucket(bins: int):
+    """
+    Índice do intervalo calculado na BD: FLOOR(confiança * bins), com a confiança
+    1.0 no último intervalo. (Um CAST direto arredonda no PostgreSQL e trunca no SQLite.)
+    """
+    index = func.floor(Annotation.confidence * bins)
+    return cast(case((index >= bins, bins - 1), (index < 0, 0), else_=index), Integer)
+
+def _get_confidence_histogram(db: Session, dataset_id: int, bins: int) -> List[dict]:
+    bucket = _confidence_bucket(bins)
+    rows = db.query(bucket, func.count(Annotation.id)).join(Image).filter(
+        Image.dataset_id == dataset_id, Annotation.confidence.isnot(None)
+    ).group_by(bucket)
+
+    counts = [0] * bins
+    for index, count in rows:
+        counts[index] += count
+    return [
+        {"lower": i / bins, "upper": (i + 1) / bins, "count": counts[i]}
+        for i in range(bins)
+    ]
+
+def get_dataset_stats(db: Session, db_dataset: Dataset, bins: int = 10) -> dict:
+    """
+    Estatísticas do dataset calculadas com agregações SQL (GROUP BY), sem
+    carregar imagens nem anotações para o ORM.
+    """
+    image_count = db.query(func.count(Image.id)).filter(Image.dataset_id == db_dataset.id).scalar() or 0
+
+    # Nº de anotações por imagem e, a partir daí, quantas imagens têm cada densidade
+    per_image = db.query(
+        Annotation.image_id, func.count(Annotation.id).label("annotation_count")
+    ).join(Image).filter(Image.dataset_id == db_dataset.id).group_by(Annotation.image_id).subquery()
+    density_rows = db.query(
+        per_image.c.annotation_count, func.count()
+    ).group_by(per_image.c.annotation_count).order_by(per_image.c.annotation_count).all()
+
+    annotated_image_count = sum(images for _, images in density_rows)
+    annotation_count = sum(annotations * images for annotations, images in density_rows)
+    unannotated_image_count = image_count - annotated_image_count
+
+    density = [{"annotations": annotations, "images": images} for annotations, images in density_rows]
+    if unannotated_image_count:
+        density.insert(0, {"annotations": 0, "images": unannotated_image_count})
+
+    return {
+        "dataset_id": db_dataset.id,
+        "image_count": image_count,
+        "annotated_image_count": annotated_image_count,
+        "unannotated_image_count": unannotated_image_count,
+        "annotation_count": annotation_count,
+        "mean_annotations_per_image": annotation_count / image_count if image_count else 0.0,
+        "max_annotations_per_image": density_rows[-1][0] if density_rows else 0,
+        "class_counts": _get_class_counts(db, db_dataset.id),
+        "density": density,
+        "confidence_histogram": _get_confidence_histogram(db, db_dataset.id, bins),
+    }
@@ -0,0 +1,141 @@
+import os
+import json
+import glob
+import hashlib
+import time
+import threading
+import zipfile
+from typing import Dict, Tuple
+from sqlalchemy.orm import Session
+
+from app.core import metrics, tracing
+from app.models.dataset import Dataset, Image
+from app.services import dataset_service
+
+EXPORT_FORMATS = ("yolo", "labelme", "coco", "cvat")
+
+# Formatos cujos fragmentos dependem do mapa de classes (IDs numéricos)
+CLASS_MAP_FORMATS = ("yolo", "coco")
+
+# Um lock por (dataset, formato) para que dois pedidos iguais não montem o mesmo .zip
+_locks: Dict[Tuple[int, str], threading.Lock] = {}
+_locks_guard = threading.Lock()
+
+def _get_lock(dataset_id: int, export_format: str) -> threading.Lock:
+    with _locks_guard:
+        return _locks.setdefault((dataset_id, export_format), threading.Lock())
+
+def _get_cache_dir(dataset_id: int, export_format: str, pretty: bool = True) -> str:
+    # A variante compacta tem fragmentos e artefactos próprios
+    variant = export_format if pretty else f"{export_format}.compact"
+    return os.path.join(dataset_service.EXPORT_CACHE_DIRECTORY, str(dataset_id), variant)
+
+def get_export_etag(db_dataset: Dataset, export_format: str, pretty: bool = True) -> str:
+    """ETag de uma exportação: muda sempre que a revisão do dataset muda."""
+    variant = "" if pretty else "-compact"
+    return f'"{db_dataset.id}-{export_format}-{db_dataset.annotation_revision}{variant}"'
+
+def _load_manifest(manifest_path: str) -> Dict[str, str]:
+    try:
+        with open(manifest_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+def _write_atomic(path: str, content: str):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(content)
+    os.replace(tmp_path, path)
+
+def _remove_superseded(cache_dir: str, fragments_dir: str, manifest: Dict[str, str]):
+    """
+    Apaga o que ficou obsoleto há pelo menos uma montagem: os artefactos anteriores
+    à revisão mais recente em cache e os fragmentos que o último manifesto já não usa.
+    O artefacto da revisão anterior fica em disco até à montagem seguinte, para que
+    um download ainda em curso (FileResponse) não perca o ficheiro.
+    """
+    artifacts = sorted(
+        glob.glob(os.path.join(cache_dir, "*.zip")),
+        key=lambda path: int(os.path.splitext(os.path.basename(path))[0]),
+    )
+    for old_artifact in artifacts[:-1]:
+        os.remove(old_artifact)
+    for fragment_path in glob.glob(os.path.join(fragments_dir, "*")):
+        if os.path.basename(fragment_path) not in manifest:
+            os.remove(fragment_path)
+
+def get_export_artifact(db: Session, db_dataset: Dataset, export_format: str, pretty: bool = True) -> str:
+    """
+    Devolve o caminho do .zip da exportação, montando-o apenas se a revisão
+    do dataset mudou. Só as imagens cuja revisão (ou mapa de classes) mudou
+    têm o seu fragmento regenerado; as restantes são lidas do disco.
+    """
+    if export_format not in EXPORT_FORMATS:
+        raise ValueError(f"Formato de exportação desconhecido: {export_format}")
+
+    cache_dir = _get_cache_dir(db_dataset.id, export_format, pretty)
+    fragments_dir = os.path.join(cache_dir, "fragments")
+    manifest_path = os.path.join(cache_dir, "manifest.json")
+    artifact_path = os.path.join(cache_dir, f"{db_dataset.annotation_revision}.zip")
+
+    with tracing.span("export.build", dataset_id=db_dataset.id, format=export_format,
+                      revision=db_dataset.annotation_revision), _get_lock(db_dataset.id, export_format):
+        if os.path.exists(artifact_path):
+            print(f"Exportação {export_format} do dataset {db_dataset.id} servida do cache.")
+            tracing.set_attributes(cache_hit=True)
+            return artifact_path
+
+        build_start = time.perf_counter()
+        os.makedirs(fragments_dir, exist_ok=True)
+        manifest = _load_manifest(manifest_path)
+        _remove_superseded(cache_dir, fragments_dir, manifest)
+        new_manifest: Dict[str, str] = {}
+
+        class_names = dataset_service.get_export_class_names(db, db_dataset)
+        class_map = dataset_service.get_export_class_map(export_format, class_names)
+        classes_key = ""
+        if export_format in CLASS_MAP_FORMATS:
+            classes_key = hashlib.sha1("\n".join(class_names).encode("utf-8")).hexdigest()[:12]
+
+        rebuilt = 0
+
+        def iter_fragments():
+            nonlocal rebuilt
+            images = db.query(Image).filter(Image.dataset_id == db_dataset.id).order_by(Image.id)
+            for image in images:
+                image_key = str(image.id)
+                fragment_key = f"{image.annotation_revision}:{classes_key}"
+                fragment_path = os.path.join(fragments_dir, image_key)
+
+                fragment = None
+                if manifest.get(image_key) == fragment_key:
+                    try:
+                        with open(fragment_path, "r", encoding="utf-8") as f:
+                            fragment = f.read()
+                    except FileNotFoundError:
+                        fragment = None
+
+                if fragment is None:
+                    # Fragmento sujo: só aqui as anotações da imagem são carregadas
+                    fragment = dataset_service.build_export_fragment(export_format, image, class_map, pretty=pretty)
+                    _write_atomic(fragment_path, fragment)
+                    rebuilt += 1
+
+                new_manifest[image_key] = fragment_key
+                yield image, fragment
+
+        tmp_artifact_path = f"{artifact_path}.tmp"
+        with zipfile.ZipFile(tmp_artifact_path, 'w', zipfile.ZIP_DEFLATED) as zip_file:
+            dataset_service.write_export_archive(
+                zip_file, export_format, db_dataset, class_names, iter_fragments(), pretty=pretty
+            )
+        os.replace(tmp_artifact_path, artifact_path)
+        metrics.EXPORT_SECONDS.labels(format=export_format).observe(time.perf_counter() - build_start)
+        metrics.EXPORT_BYTES.labels(format=export_format).observe(os.path.getsize(artifact_path))
+        _write_atomic(manifest_path, json.dumps(new_manifest))
+
+        tracing.set_attributes(cache_hit=False, fragments=len(new_manifest), fragments_rebuilt=rebuilt)
+        print(f"Exportação {export_format} do dataset {db_dataset.id}: "
+              f"{rebuilt} de {len(new_manifest)} fragmentos regenerados.")
+        return artifact_path
@@ -0,0 +1,116 @@
+import os
+import time
+import uuid
+import shutil
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+from fastapi import HTTPException
+
+from app.core import tracing
+from app.core.config import settings
+from app.core.database import BackgroundSession
+from app.core.metrics import BACKGROUND_QUEUE_DEPTH
+from app.models.dataset import Dataset
+from app.services import dataset_service, export_cache_service
+from app.services.job_registry import JobRegistry
+
+# Onde ficam os .zip das tarefas concluídas (independentes do cache de exportação) e o seu estado
+EXPORT_JOBS_DIRECTORY = "export_jobs"
+
+_executor = ThreadPoolExecutor(max_workers=settings.EXPORT_JOB_WORKERS, thread_name_prefix="export-job")
+
+_registry = JobRegistry(
+    EXPORT_JOBS_DIRECTORY, "EXPORT_ARTIFACT_TTL_SECONDS", not_found_detail="Tarefa de exportação não encontrada."
+)
+
+def _run_export_job(job_id: str):
+    """
+    Executa a exportação num worker do pool, com a sua própria sessão de BD.
+    """
+    job = _registry.update(job_id, status="running")
+    if job is None:
+        BACKGROUND_QUEUE_DEPTH.labels(queue="export_jobs").dec()
+        return
+
+    with tracing.use_context(job["trace_context"]), tracing.span(
+        "export.job", job_id=job_id, dataset_id=job["dataset_id"], format=job["export_format"]
+    ):
+        _build_job_artifact(job_id, job)
+
+def _build_job_artifact(job_id: str, job: dict):
+    """Monta (ou reaproveita do cache) o .zip da tarefa e atualiza o seu estado."""
+    db = BackgroundSession()
+    try:
+        db_dataset = dataset_service.get_dataset(db, dataset_id=job["dataset_id"])
+        if not db_dataset:
+            raise ValueError(f"Dataset {job['dataset_id']} não encontrado")
+
+        cached_path = export_cache_service.get_export_artifact(
+            db, db_dataset=db_dataset, export_format=job["export_format"], pretty=job["pretty"]
+        )
+
+        # O artefacto do cache é apagado quando a revisão muda; a tarefa guarda a sua própria cópia
+        os.makedirs(_registry.directory, exist_ok=True)
+        artifact_path = _registry.get_path(job_id, ".zip")
+        try:
+            os.link(cached_path, artifact_path)
+        except OSError:
+            shutil.copyfile(cached_path, artifact_path)
+
+        size = os.path.getsize(artifact_path)
+        _registry.update(job_id, artifact_path=artifact_path, size=size, status="done", finished_at=time.time())
+        print(f"Tarefa de exportação {job_id} concluída ({size} bytes).")
+
+    except Exception as e:
+        print(f"Erro na tarefa de exportação {job_id}: {e}")
+        _registry.update(job_id, status="failed", error=str(e), finished_at=time.time())
+    finally:
+        BACKGROUND_QUEUE_DEPTH.labels(queue="export_jobs").dec()
+        BackgroundSession.remove()
+
+def submit_export_job(db_dataset: Dataset, export_format: str, pretty: bool = True) -> dict:
+    """
+    Cria (ou reaproveita) uma tarefa de exportação para a revisão atual do dataset.
+    """
+    if export_format not in export_cache_service.EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"Formato de exportação desconhecido: {export_format}")
+
+    _registry.cleanup_expired()
+
+    # Pedidos iguais (dataset, formato, variante, revisão) partilham a mesma tarefa
+    key = (db_dataset.id, export_format, pretty, db_dataset.annotation_revision)
+    job, created = _registry.add({
+        "id": uuid.uuid4().hex,
+        "dataset_id": db_dataset.id,
+        "owner_id": db_dataset.owner_id,
+        "export_format": export_format,
+        "pretty": pretty,
+        "revision": db_dataset.annotation_revision,
+        "status": "pending",
+        "error": None,
+        "size": None,
+        "artifact_path": None,
+        "filename": f"{db_dataset.name.replace(' ', '_')}_{export_format}.zip",
+        "created_at": time.time(),
+        "finished_at": None,
+        # Contexto do pedido que criou a tarefa, para o worker ficar no mesmo trace
+        "trace_context": tracing.inject_context(),
+    }, key=key)
+
+    if created:
+        BACKGROUND_QUEUE_DEPTH.labels(queue="export_jobs").inc()
+        _executor.submit(_run_export_job, job["id"])
+    return job
+
+def get_export_job(job_id: str, owner_id: int) -> dict:
+    """
+    Obtém o estado de uma tarefa, verificando se o usuário é o proprietário.
+    """
+    return _registry.get(job_id, owner_id)
+
+def get_artifact_path(job_id: str, owner_id: int) -> Optional[str]:
+    """Caminho do .zip de uma tarefa concluída (None se ainda não terminou)."""
+    job = get_export_job(job_id, owner_id=owner_id)
+    if job["status"] != "done" or not os.path.exists(job["artifact_path"]):
+        return None
+    return job["artifact_path"]
@@ -1,50 +1,104 @@
 from ultralytics import YOLO
 from ultralytics.models.sam import SAM
+from ultralytics.engine.results import Boxes
+from torchvision.ops import batched_nms
+import cv2
+import numpy as np
+from PIL import Image as PILImage
+import torch
 from sqlalchemy.orm import Session
 import io
+import struct
 import zipfile
 import os
-from typing import List, Optional, Dict, Any
+import time
+import threading
+from typing import List, Optional, Dict, Any, Tuple
 
 from app.models.dataset import Image
-from app.models.annotation import Annotation
-from app.services import custom_model_service
-from app.core.database import SessionLocal
+from app.services import custom_model_service, model_metadata_service
+from app.services.stub_inference import StubModel
+from app.core.config import settings
+from app.core import metrics, tracing
+
+# IDs dos modelos padrão (os restantes são IDs de CustomModel)
+STANDARD_MODEL_IDS = ("yolov8n_det", "yolov8n_seg", "sam")
+
+# Argumentos da chamada ao modelo quando o dataset não define outros
+# (os mesmos valores por omissão das colunas do Dataset)
+DEFAULT_INFERENCE_ARGS = {"conf": 0.10, "iou": 0.7, "max_det": 300, "half": False}
 
 # --- Cache para Modelos Customizados ---
 custom_model_cache: Dict[str, Any] = {}
 
-# --- Modelos Padrão ---
+# --- Modelos Padrão (carregados na primeira utilização) ---
 MODEL_DIR = "ia_models"
-detection_model = YOLO(os.path.join(MODEL_DIR, 'yolov8n.pt'))
-segmentation_model = YOLO(os.path.join(MODEL_DIR, 'yolov8n-seg.pt'))
-sam_model = SAM(os.path.join(MODEL_DIR, 'sam_b.pt'))
+STANDARD_MODEL_FILES = {
+    "yolov8n_det": ("yolov8n.pt", YOLO),
+    "yolov8n_seg": ("yolov8n-seg.pt", YOLO),
+    "sam": ("sam_b.pt", SAM),
+}
+_standard_models: Dict[str, Any] = {}
+_standard_models_lock = threading.Lock()
+
+def get_standard_model(model_id: str):
+    """Devolve um modelo padrão, carregando-o do disco apenas na primeira chamada."""
+    model = _standard_models.get(model_id)
+    if model is None:
+        with _standard_models_lock:
+            model = _standard_models.get(model_id)
+            if model is None:
+                file_name, model_class = STANDARD_MODEL_FILES[model_id]
+                start = time.perf_counter()
+                if settings.INFERENCE_BACKEND == "stub":
+                    model = StubModel()
+                else:
+                    model = model_class(os.path.join(MODEL_DIR, file_name))
+                metrics.MODEL_LOAD_SECONDS.labels(model=model_id).observe(time.perf_counter() - start)
+                print(f"Modelo padrão {model_id} carregado em {time.perf_counter() - start:.2f}s")
+                _standard_models[model_id] = model
+    return model
 
-def _get_model(model_path: str):
+def _get_model(model_path: str, task: Optional[str] = None):
     """
     Função auxiliar para carregar e fazer cache de modelos customizados.
+    O task só é preciso para as variantes ONNX (um .pt já o traz).
     """
     if model_path in custom_model_cache:
-        print(f"Carregando modelo customizado do cache: {model_path}")
+        metrics.MODEL_CACHE_REQUESTS.labels(result="hit").inc()
         return custom_model_cache[model_path]
     
+    metrics.MODEL_CACHE_REQUESTS.labels(result="miss").inc()
+    if settings.INFERENCE_BACKEND == "stub":
+        custom_model_cache[model_path] = StubModel()
+        return custom_model_cache[model_path]
+
     print(f"Carregando modelo customizado do disco: {model_path}")
     if not os.path.exists(model_path):
         print(f"Erro: Modelo customizado não encontrado em {model_path}")
         return None
         
-    model = YOLO(model_path)
+    start = time.perf_counter()
+    model = YOLO(model_path, task=task)
+    metrics.MODEL_LOAD_SECONDS.labels(model="custom").observe(time.perf_counter() - start)
     custom_model_cache[model_path] = model
     return model
 
-def run_model_on_image(
-    image_path: str, 
-    model_type: str, # Recebe 'yolov8n_det', 'sam', ou um ID '1'
+def evict_custom_model(model_path: str):
+    """Tira um modelo do cache (ex.: a variante INT8 que vai ser refeita)."""
+    custom_model_cache.pop(model_path, None)
+
+def _select_model(
+    db: Session,
+    model_type: str,
     selected_classes: Optional[List[str]] = None,
-    owner_id: Optional[int] = None
+    owner_id: Optional[int] = None,
+    precision: str = "fp32"
 ):
     """
-    Carrega o modelo correto e executa-o com o filtro de classes.
+    Devolve (modelo, filter_args) para o model_type indicado, ou (None, {})
+    se o modelo não puder ser carregado. Com precision='int8', um modelo customizado
+    usa a sua variante quantizada, se já existir.
     """
     model = None
     model_names_map = None
@@ -53,46 +107,48 @@ def run_model_on_image(
 
     # 1. Determinar qual modelo carregar
     if model_type == "yolov8n_det":
-        model = detection_model
+        model = get_standard_model("yolov8n_det")
         model_names_map = model.names
         is_standard_model = True
     elif model_type == "yolov8n_seg":
-        model = segmentation_model
+        model = get_standard_model("yolov8n_seg")
         model_names_map = model.names
         is_standard_model = True
     elif model_type == "sam":
-        model = sam_model
-        model_names_map = detection_model.names 
+        model = get_standard_model("sam")
+        model_names_map = get_standard_model("yolov8n_det").names 
         is_standard_model = True
     else:
         # Lógica para Modelo Customizado (ex: model_type='1')
         if owner_id is None:
             print("Erro: owner_id é necessário para carregar um modelo customizado.")
-            return None
+            return None, {}
         try:
-            db_temp = SessionLocal()
-            
             custom_model = custom_model_service.get_model(
-                db_temp, 
+                db, 
                 model_id=int(model_type), 
                 owner_id=owner_id
             )
-            db_temp.close()
             
             if custom_model:
-                model = _get_model(custom_model.file_path) # Carrega o .pt
+                if precision == "int8" and custom_model.quantized_file_path:
+                    model = _get_model(custom_model.quantized_file_path, task=custom_model.task) # Variante INT8 (ONNX)
+                else:
+                    if precision == "int8":
+                        print(f"Aviso: o modelo {model_type} ainda não tem variante INT8. A usar FP32.")
+                    model = _get_model(custom_model.file_path) # Carrega o .pt
                 if model:
                     model_names_map = model.names
             else:
                  print(f"Erro: Modelo customizado com ID {model_type} não encontrado para o dono {owner_id}.")
-                 return None
+                 return None, {}
         except Exception as e:
             print(f"Erro ao carregar modelo customizado {model_type}: {e}")
-            return None
+            return None, {}
 
     if model is None:
         print(f"Não foi possível carregar o modelo para {model_type}")
-        return None
+        return None, {}
     
     if selected_classes and model_names_map and is_standard_model:
         class_indices = [
@@ -107,22 +163,53 @@ def run_model_on_image(
         print("Modelo customizado detectado. A anotar com todas as classes do modelo.")
         filter_args = {}
 
+    return model, filter_args
+
+def run_model_on_image(
+    db: Session,
+    image_path: str, 
+    model_type: str, # Recebe 'yolov8n_det', 'sam', ou um ID '1'
+    selected_classes: Optional[List[str]] = None,
+    owner_id: Optional[int] = None,
+    precision: str = "fp32",
+    inference_args: Optional[Dict[str, Any]] = None
+):
+    """
+    Carrega o modelo correto e executa-o com o filtro de classes e os
+    parâmetros de inferência do dataset (conf, iou, max_det, imgsz, half).
+    Usa a sessão de BD de quem chama (a da tarefa em segundo plano).
+    """
+    inference_args = inference_args or DEFAULT_INFERENCE_ARGS
+    with tracing.span("model.select", model_id=model_type):
+        model, filter_args = _select_model(db, model_type, selected_classes, owner_id=owner_id, precision=precision)
+    if model is None:
+        return None
+
+    # A imagem é lida uma vez (como o ultralytics faria, em BGR) e partilhada pelos modelos
+    with tracing.span("image.read", path=image_path):
+        frame = cv2.imread(image_path, cv2.IMREAD_COLOR)
+    if frame is None:
+        print(f"Não foi possível ler a imagem {image_path}")
+        return None
+
     # 4. Executar o pipeline de anotação
     if model_type == 'sam':
         print("Executando pipeline SAM (YOLOv8 -> SAM)...")
-        det_results_list = detection_model(image_path, verbose=False, **filter_args)
+        with tracing.span("model.yolo", model_id="yolov8n_det", prompts_for="sam"):
+            det_results_list = get_standard_model("yolov8n_det")(frame, verbose=False, **inference_args, **filter_args)
         if not det_results_list or not det_results_list[0].boxes:
              print("SAM: Nenhum objeto de 'prompt' (YOLO) encontrado.")
              return None
-        sam_results = sam_model.predict(image_path, bboxes=det_results_list[0].boxes.xyxy)
+        with tracing.span("model.sam", prompts=len(det_results_list[0].boxes)):
+            sam_results = model.predict(frame, bboxes=det_results_list[0].boxes.xyxy)
         if sam_results and sam_results[0].masks:
             sam_results[0].boxes = det_results_list[0].boxes 
         return sam_results[0]
         
     elif model:
         print(f"Executando modelo {model_type}...")
-        # Adicione conf=0.10 para forçar o modelo customizado a ser menos rígido no teste
-        results_list = model(image_path, verbose=False, conf=0.10, **filter_args)
+        with tracing.span("model.yolo", model_id=model_type):
+            results_list = model(frame, verbose=False, **inference_args, **filter_args)
         
         if not results_list:
             return None
@@ -130,106 +217,275 @@ def run_model_on_image(
         return results_list[0]
 
 
-def create_annotations_from_results(
-    db: Session, 
-    results: Any, 
-    db_image: Image, 
-    model_id: str, # 'yolov8n_det', 'sam', ou '1'
-    owner_id: Optional[int] = None
+# --- Inferência em mosaico (imagens muito grandes) ---
+
+class _PolygonMask:
+    """Máscara de um resultado em mosaico: só o polígono normalizado (como Masks.xyn)."""
+    def __init__(self, xyn: np.ndarray):
+        self.xyn = [xyn]
+
+class TiledResults:
+    """
+    Resultado da inferência em mosaico, já nas coordenadas da imagem inteira.
+    Expõe 'boxes' e 'masks' como os Results do ultralytics, para que o
+    build_annotation_rows os trate da mesma forma.
+    """
+    def __init__(self, boxes: Boxes, masks: Optional[List[_PolygonMask]] = None):
+        self.boxes = boxes
+        self.masks = masks
+
+def _get_tile_origins(length: int, tile_size: int, stride: int) -> List[int]:
+    """Posições iniciais dos mosaicos num eixo; o último fica encostado à margem."""
+    if length <= tile_size:
+        return [0]
+    origins = list(range(0, length - tile_size, stride))
+    origins.append(length - tile_size)
+    return origins
+
+def _read_image_size(image_path: str) -> Optional[Tuple[int, int]]:
+    """
+    (largura, altura) lidas do cabeçalho, sem descodificar os píxeis. Usa os
+    plugins do PIL como o PILImage.open, mas sem a verificação do MAX_IMAGE_PIXELS,
+    que recusaria as imagens grandes que o modo em mosaico existe para servir.
+    """
+    PILImage.init()
+    with open(image_path, "rb") as f:
+        prefix = f.read(16)
+        for format_id in PILImage.ID:
+            factory, accept = PILImage.OPEN[format_id]
+            if accept and accept(prefix) is not True:
+                continue
+            f.seek(0)
+            try:
+                return factory(f, image_path).size
+            except (SyntaxError, IndexError, TypeError, struct.error):
+                continue
+    return None
+
+def run_tiled_inference(
+    db: Session,
+    image_path: str,
+    model_type: str,
+    selected_classes: Optional[List[str]] = None,
+    owner_id: Optional[int] = None,
+    tile_size: int = 640,
+    tile_overlap: float = 0.2,
+    precision: str = "fp32",
+    inference_args: Optional[Dict[str, Any]] = None
 ):
     """
-    Salva as anotações na base de dados.
+    Corre o modelo em mosaicos sobrepostos da imagem (sem a reduzir ao
+    tamanho de entrada do modelo) e junta as deteções com NMS por classe,
+    eliminando os duplicados nas zonas de sobreposição.
+    A imagem é descodificada uma única vez, inteira, em memória (3 bytes por
+    píxel); cada mosaico é uma vista do array. Por isso as imagens com mais de
+    TILE_MAX_IMAGE_PIXELS são recusadas (None) antes de serem descodificadas.
+    """
+    if model_type == "sam":
+        # O pipeline SAM (prompts YOLO -> SAM) continua a correr na imagem inteira
+        print("Modo em mosaico não suportado para o SAM; a usar a imagem inteira.")
+        return run_model_on_image(
+            db, image_path, model_type, selected_classes, owner_id=owner_id, inference_args=inference_args
+        )
+    inference_args = inference_args or DEFAULT_INFERENCE_ARGS
+
+    with tracing.span("model.select", model_id=model_type):
+        model, filter_args = _select_model(db, model_type, selected_classes, owner_id=owner_id, precision=precision)
+    if model is None:
+        return None
+
+    size = _read_image_size(image_path)
+    if size is not None and size[0] * size[1] > settings.TILE_MAX_IMAGE_PIXELS:
+        print(
+            f"Imagem {image_path} demasiado grande para o modo em mosaico "
+            f"({size[0]}x{size[1]}, limite de {settings.TILE_MAX_IMAGE_PIXELS} píxeis)."
+        )
+        return None
+
+    # Lida com o OpenCV, como no modo normal: já em BGR e com a orientação EXIF aplicada.
+    # O PIL recusaria as imagens grandes (ortofotos, satélite) que este modo existe para
+    # servir, por passarem o MAX_IMAGE_PIXELS; o limite do OpenCV é CV_IO_MAX_IMAGE_PIXELS
+    with tracing.span("image.read", path=image_path):
+        frame = cv2.imread(image_path, cv2.IMREAD_COLOR)
+    if frame is None:
+        print(f"Não foi possível ler a imagem {image_path}")
+        return None
+    height, width = frame.shape[:2]
+
+    stride = max(int(tile_size * (1 - tile_overlap)), 1)
+    origins = [
+        (x, y)
+        for y in _get_tile_origins(height, tile_size, stride)
+        for x in _get_tile_origins(width, tile_size, stride)
+    ]
+    print(f"Executando modelo {model_type} em {len(origins)} mosaicos de {tile_size}px ({width}x{height})...")
+
+    all_boxes, all_scores, all_classes, all_polygons = [], [], [], []
+    for start in range(0, len(origins), settings.TILE_BATCH_SIZE):
+        batch_origins = origins[start:start + settings.TILE_BATCH_SIZE]
+        tiles = [frame[y:y + tile_size, x:x + tile_size] for x, y in batch_origins]
+        with tracing.span("model.yolo", model_id=model_type, tiles=len(tiles)):
+            results_list = model(tiles, verbose=False, **inference_args, **filter_args)
+
+        for (x, y), results in zip(batch_origins, results_list):
+            if results.boxes is None or len(results.boxes) == 0:
+                continue
+            offset = torch.tensor([x, y, x, y], dtype=results.boxes.xyxy.dtype, device=results.boxes.xyxy.device)
+            all_boxes.append(results.boxes.xyxy + offset)
+            all_scores.append(results.boxes.conf)
+            all_classes.append(results.boxes.cls)
+            if results.masks is not None:
+                all_polygons.extend(polygon + np.array([x, y], dtype=np.float32) for polygon in results.masks.xy)
+
+    if not all_boxes:
+        return TiledResults(Boxes(torch.zeros((0, 6)), (height, width)), masks=None)
+
+    boxes = torch.cat(all_boxes)
+    scores = torch.cat(all_scores)
+    classes = torch.cat(all_classes)
+    with tracing.span("tiles.nms", detections=len(boxes)):
+        keep = batched_nms(boxes.float(), scores.float(), classes.long(), settings.TILE_NMS_IOU)
+    # O max_det aplica-se à imagem inteira, não a cada mosaico
+    keep = keep[:inference_args.get("max_det", DEFAULT_INFERENCE_ARGS["max_det"])]
+    # O NMS devolve os índices por ordem decrescente de confiança
+    merged = torch.cat([boxes[keep], scores[keep, None], classes[keep, None]], dim=1).cpu()
+
+    masks = None
+    if all_polygons and len(all_polygons) == len(boxes):
+        scale = np.array([width, height], dtype=np.float32)
+        masks = [_PolygonMask(all_polygons[i] / scale) for i in keep.tolist()]
+
+    print(f"Mosaicos: {len(boxes)} deteções, {len(keep)} após NMS.")
+    return TiledResults(Boxes(merged, (height, width)), masks=masks)
+
+
+def _resolve_class_names(db: Session, model_id: str, owner_id: Optional[int] = None):
+    """
+    Devolve (class_names, annotation_type) para o model_id indicado.
+    Vem das classes do COCO (modelos padrão) ou dos metadados guardados no
+    upload (customizados); só os modelos antigos, ainda sem metadados, são carregados.
     """
-    if results is None:
-        print(f"Nenhum resultado para salvar para a imagem {db_image.file_name}")
-        return []
-        
-    new_annotations = []
     class_names = None
     annotation_type = ""
 
-    # 1. Determinar o mapa de classes (class_names)
     if model_id == "yolov8n_det":
-        class_names = detection_model.names
+        class_names = model_metadata_service.COCO_CLASS_NAMES
         annotation_type = "detection"
     elif model_id == "yolov8n_seg":
-        class_names = segmentation_model.names
+        class_names = model_metadata_service.COCO_CLASS_NAMES
         annotation_type = "segmentation"
     elif model_id == "sam":
-        class_names = detection_model.names
+        class_names = model_metadata_service.COCO_CLASS_NAMES
         annotation_type = "segmentation"
     else:
         # Lógica para Modelo Customizado
         if owner_id is None:
             print("Erro: owner_id é necessário para salvar resultados de modelo customizado.")
-            return []
+            return None, ""
         try:
-            db_temp = SessionLocal()
-
             custom_model = custom_model_service.get_model(
-                db_temp, 
+                db, 
                 model_id=int(model_id), 
                 owner_id=owner_id
             )
-            db_temp.close()
             if custom_model:
-                model = _get_model(custom_model.file_path)
-                if model:
-                    class_names = model.names
+                class_names = model_metadata_service.get_custom_model_class_names(custom_model)
+                if class_names is None:
+                    model = _get_model(custom_model.file_path)
+                    if model:
+                        class_names = model.names
                 annotation_type = custom_model.model_type # 'detection' ou 'segmentation'
         except Exception as e:
             print(f"Não foi possível carregar 'names' para o modelo customizado {model_id}: {e}")
 
+    return class_names, annotation_type
+
+
+def _select_detections(boxes: Boxes, min_confidence: float, max_detections: Optional[int]) -> torch.Tensor:
+    """
+    Índices das deteções a guardar, calculados sobre os tensores: abaixo da confiança
+    mínima ou além das max_detections mais confiantes, nada chega a ser convertido.
+    """
+    conf = boxes.conf
+    keep = torch.nonzero(conf >= min_confidence).flatten()
+    if max_detections is not None and len(keep) > max_detections:
+        keep = keep[conf[keep].argsort(descending=True)[:max_detections]]
+    return keep
+
+def build_annotation_rows(
+    db: Session,
+    results: Any, 
+    db_image: Image, 
+    model_id: str, # 'yolov8n_det', 'sam', ou '1'
+    owner_id: Optional[int] = None,
+    provenance: Optional[str] = None,
+    min_confidence: float = 0.0,
+    max_detections: Optional[int] = None
+) -> List[Dict[str, Any]]:
+    """
+    Converte os resultados do modelo em dicionários prontos para um INSERT em massa.
+    As deteções são filtradas (min_confidence, max_detections) antes da conversão, e os
+    campos das que ficam passam para Python de uma só vez (um .tolist() por tensor).
+    """
+    if results is None:
+        print(f"Nenhum resultado para salvar para a imagem {db_image.file_name}")
+        return []
+
+    # 1. Determinar o mapa de classes (class_names)
+    with tracing.span("class_names.resolve", model_id=model_id):
+        class_names, annotation_type = _resolve_class_names(db, model_id, owner_id=owner_id)
+
     if class_names is None or not annotation_type:
         print(f"Erro: Não foi possível determinar 'class_names' ou 'annotation_type' para o model_id {model_id}")
         return []
 
-    # 2. Salvar as anotações com base no tipo
+    rows = []
+
+    # 2. Converter as deteções com base no tipo
     if annotation_type == 'segmentation':
         if results.masks is None or results.boxes is None:
             print(f"Modelo {model_id} não produziu máscaras ou caixas.")
             return []
-            
-        for i, mask in enumerate(results.masks):
-            if i >= len(results.boxes): continue 
-            class_id = int(results.boxes[i].cls[0])
+
+        keep = _select_detections(results.boxes, min_confidence, max_detections)
+        keep = keep[keep < len(results.masks)].tolist()
+        class_ids = results.boxes.cls[keep].int().tolist()
+        confidences = results.boxes.conf[keep].tolist()
+        for i, class_id, confidence in zip(keep, class_ids, confidences):
             if class_id not in class_names:
                 print(f"Erro: class_id {class_id} não encontrado no mapa de classes.")
                 continue
             
-            db_annotation = Annotation(
-                annotation_type='segmentation', 
-                class_label=class_names[class_id],
-                confidence=float(results.boxes[i].conf[0]),
-                geometry=mask.xyn[0].tolist(),
-                image_id=db_image.id
-            )
-            db.add(db_annotation)
-            new_annotations.append(db_annotation)
+            rows.append({
+                "annotation_type": 'segmentation',
+                "class_label": class_names[class_id],
+                "confidence": confidence,
+                "geometry": results.masks[i].xyn[0].tolist(),
+                "provenance": provenance,
+                "image_id": db_image.id,
+            })
 
     elif annotation_type == 'detection': 
         if results.boxes is None:
             print("Resultados de detecção não contêm caixas.")
             return []
 
-        for box in results.boxes:
-            class_id = int(box.cls[0])
+        keep = _select_detections(results.boxes, min_confidence, max_detections)
+        class_ids = results.boxes.cls[keep].int().tolist()
+        confidences = results.boxes.conf[keep].tolist()
+        xywhn = results.boxes.xywhn[keep].tolist()
+        for class_id, confidence, (x, y, w, h) in zip(class_ids, confidences, xywhn):
             if class_id not in class_names:
                 print(f"Erro: class_id {class_id} não encontrado no mapa de classes.")
                 continue
             
-            x, y, w, h = box.xywhn[0]
-            geometry_data = {"x": float(x), "y": float(y), "width": float(w), "height": float(h)}
-            
-            db_annotation = Annotation(
-                annotation_type='detection',
-                class_label=class_names[class_id],
-                confidence=float(box.conf[0]),
-                geometry=geometry_data,
-                image_id=db_image.id
-            )
-            db.add(db_annotation)
-            new_annotations.append(db_annotation)
-            
-    print(f"Salvas {len(new_annotations)} novas anotações para a imagem {db_image.file_name}.")
-    return new_annotations
\ No newline at end of file
+            rows.append({
+                "annotation_type": 'detection',
+                "class_label": class_names[class_id],
+                "confidence": confidence,
+                "geometry": {"x": x, "y": y, "width": w, "height": h},
+                "provenance": provenance,
+                "image_id": db_image.id,
+            })
+
+    return rows
@@ -0,0 +1,117 @@
+import os
+import hmac
+import hashlib
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+from PIL import Image as PILImage, ImageOps
+
+from app.core.config import settings
+from app.core.metrics import BACKGROUND_QUEUE_DEPTH
+
+# Miniaturas/pré-visualizações geradas a partir dos originais em 'uploads'
+DERIVATIVE_DIRECTORY = "derivatives"
+
+# Variante -> lado maior, em píxeis
+DERIVATIVE_SIZES = {
+    "thumbnail": settings.THUMBNAIL_SIZE,
+    "preview": settings.PREVIEW_SIZE,
+}
+
+_FORMATS = {
+    "webp": ("WEBP", "image/webp"),
+    "jpeg": ("JPEG", "image/jpeg"),
+}
+DERIVATIVE_EXTENSION = settings.DERIVATIVE_FORMAT.lower()
+DERIVATIVE_MEDIA_TYPE = _FORMATS[DERIVATIVE_EXTENSION][1]
+
+_executor = ThreadPoolExecutor(max_workers=settings.DERIVATIVE_WORKERS, thread_name_prefix="derivatives")
+
+# Evita que o worker e um pedido "lazy" gerem a mesma imagem ao mesmo tempo. Conjunto
+# fixo de locks (a imagem usa o de índice image_id % N): nunca é preciso apagar um lock
+# que ainda tenha threads à espera, e a memória não cresce com o nº de imagens
+_LOCK_STRIPES = 64
+_image_locks = [threading.Lock() for _ in range(_LOCK_STRIPES)]
+
+def _get_lock(image_id: int) -> threading.Lock:
+    return _image_locks[image_id % _LOCK_STRIPES]
+
+def get_derivative_token(image_id: int, variant: str) -> str:
+    """
+    Token (HMAC com a SECRET_KEY) que autoriza o acesso a uma variante. Os IDs das
+    imagens são sequenciais: sem o token, percorrê-los daria acesso às imagens de todos.
+    """
+    message = f"{image_id}:{variant}".encode("utf-8")
+    return hmac.new(settings.SECRET_KEY.encode("utf-8"), message, hashlib.sha256).hexdigest()[:32]
+
+def is_valid_derivative_token(image_id: int, variant: str, token: str) -> bool:
+    return hmac.compare_digest(get_derivative_token(image_id, variant), token)
+
+def get_derivative_url(image_id: int, variant: str) -> str:
+    """URL da variante, já com o token: é o que os clientes usam em <img> (sem cabeçalho Authorization)."""
+    return f"/images/{image_id}/{variant}?token={get_derivative_token(image_id, variant)}"
+
+def get_derivative_path(dataset_id: int, image_id: int, variant: str) -> str:
+    return os.path.join(DERIVATIVE_DIRECTORY, str(dataset_id), variant, f"{image_id}.{DERIVATIVE_EXTENSION}")
+
+def _save_atomic(img: PILImage.Image, derivative_path: str, pil_format: str):
+    """Grava num ficheiro temporário exclusivo (mkstemp) da mesma pasta e só depois o move para o lugar."""
+    directory = os.path.dirname(derivative_path)
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            img.save(f, format=pil_format, quality=settings.DERIVATIVE_QUALITY)
+        os.replace(tmp_path, derivative_path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
+def generate_derivatives(dataset_id: int, image_id: int, source_path: str) -> bool:
+    """
+    Gera todas as variantes de uma imagem com uma única descodificação:
+    a maior primeiro e as menores a partir dela.
+    """
+    with _get_lock(image_id):
+        try:
+            if all(os.path.exists(get_derivative_path(dataset_id, image_id, v)) for v in DERIVATIVE_SIZES):
+                return True
+
+            with PILImage.open(source_path) as img:
+                largest = max(DERIVATIVE_SIZES.values())
+                # Nos JPEG, o draft descodifica já reduzido (escala DCT), muito mais barato
+                img.draft("RGB", (largest, largest))
+                img = ImageOps.exif_transpose(img)
+                if img.mode not in ("RGB", "L"):
+                    img = img.convert("RGB")
+
+                pil_format = _FORMATS[DERIVATIVE_EXTENSION][0]
+                for variant, size in sorted(DERIVATIVE_SIZES.items(), key=lambda item: -item[1]):
+                    img.thumbnail((size, size))
+                    derivative_path = get_derivative_path(dataset_id, image_id, variant)
+                    _save_atomic(img, derivative_path, pil_format)
+            return True
+        except Exception as e:
+            print(f"Erro ao gerar miniaturas para a imagem {image_id}: {e}")
+            return False
+
+def schedule_derivatives(dataset_id: int, image_id: int, source_path: str):
+    """Agenda a geração das variantes no pool de workers (não bloqueia o pedido)."""
+    queue_depth = BACKGROUND_QUEUE_DEPTH.labels(queue="derivatives")
+    queue_depth.inc()
+    future = _executor.submit(generate_derivatives, dataset_id, image_id, source_path)
+    future.add_done_callback(lambda _: queue_depth.dec())
+
+def get_or_create_derivative(dataset_id: int, image_id: int, source_path: str, variant: str) -> Optional[str]:
+    """
+    Devolve o caminho da variante pedida, gerando-a na hora se estiver em falta.
+    """
+    derivative_path = get_derivative_path(dataset_id, image_id, variant)
+    if os.path.exists(derivative_path):
+        return derivative_path
+    if not os.path.exists(source_path):
+        return None
+    if not generate_derivatives(dataset_id, image_id, source_path):
+        return None
+    return derivative_path
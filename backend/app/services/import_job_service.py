@@ -0,0 +1,119 @@
+import os
+import time
+import uuid
+import shutil
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from fastapi import HTTPException, UploadFile
+
+from app.core import tracing
+from app.core.config import settings
+from app.core.database import BackgroundSession
+from app.core.metrics import BACKGROUND_QUEUE_DEPTH
+from app.models.dataset import Dataset
+from app.services import annotation_import_service, dataset_service
+from app.services.job_registry import JobRegistry
+
+# Onde ficam os .zip enviados, até a importação terminar, e o estado das tarefas
+IMPORT_JOBS_DIRECTORY = "import_jobs"
+
+_executor = ThreadPoolExecutor(max_workers=settings.IMPORT_JOB_WORKERS, thread_name_prefix="import-job")
+
+_registry = JobRegistry(
+    IMPORT_JOBS_DIRECTORY, "IMPORT_JOB_TTL_SECONDS", not_found_detail="Tarefa de importação não encontrada."
+)
+
+def _get_archive_path(job_id: str) -> str:
+    return _registry.get_path(job_id, ".zip")
+
+def _run_import_job(job_id: str):
+    """
+    Executa a importação num worker do pool, com a sua própria sessão de BD.
+    """
+    job = _registry.update(job_id, status="running")
+    if job is None:
+        BACKGROUND_QUEUE_DEPTH.labels(queue="import_jobs").dec()
+        return
+
+    with tracing.use_context(job["trace_context"]), tracing.span(
+        "import.job", job_id=job_id, dataset_id=job["dataset_id"], format=job["import_format"]
+    ):
+        _import_archive(job_id, job)
+
+def _import_archive(job_id: str, job: dict):
+    """Importa o arquivo da tarefa e vai atualizando o relatório a cada lote gravado."""
+    db = BackgroundSession()
+
+    def progress(report: dict):
+        _registry.update(job_id, **report)
+
+    try:
+        db_dataset = dataset_service.get_dataset(db, dataset_id=job["dataset_id"])
+        if not db_dataset:
+            raise ValueError(f"Dataset {job['dataset_id']} não encontrado")
+
+        report = annotation_import_service.import_annotations(
+            db, db_dataset, _get_archive_path(job_id), job["import_format"], progress=progress
+        )
+        tracing.set_attributes(annotations=report["annotations_imported"])
+        _registry.update(job_id, **report, status="done", finished_at=time.time())
+
+    except Exception as e:
+        print(f"Erro na tarefa de importação {job_id}: {e}")
+        db.rollback()
+        _registry.update(job_id, status="failed", error=str(e), finished_at=time.time())
+    finally:
+        BACKGROUND_QUEUE_DEPTH.labels(queue="import_jobs").dec()
+        BackgroundSession.remove()
+        try:
+            os.remove(_get_archive_path(job_id))
+        except FileNotFoundError:
+            pass
+
+def submit_import_job(db_dataset: Dataset, import_format: str, file: UploadFile) -> dict:
+    """
+    Guarda o .zip enviado e agenda a sua importação para o dataset.
+    """
+    if import_format not in annotation_import_service.IMPORT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"Formato de importação desconhecido: {import_format}")
+
+    _registry.cleanup_expired()
+
+    job_id = uuid.uuid4().hex
+    archive_path = _get_archive_path(job_id)
+    os.makedirs(_registry.directory, exist_ok=True)
+    with open(archive_path, "wb") as buffer:
+        shutil.copyfileobj(file.file, buffer)
+    if not zipfile.is_zipfile(archive_path):
+        os.remove(archive_path)
+        raise HTTPException(status_code=400, detail="O ficheiro enviado não é um arquivo .zip válido.")
+
+    job = {
+        "id": job_id,
+        "dataset_id": db_dataset.id,
+        "owner_id": db_dataset.owner_id,
+        "import_format": import_format,
+        "status": "pending",
+        "error": None,
+        "images_matched": 0,
+        "images_unmatched": 0,
+        "annotations_imported": 0,
+        "annotations_skipped": 0,
+        "elapsed_seconds": 0.0,
+        "annotations_per_second": 0.0,
+        "created_at": time.time(),
+        "finished_at": None,
+        # Contexto do pedido que criou a tarefa, para o worker ficar no mesmo trace
+        "trace_context": tracing.inject_context(),
+    }
+    job, _ = _registry.add(job)
+
+    BACKGROUND_QUEUE_DEPTH.labels(queue="import_jobs").inc()
+    _executor.submit(_run_import_job, job_id)
+    return job
+
+def get_import_job(job_id: str, owner_id: int) -> dict:
+    """
+    Obtém o estado de uma tarefa, verificando se o usuário é o proprietário.
+    """
+    return _registry.get(job_id, owner_id)
@@ -0,0 +1,197 @@
+import os
+import glob
+import json
+import time
+import tempfile
+import threading
+from typing import Any, Dict, Hashable, Optional, Tuple
+from fastapi import HTTPException
+
+from app.core.config import settings
+
+# Intervalo mínimo entre duas limpezas de tarefas expiradas (a limpeza corre nas consultas)
+CLEANUP_INTERVAL_SECONDS = 60
+# Cada processo toca no JSON das suas tarefas por terminar a este intervalo (heartbeat)
+HEARTBEAT_INTERVAL_SECONDS = 10
+# Uma tarefa por terminar cujo JSON não é tocado há este tempo já não tem worker vivo
+ORPHANED_AFTER_SECONDS = 6 * HEARTBEAT_INTERVAL_SECONDS
+ORPHANED_JOB_ERROR = "A tarefa foi interrompida por um reinício do servidor. Submeta-a de novo."
+
+class JobRegistry:
+    """
+    Registo das tarefas em segundo plano (exportações, importações).
+
+    Cada tarefa vive em memória no processo que a executa e o seu estado é
+    gravado em <pasta>/<job_id>.json, ao lado dos ficheiros da tarefa, a cada
+    alteração. Assim, com vários workers do uvicorn a partilhar a pasta, qualquer
+    um responde ao estado e ao download de uma tarefa, mesmo que tenha sido
+    outro a criá-la. O processo dono toca periodicamente no JSON das tarefas por
+    terminar; uma tarefa "pending"/"running" cujo JSON deixou de ser tocado (o
+    worker morreu ou o servidor reiniciou) é marcada como "failed" ao ser lida.
+    Limites: a tarefa corre no pool do worker que a recebeu e a deduplicação de
+    pedidos iguais (key) é por processo.
+    """
+
+    def __init__(self, directory: str, ttl_setting: str, not_found_detail: str):
+        self.directory = directory
+        self.ttl_setting = ttl_setting # Nome do setting com o tempo de vida, em segundos
+        self.not_found_detail = not_found_detail
+        self._jobs: Dict[str, dict] = {}
+        # Pedidos iguais partilham a mesma tarefa: key -> job_id
+        self._keys: Dict[Hashable, str] = {}
+        self._lock = threading.Lock()
+        self._last_cleanup = 0.0
+        self._heartbeat: Optional[threading.Thread] = None
+
+    def get_path(self, job_id: str, extension: str) -> str:
+        return os.path.join(self.directory, f"{job_id}{extension}")
+
+    def _save(self, job: dict):
+        """Grava o estado da tarefa (já com o lock). Escrita atómica: nunca se lê um JSON a meio."""
+        os.makedirs(self.directory, exist_ok=True)
+        # Nome temporário único: outro worker pode estar a gravar a mesma tarefa (ver _fail_if_orphaned)
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, prefix=f"{job['id']}.", suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(job, f)
+            os.replace(tmp_path, self.get_path(job["id"], ".json"))
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def _load(self, job_id: str) -> Optional[dict]:
+        try:
+            with open(self.get_path(job_id, ".json"), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def _start_heartbeat(self):
+        """Arranca (já com o lock) a thread que mantém vivas as tarefas deste processo."""
+        if self._heartbeat is None:
+            self._heartbeat = threading.Thread(
+                target=self._heartbeat_loop, name=f"job-heartbeat-{os.path.basename(self.directory)}", daemon=True
+            )
+            self._heartbeat.start()
+
+    def _heartbeat_loop(self):
+        while True:
+            time.sleep(HEARTBEAT_INTERVAL_SECONDS)
+            self.touch_unfinished()
+
+    def touch_unfinished(self):
+        """Marca como vivas (mtime do JSON) as tarefas por terminar deste processo."""
+        with self._lock:
+            for job in self._jobs.values():
+                if job["finished_at"] is not None:
+                    continue
+                try:
+                    os.utime(self.get_path(job["id"], ".json"))
+                except FileNotFoundError:
+                    self._save(job)
+
+    def _fail_if_orphaned(self, job: dict) -> dict:
+        """
+        Uma tarefa lida do JSON que ainda está por terminar, mas cujo heartbeat
+        parou, foi interrompida: grava-a como falhada para o cliente deixar de esperar.
+        """
+        if job.get("finished_at") is not None or job.get("status") not in ("pending", "running"):
+            return job
+        try:
+            last_heartbeat = os.path.getmtime(self.get_path(job["id"], ".json"))
+        except FileNotFoundError:
+            return job
+        if time.time() - last_heartbeat < ORPHANED_AFTER_SECONDS:
+            return job
+
+        print(f"Tarefa {job['id']} sem worker vivo (estado '{job['status']}'); marcada como falhada.")
+        job.update(status="failed", error=ORPHANED_JOB_ERROR, finished_at=time.time())
+        self._save(job)
+        return job
+
+    def add(self, job: dict, key: Optional[Hashable] = None) -> Tuple[dict, bool]:
+        """
+        Regista uma tarefa nova. Com key, devolve antes a tarefa igual já
+        existente (que não tenha falhado). Devolve (cópia da tarefa, criada?).
+        """
+        with self._lock:
+            existing_id = self._keys.get(key) if key is not None else None
+            if existing_id and self._jobs[existing_id]["status"] != "failed":
+                return dict(self._jobs[existing_id]), False
+
+            self._jobs[job["id"]] = job
+            if key is not None:
+                self._keys[key] = job["id"]
+            self._save(job)
+            self._start_heartbeat()
+            return dict(job), True
+
+    def update(self, job_id: str, **fields: Any) -> Optional[dict]:
+        """Altera o estado de uma tarefa e grava-o. None se a tarefa já expirou."""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return None
+            job.update(fields)
+            self._save(job)
+            return dict(job)
+
+    def get(self, job_id: str, owner_id: int) -> dict:
+        """
+        Obtém o estado de uma tarefa (deste processo ou, pelo JSON, de outro
+        worker), verificando se o usuário é o proprietário.
+        """
+        self.cleanup_expired()
+        with self._lock:
+            job = self._jobs.get(job_id)
+            job = dict(job) if job is not None else None
+        if job is None and os.path.basename(job_id) == job_id:
+            job = self._load(job_id)
+            if job is not None:
+                job = self._fail_if_orphaned(job)
+        if not job or job["owner_id"] != owner_id:
+            raise HTTPException(status_code=404, detail=self.not_found_detail)
+        return job
+
+    def cleanup_expired(self, force: bool = False):
+        """
+        Esquece as tarefas terminadas há mais do que o tempo de vida e apaga os
+        seus ficheiros, incluindo os que ficaram órfãos de um reinício do servidor.
+        Corre no máximo uma vez a cada CLEANUP_INTERVAL_SECONDS (exceto com force).
+        """
+        now = time.time()
+        with self._lock:
+            if not force and now - self._last_cleanup < CLEANUP_INTERVAL_SECONDS:
+                return
+            self._last_cleanup = now
+            expires_before = now - getattr(settings, self.ttl_setting)
+            for job_id in [
+                job_id for job_id, job in self._jobs.items()
+                if job["finished_at"] is not None and job["finished_at"] < expires_before
+            ]:
+                del self._jobs[job_id]
+                for key in [key for key, key_job_id in self._keys.items() if key_job_id == job_id]:
+                    del self._keys[key]
+            active_ids = set(self._jobs)
+
+        # Ficheiros das tarefas que este processo não conhece: de outro worker ou de antes de um reinício
+        paths_by_job: Dict[str, list] = {}
+        for path in glob.glob(os.path.join(self.directory, "*")):
+            job_id = os.path.basename(path).split(".", 1)[0]
+            if job_id not in active_ids:
+                paths_by_job.setdefault(job_id, []).append(path)
+
+        for job_id, paths in paths_by_job.items():
+            try:
+                state = self._load(job_id)
+                if state is not None and state.get("finished_at") is not None:
+                    expired = state["finished_at"] < expires_before
+                else:
+                    # Sem estado final (ainda a correr noutro worker, ou interrompida): conta a última escrita
+                    expired = all(os.path.getmtime(path) < expires_before for path in paths)
+                if expired:
+                    for path in paths:
+                        os.remove(path)
+            except FileNotFoundError:
+                pass
@@ -0,0 +1,108 @@
+import time
+from typing import Dict, List, Optional
+
+from sqlalchemy.orm import Session
+from ultralytics import YOLO
+
+from app.core.config import settings
+from app.core.database import BackgroundSession
+from app.models.custom_model import CustomModel
+
+# Estado dos metadados de um modelo customizado (extraídos em segundo plano após o upload)
+METADATA_STATUS_PENDING = "pending"
+METADATA_STATUS_READY = "ready"
+METADATA_STATUS_FAILED = "failed"
+
+# Classes do COCO, na ordem dos IDs dos modelos YOLOv8 pré-treinados
+COCO_CLASS_NAMES = {
+    i: name for i, name in enumerate([
+        "person", "bicycle", "car", "motorcycle", "airplane", "bus", "train", "truck", "boat",
+        "traffic light", "fire hydrant", "stop sign", "parking meter", "bench", "bird", "cat", "dog",
+        "horse", "sheep", "cow", "elephant", "bear", "zebra", "giraffe", "backpack", "umbrella",
+        "handbag", "tie", "suitcase", "frisbee", "skis", "snowboard", "sports ball", "kite",
+        "baseball bat", "baseball glove", "skateboard", "surfboard", "tennis racket", "bottle",
+        "wine glass", "cup", "fork", "knife", "spoon", "bowl", "banana", "apple", "sandwich", "orange",
+        "broccoli", "carrot", "hot dog", "pizza", "donut", "cake", "chair", "couch", "potted plant",
+        "bed", "dining table", "toilet", "tv", "laptop", "mouse", "remote", "keyboard", "cell phone",
+        "microwave", "oven", "toaster", "sink", "refrigerator", "book", "clock", "vase", "scissors",
+        "teddy bear", "hair drier", "toothbrush",
+    ])
+}
+
+# Metadados dos modelos padrão: todos usam as classes do COCO (o SAM recebe as caixas do YOLO)
+STANDARD_MODEL_METADATA = {
+    "yolov8n_det": {"task": "detect", "input_size": 640},
+    "yolov8n_seg": {"task": "segment", "input_size": 640},
+    "sam": {"task": "segment", "input_size": 1024},
+}
+
+# Tarefa do ultralytics -> model_type do CustomModel
+_TASK_MODEL_TYPES = {"detect": "detection", "segment": "segmentation"}
+
+def class_names_to_list(names: Dict[int, str]) -> List[str]:
+    """Mapa ID -> nome do ultralytics como lista (índice = ID), o formato guardado na BD."""
+    if not names:
+        return []
+    return [str(names.get(i, i)) for i in range(max(names) + 1)]
+
+def get_custom_model_class_names(db_model: CustomModel) -> Optional[Dict[int, str]]:
+    """Mapa ID -> nome guardado no upload, ou None se os metadados ainda não foram extraídos."""
+    if db_model.class_names is None:
+        return None
+    return dict(enumerate(db_model.class_names))
+
+def read_model_metadata(file_path: str) -> dict:
+    """
+    Carrega o modelo uma única vez e lê os metadados que ficam guardados na BD:
+    classes, tarefa, tamanho de entrada e nº de parâmetros.
+    """
+    if settings.INFERENCE_BACKEND == "stub":
+        # O motor falso não tem pesos: devolve os metadados do YOLOv8n
+        return {"class_names": class_names_to_list(COCO_CLASS_NAMES), "task": "detect", "input_size": 640, "parameter_count": 0}
+
+    model = YOLO(file_path)
+    args = getattr(model.model, "args", None)
+    input_size = args.get("imgsz") if isinstance(args, dict) else None
+    return {
+        "class_names": class_names_to_list(model.names),
+        "task": model.task,
+        "input_size": input_size if isinstance(input_size, int) else None,
+        "parameter_count": sum(p.numel() for p in model.model.parameters()),
+    }
+
+def apply_model_metadata(db: Session, db_model: CustomModel):
+    """Extrai e grava os metadados de um modelo (estado 'ready' ou 'failed'). Faz commit."""
+    start = time.perf_counter()
+    try:
+        metadata = read_model_metadata(db_model.file_path)
+        for field, value in metadata.items():
+            setattr(db_model, field, value)
+        model_type = _TASK_MODEL_TYPES.get(metadata["task"])
+        if model_type and model_type != db_model.model_type:
+            print(f"Modelo {db_model.id}: tipo '{db_model.model_type}' corrigido para '{model_type}' (tarefa do .pt).")
+            db_model.model_type = model_type
+        db_model.metadata_status = METADATA_STATUS_READY
+        print(f"Metadados do modelo {db_model.id} extraídos em {time.perf_counter() - start:.2f}s "
+              f"({len(metadata['class_names'])} classes, tarefa '{metadata['task']}').")
+    except Exception as e:
+        print(f"Erro ao extrair os metadados do modelo {db_model.id}: {e}")
+        db_model.metadata_status = METADATA_STATUS_FAILED
+    db.commit()
+
+def extract_custom_model_metadata(model_id: int):
+    """
+    Tarefa em segundo plano agendada no upload de um modelo customizado.
+    Usa a sessão de segundo plano da thread (BackgroundSession).
+    """
+    db = BackgroundSession()
+    try:
+        db_model = db.get(CustomModel, model_id)
+        if db_model is None:
+            print(f"Modelo customizado {model_id} não encontrado.")
+            return
+        apply_model_metadata(db, db_model)
+    except Exception as e:
+        print(f"Erro na extração de metadados do modelo {model_id}: {e}")
+        db.rollback()
+    finally:
+        BackgroundSession.remove()
@@ -0,0 +1,268 @@
+import os
+import time
+import random
+import datetime
+from typing import List, Optional
+
+import cv2
+import numpy as np
+import torch
+from fastapi import HTTPException
+from sqlalchemy import or_
+from sqlalchemy.orm import Session
+from torchvision.ops import box_iou
+from ultralytics import YOLO
+from ultralytics.data.augment import LetterBox
+
+try:
+    import onnx
+    from onnxruntime.quantization import CalibrationDataReader, QuantFormat, QuantType, quantize_static
+except ImportError:
+    onnx = None
+    CalibrationDataReader = object
+
+from app.core import tracing
+from app.core.config import settings
+from app.core.database import BackgroundSession
+from app.models.custom_model import CustomModel
+from app.models.dataset import Dataset, Image
+from app.services import dataset_service, ia_service, model_metadata_service
+
+# Estado da variante INT8 de um modelo customizado
+QUANTIZATION_STATUS_NONE = "none"
+QUANTIZATION_STATUS_PENDING = "pending"
+QUANTIZATION_STATUS_READY = "ready"
+QUANTIZATION_STATUS_FAILED = "failed"
+
+# A variante fica ao lado do .pt original: <nome>.int8.onnx
+QUANTIZED_SUFFIX = ".int8.onnx"
+
+# Confiança e IoU usados para comparar as deteções INT8 com as FP32 na amostra de avaliação
+EVAL_CONF = 0.25
+EVAL_MATCH_IOU = 0.5
+
+def get_quantized_file_path(file_path: str) -> str:
+    return os.path.splitext(file_path)[0] + QUANTIZED_SUFFIX
+
+def _remove_quantized_file(file_path: str):
+    """Apaga a variante INT8 anterior (antes de a refazer) e tira-a do cache de modelos."""
+    quantized_path = get_quantized_file_path(file_path)
+    ia_service.evict_custom_model(quantized_path)
+    if os.path.exists(quantized_path):
+        os.remove(quantized_path)
+
+def request_quantization(db: Session, db_model: CustomModel):
+    """
+    Marca o modelo para quantização. A conversão corre depois, em segundo plano
+    (quantize_custom_model). Faz commit.
+    Um pedido ainda 'pending' só bloqueia um novo durante MODEL_QUANTIZATION_TIMEOUT_SECONDS:
+    depois disso a tarefa é dada como perdida (ex.: o servidor reiniciou a meio).
+    """
+    if onnx is None:
+        raise HTTPException(status_code=400, detail="Quantização indisponível: instale os pacotes onnx e onnxruntime.")
+
+    requested_at = datetime.datetime.now(datetime.timezone.utc)
+    stale_before = requested_at - datetime.timedelta(seconds=settings.MODEL_QUANTIZATION_TIMEOUT_SECONDS)
+    # UPDATE condicional: dois pedidos em simultâneo não podem ambos passar a verificação.
+    # Até a nova variante ficar pronta, os datasets em 'int8' correm em FP32
+    updated = db.query(CustomModel).filter(
+        CustomModel.id == db_model.id,
+        or_(
+            CustomModel.quantization_status != QUANTIZATION_STATUS_PENDING,
+            CustomModel.quantization_requested_at.is_(None),
+            CustomModel.quantization_requested_at < stale_before,
+        )
+    ).update({
+        CustomModel.quantization_status: QUANTIZATION_STATUS_PENDING,
+        CustomModel.quantized_file_path: None,
+        CustomModel.quantization_report: None,
+        CustomModel.quantization_requested_at: requested_at,
+    }, synchronize_session=False)
+    if not updated:
+        raise HTTPException(status_code=409, detail="A quantização deste modelo já está em curso.")
+    if db_model.quantization_status == QUANTIZATION_STATUS_PENDING:
+        print(f"Pedido de quantização anterior do modelo {db_model.id} expirado; a refazer.")
+
+    db.commit()
+    db.refresh(db_model)
+    return db_model
+
+def _sample_image_paths(db: Session, owner_id: int, dataset_id: Optional[int], seed: int) -> List[str]:
+    """
+    Amostra (determinística por modelo) de imagens do usuário que existem em disco,
+    dividida depois entre calibração e avaliação (build_quantized_model).
+    """
+    query = db.query(Image.file_path).join(Dataset, Image.dataset_id == Dataset.id).filter(
+        Dataset.owner_id == owner_id, Dataset.status == dataset_service.DATASET_STATUS_ACTIVE
+    )
+    if dataset_id is not None:
+        query = query.filter(Dataset.id == dataset_id)
+    file_paths = [file_path for (file_path,) in query.order_by(Image.id)]
+    random.Random(seed).shuffle(file_paths)
+
+    wanted = settings.MODEL_QUANTIZATION_CALIBRATION_IMAGES + settings.MODEL_QUANTIZATION_EVAL_IMAGES
+    image_paths = []
+    for file_path in file_paths:
+        image_path = os.path.join(dataset_service.UPLOAD_DIRECTORY, file_path)
+        if os.path.exists(image_path):
+            image_paths.append(image_path)
+            if len(image_paths) == wanted:
+                break
+    return image_paths
+
+class _CalibrationReader(CalibrationDataReader):
+    """Entrega ao ONNX Runtime as imagens de calibração, pré-processadas como o ultralytics faz."""
+
+    def __init__(self, input_name: str, image_paths: List[str], imgsz: int):
+        self.input_name = input_name
+        self.image_paths = iter(image_paths)
+        self.letterbox = LetterBox(new_shape=(imgsz, imgsz), auto=False)
+
+    def get_next(self):
+        for image_path in self.image_paths:
+            frame = cv2.imread(image_path, cv2.IMREAD_COLOR)
+            if frame is None:
+                continue
+            # BGR HWC uint8 -> RGB NCHW float32 em [0, 1]
+            tensor = self.letterbox(image=frame)[..., ::-1].transpose(2, 0, 1)[None].astype(np.float32) / 255.0
+            return {self.input_name: np.ascontiguousarray(tensor)}
+        return None
+
+def _match_detections(reference, candidate) -> int:
+    """Nº de deteções do candidato que coincidem (mesma classe, IoU >= EVAL_MATCH_IOU) com a referência."""
+    if len(reference) == 0 or len(candidate) == 0:
+        return 0
+    iou = box_iou(candidate.xyxy.cpu(), reference.xyxy.cpu())
+    iou[candidate.cls.cpu()[:, None] != reference.cls.cpu()[None, :]] = 0
+    matched = 0
+    used = torch.zeros(len(reference), dtype=torch.bool)
+    for row in iou:
+        row[used] = 0
+        best = int(row.argmax())
+        if row[best] >= EVAL_MATCH_IOU:
+            used[best] = True
+            matched += 1
+    return matched
+
+def _evaluate(fp32_model, int8_model, image_paths: List[str], imgsz: int) -> dict:
+    """
+    Corre as duas variantes na amostra de avaliação e compara latência e resultados.
+    A referência são as deteções do FP32: precisão/recall medem quanto o INT8 se afasta dele.
+    """
+    frames = [frame for frame in (cv2.imread(path, cv2.IMREAD_COLOR) for path in image_paths) if frame is not None]
+    if not frames:
+        return {"eval_images": 0}
+
+    latencies = {"fp32": 0.0, "int8": 0.0}
+    reference_total = candidate_total = matched_total = 0
+    for model in (fp32_model, int8_model):
+        model(frames[0], verbose=False, imgsz=imgsz) # aquecimento (sessão ONNX, alocações)
+
+    for frame in frames:
+        outputs = {}
+        for precision, model in (("fp32", fp32_model), ("int8", int8_model)):
+            start = time.perf_counter()
+            outputs[precision] = model(frame, verbose=False, conf=EVAL_CONF, imgsz=imgsz)[0].boxes
+            latencies[precision] += time.perf_counter() - start
+        reference_total += len(outputs["fp32"])
+        candidate_total += len(outputs["int8"])
+        matched_total += _match_detections(outputs["fp32"], outputs["int8"])
+
+    precision = matched_total / candidate_total if candidate_total else 1.0
+    recall = matched_total / reference_total if reference_total else 1.0
+    fp32_ms = latencies["fp32"] * 1000 / len(frames)
+    int8_ms = latencies["int8"] * 1000 / len(frames)
+    return {
+        "eval_images": len(frames),
+        "fp32_ms": round(fp32_ms, 2),
+        "int8_ms": round(int8_ms, 2),
+        "speedup": round(fp32_ms / int8_ms, 2) if int8_ms else None,
+        "fp32_detections": reference_total,
+        "int8_detections": candidate_total,
+        "precision_vs_fp32": round(precision, 4),
+        "recall_vs_fp32": round(recall, 4),
+        "f1_vs_fp32": round(2 * precision * recall / (precision + recall), 4) if precision + recall else 0.0,
+    }
+
+def build_quantized_model(db_model: CustomModel, image_paths: List[str]) -> dict:
+    """
+    Exporta o .pt para ONNX, quantiza-o estaticamente para INT8 (pesos por canal,
+    ativações calibradas com as imagens do usuário) e avalia-o. Devolve o relatório.
+    """
+    imgsz = db_model.input_size or 640
+    # Com poucas imagens, um quarto fica de fora da calibração para a avaliação
+    eval_count = settings.MODEL_QUANTIZATION_EVAL_IMAGES
+    if len(image_paths) < settings.MODEL_QUANTIZATION_CALIBRATION_IMAGES + eval_count:
+        eval_count = len(image_paths) // 4
+    eval_paths = image_paths[:eval_count]
+    calibration_paths = image_paths[eval_count:]
+    if not calibration_paths:
+        raise ValueError("Sem imagens para calibrar: envie imagens para um dataset antes de quantizar.")
+
+    start = time.perf_counter()
+    fp32_model = YOLO(db_model.file_path, task=db_model.task)
+    # Formas dinâmicas: a mesma variante serve a imagem inteira e os lotes de mosaicos
+    onnx_path = fp32_model.export(format="onnx", imgsz=imgsz, dynamic=True, simplify=True, verbose=False)
+    quantized_path = get_quantized_file_path(db_model.file_path)
+    try:
+        input_name = onnx.load(onnx_path).graph.input[0].name
+        quantize_static(
+            onnx_path, quantized_path, _CalibrationReader(input_name, calibration_paths, imgsz),
+            quant_format=QuantFormat.QDQ, per_channel=True,
+            activation_type=QuantType.QUInt8, weight_type=QuantType.QInt8,
+        )
+    finally:
+        os.remove(onnx_path) # o ONNX FP32 intermédio não é usado na inferência
+    build_seconds = time.perf_counter() - start
+
+    int8_model = YOLO(quantized_path, task=db_model.task)
+    report = _evaluate(fp32_model, int8_model, eval_paths, imgsz)
+    report.update({
+        "calibration_images": len(calibration_paths),
+        "build_seconds": round(build_seconds, 2),
+        "fp32_file_size": os.path.getsize(db_model.file_path),
+        "int8_file_size": os.path.getsize(quantized_path),
+    })
+    return report
+
+def quantize_custom_model(model_id: int, dataset_id: Optional[int] = None):
+    """
+    Tarefa em segundo plano: produz a variante INT8 de um modelo customizado e grava o
+    relatório. Usa a sessão de segundo plano da thread (BackgroundSession).
+    """
+    db = BackgroundSession()
+    try:
+        db_model = db.get(CustomModel, model_id)
+        if db_model is None:
+            print(f"Modelo customizado {model_id} não encontrado.")
+            return
+
+        with tracing.span("model.quantize", model_id=model_id):
+            try:
+                if settings.INFERENCE_BACKEND == "stub":
+                    raise ValueError("O motor de inferência falso não tem pesos para quantizar.")
+                if db_model.metadata_status != model_metadata_service.METADATA_STATUS_READY:
+                    model_metadata_service.apply_model_metadata(db, db_model)
+
+                image_paths = _sample_image_paths(db, db_model.owner_id, dataset_id, seed=model_id)
+                _remove_quantized_file(db_model.file_path)
+                report = build_quantized_model(db_model, image_paths)
+
+                db_model.quantized_file_path = get_quantized_file_path(db_model.file_path)
+                db_model.quantization_report = report
+                db_model.quantization_status = QUANTIZATION_STATUS_READY
+                tracing.set_attributes(speedup=report.get("speedup"))
+                print(f"Modelo {model_id} quantizado para INT8 em {report['build_seconds']:.1f}s: "
+                      f"{report.get('fp32_ms')} ms -> {report.get('int8_ms')} ms por imagem, "
+                      f"F1 vs FP32 {report.get('f1_vs_fp32')} ({report['eval_images']} imagens de avaliação).")
+            except Exception as e:
+                print(f"Erro ao quantizar o modelo {model_id}: {e}")
+                db_model.quantized_file_path = None
+                db_model.quantization_report = {"error": str(e)}
+                db_model.quantization_status = QUANTIZATION_STATUS_FAILED
+        db.commit()
+    except Exception as e:
+        print(f"Erro na tarefa de quantização do modelo {model_id}: {e}")
+        db.rollback()
+    finally:
+        BackgroundSession.remove()
@@ -0,0 +1,205 @@
+import os
+import re
+import glob
+import json
+import time
+import uuid
+import hashlib
+import threading
+from typing import Dict, Optional
+from fastapi import HTTPException
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.models.custom_model import CustomModel
+from app.schemas.custom_model import CustomModelCreate
+from app.schemas.model_upload import ModelUploadCreate
+from app.services import custom_model_service
+
+# Onde ficam os uploads em curso: <id>.json (pedido inicial) e <id>.part (bytes recebidos).
+# O estado vive em disco, por isso um upload pode ser retomado depois de um reinício do servidor
+MODEL_UPLOADS_DIRECTORY = "model_uploads"
+
+_UPLOAD_ID_PATTERN = re.compile(r"^[0-9a-f]{32}$")
+
+# Um lock por upload: duas partes do mesmo upload nunca são escritas ao mesmo tempo
+_upload_locks: Dict[str, threading.Lock] = {}
+_upload_locks_lock = threading.Lock()
+
+def _get_metadata_path(upload_id: str) -> str:
+    return os.path.join(MODEL_UPLOADS_DIRECTORY, f"{upload_id}.json")
+
+def _get_part_path(upload_id: str) -> str:
+    return os.path.join(MODEL_UPLOADS_DIRECTORY, f"{upload_id}.part")
+
+def _get_upload_lock(upload_id: str) -> threading.Lock:
+    with _upload_locks_lock:
+        return _upload_locks.setdefault(upload_id, threading.Lock())
+
+def _remove_upload_files(upload_id: str):
+    for path in (_get_part_path(upload_id), _get_metadata_path(upload_id)):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+    with _upload_locks_lock:
+        _upload_locks.pop(upload_id, None)
+
+def _load_upload(upload_id: str, owner_id: int) -> dict:
+    """
+    Lê o pedido inicial de um upload, verificando se o usuário é o proprietário.
+    """
+    metadata_path = _get_metadata_path(upload_id)
+    if not _UPLOAD_ID_PATTERN.match(upload_id) or not os.path.exists(metadata_path):
+        raise HTTPException(status_code=404, detail="Upload não encontrado.")
+    with open(metadata_path) as f:
+        upload = json.load(f)
+    if upload["owner_id"] != owner_id:
+        raise HTTPException(status_code=404, detail="Upload não encontrado.")
+    return upload
+
+def _ensure_not_removed(part_path: str):
+    """Já com o lock do upload: outro pedido pode tê-lo concluído ou cancelado entretanto."""
+    if not os.path.exists(part_path):
+        raise HTTPException(status_code=404, detail="Upload não encontrado.")
+
+def _upload_state(upload: dict) -> dict:
+    """Estado público do upload: o offset é o tamanho do .part em disco."""
+    part_path = _get_part_path(upload["id"])
+    return {
+        **{key: value for key, value in upload.items() if key != "owner_id"},
+        "offset": os.path.getsize(part_path),
+        "chunk_size": settings.MODEL_UPLOAD_CHUNK_SIZE,
+        "expires_at": os.path.getmtime(part_path) + settings.MODEL_UPLOAD_TTL_SECONDS,
+    }
+
+def _file_sha256(path: str) -> str:
+    sha256 = hashlib.sha256()
+    with open(path, "rb") as f:
+        while chunk := f.read(1024 * 1024):
+            sha256.update(chunk)
+    return sha256.hexdigest()
+
+def cleanup_expired_uploads():
+    """
+    Apaga os uploads que não recebem partes há mais de MODEL_UPLOAD_TTL_SECONDS.
+    """
+    expires_before = time.time() - settings.MODEL_UPLOAD_TTL_SECONDS
+    for part_path in glob.glob(os.path.join(MODEL_UPLOADS_DIRECTORY, "*.part")):
+        upload_id = os.path.basename(part_path)[:-len(".part")]
+        try:
+            if os.path.getmtime(part_path) < expires_before:
+                print(f"Upload de modelo {upload_id} expirado, a apagar.")
+                _remove_upload_files(upload_id)
+        except FileNotFoundError:
+            pass
+
+def create_upload(upload_in: ModelUploadCreate, owner_id: int) -> dict:
+    """
+    Inicia um upload em partes: valida o nome e o tamanho e cria o .part vazio.
+    """
+    # Falha já aqui (e não depois de enviar gigabytes) se o nome for inválido ou já existir
+    custom_model_service.get_model_file_path(owner_id, upload_in.filename)
+    if upload_in.file_size > settings.MODEL_UPLOAD_MAX_SIZE:
+        raise HTTPException(
+            status_code=413, detail=f"O modelo excede o tamanho máximo de {settings.MODEL_UPLOAD_MAX_SIZE} bytes."
+        )
+
+    cleanup_expired_uploads()
+
+    upload_id = uuid.uuid4().hex
+    upload = {
+        "id": upload_id,
+        "owner_id": owner_id,
+        "name": upload_in.name,
+        "model_type": upload_in.model_type,
+        "filename": upload_in.filename,
+        "file_size": upload_in.file_size,
+        "sha256": upload_in.sha256.lower() if upload_in.sha256 else None,
+        "created_at": time.time(),
+    }
+    os.makedirs(MODEL_UPLOADS_DIRECTORY, exist_ok=True)
+    open(_get_part_path(upload_id), "wb").close()
+    with open(_get_metadata_path(upload_id), "w") as f:
+        json.dump(upload, f)
+    return _upload_state(upload)
+
+def get_upload(upload_id: str, owner_id: int) -> dict:
+    """
+    Obtém o estado de um upload; o cliente retoma a partir do offset devolvido.
+    """
+    return _upload_state(_load_upload(upload_id, owner_id))
+
+def append_chunk(upload_id: str, owner_id: int, *, offset: int, data: bytes, chunk_sha256: Optional[str] = None) -> dict:
+    """
+    Acrescenta uma parte ao upload. A parte só é escrita se começar exatamente no
+    offset atual e, quando enviado, se o seu SHA-256 corresponder.
+    """
+    upload = _load_upload(upload_id, owner_id)
+    if not data:
+        raise HTTPException(status_code=400, detail="Parte vazia.")
+    if len(data) > settings.MODEL_UPLOAD_CHUNK_SIZE:
+        raise HTTPException(status_code=413, detail=f"Cada parte pode ter no máximo {settings.MODEL_UPLOAD_CHUNK_SIZE} bytes.")
+    if chunk_sha256 is not None and hashlib.sha256(data).hexdigest() != chunk_sha256.lower():
+        raise HTTPException(status_code=400, detail="O SHA-256 da parte não corresponde ao conteúdo recebido.")
+
+    with _get_upload_lock(upload_id):
+        part_path = _get_part_path(upload_id)
+        _ensure_not_removed(part_path)
+        current_offset = os.path.getsize(part_path)
+        if offset != current_offset:
+            # Ex.: a resposta da parte anterior perdeu-se. O cliente consulta o estado e continua
+            raise HTTPException(status_code=409, detail=f"Offset inválido: o upload está em {current_offset} bytes.")
+        if offset + len(data) > upload["file_size"]:
+            raise HTTPException(status_code=400, detail="A parte ultrapassa o tamanho declarado do ficheiro.")
+
+        with open(part_path, "r+b") as f:
+            f.seek(offset)
+            f.write(data)
+        return _upload_state(upload)
+
+def complete_upload(db: Session, upload_id: str, owner_id: int, *, sha256: Optional[str] = None) -> CustomModel:
+    """
+    Termina o upload: verifica o tamanho e o SHA-256 do ficheiro inteiro, move-o para
+    a pasta de modelos do usuário e cria o registro do CustomModel.
+    """
+    upload = _load_upload(upload_id, owner_id)
+    expected_sha256 = (sha256 or upload["sha256"] or "").lower() or None
+
+    with _get_upload_lock(upload_id):
+        part_path = _get_part_path(upload_id)
+        _ensure_not_removed(part_path)
+        received = os.path.getsize(part_path)
+        if received != upload["file_size"]:
+            raise HTTPException(
+                status_code=400, detail=f"Upload incompleto: recebidos {received} de {upload['file_size']} bytes."
+            )
+
+        start = time.perf_counter()
+        file_sha256 = _file_sha256(part_path)
+        if expected_sha256 is not None and file_sha256 != expected_sha256:
+            # O ficheiro montado está corrompido: não há como saber que parte falhou
+            _remove_upload_files(upload_id)
+            raise HTTPException(status_code=400, detail="O SHA-256 do ficheiro não corresponde. Reinicie o upload.")
+
+        file_path = custom_model_service.get_model_file_path(owner_id, upload["filename"])
+        os.replace(part_path, file_path)
+        _remove_upload_files(upload_id)
+        print(f"Upload de modelo {upload_id} concluído: {received} bytes verificados em {time.perf_counter() - start:.2f}s.")
+
+    return custom_model_service.register_model(
+        db,
+        model_in=CustomModelCreate(name=upload["name"], model_type=upload["model_type"]),
+        file_path=file_path,
+        owner_id=owner_id,
+        file_sha256=file_sha256,
+        file_size=received,
+    )
+
+def abort_upload(upload_id: str, owner_id: int):
+    """
+    Cancela um upload em curso e apaga as partes já recebidas.
+    """
+    _load_upload(upload_id, owner_id)
+    with _get_upload_lock(upload_id):
+        _remove_upload_files(upload_id)
@@ -0,0 +1,77 @@
+import time
+from typing import List, Optional
+
+import cv2
+import numpy as np
+import torch
+from ultralytics.engine.results import Boxes
+
+from app.core.config import settings
+from app.services.model_metadata_service import COCO_CLASS_NAMES
+
+# Caixas devolvidas pelo stub, relativas à imagem: (x1, y1, x2, y2, confiança, classe)
+_STUB_DETECTIONS = (
+    (0.10, 0.10, 0.40, 0.50, 0.91, 0),
+    (0.50, 0.20, 0.90, 0.60, 0.76, 2),
+    (0.30, 0.60, 0.55, 0.95, 0.42, 16),
+)
+
+class _StubMask:
+    def __init__(self, xyn: np.ndarray):
+        self.xyn = [xyn]
+
+class _StubResults:
+    def __init__(self, boxes: Boxes, masks: Optional[List[_StubMask]]):
+        self.boxes = boxes
+        self.masks = masks
+
+def _box_polygon(box: torch.Tensor, width: int, height: int) -> np.ndarray:
+    x1, y1, x2, y2 = box.tolist()
+    return np.array([[x1, y1], [x2, y1], [x2, y2], [x1, y2]], dtype=np.float32) / np.array([width, height], dtype=np.float32)
+
+class StubModel:
+    """
+    Motor de inferência falso (INFERENCE_BACKEND='stub'), com a interface dos
+    modelos do ultralytics usada pelo ia_service: devolve sempre as mesmas
+    caixas (e máscaras retangulares) relativas ao tamanho da imagem, após
+    INFERENCE_STUB_LATENCY_MS. Serve para testes de carga sem pesos de modelos.
+    """
+    names = COCO_CLASS_NAMES
+
+    def __call__(self, source, verbose: bool = False, conf: float = 0.25, classes: Optional[List[int]] = None, **kwargs):
+        frames = source if isinstance(source, list) else [source]
+        return [self._predict_frame(frame, conf, classes) for frame in frames]
+
+    def predict(self, source, bboxes=None, **kwargs):
+        """Pipeline SAM: uma máscara retangular por caixa de prompt."""
+        frame = self._read(source)
+        height, width = frame.shape[:2]
+        self._simulate_latency()
+        boxes = torch.as_tensor(bboxes if bboxes is not None else torch.zeros((0, 4)), dtype=torch.float32)
+        masks = [_StubMask(_box_polygon(box, width, height)) for box in boxes]
+        data = torch.cat([boxes, torch.ones((len(boxes), 2))], dim=1)
+        return [_StubResults(Boxes(data, (height, width)), masks)]
+
+    def _read(self, source) -> np.ndarray:
+        if isinstance(source, str):
+            return cv2.imread(source, cv2.IMREAD_COLOR)
+        return source
+
+    def _simulate_latency(self):
+        if settings.INFERENCE_STUB_LATENCY_MS > 0:
+            time.sleep(settings.INFERENCE_STUB_LATENCY_MS / 1000)
+
+    def _predict_frame(self, source, conf: float, classes: Optional[List[int]]) -> _StubResults:
+        frame = self._read(source)
+        height, width = frame.shape[:2]
+        self._simulate_latency()
+
+        scale = torch.tensor([width, height, width, height], dtype=torch.float32)
+        rows = [
+            torch.cat([torch.tensor(box[:4]) * scale, torch.tensor([box[4], box[5]])])
+            for box in _STUB_DETECTIONS
+            if box[4] >= conf and (classes is None or box[5] in classes)
+        ]
+        data = torch.stack(rows) if rows else torch.zeros((0, 6))
+        masks = [_StubMask(_box_polygon(row[:4], width, height)) for row in data]
+        return _StubResults(Boxes(data, (height, width)), masks or None)
@@ -1,17 +1,88 @@
+import time
+import threading
+from typing import Dict, Optional, Tuple
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
 from app.models.user import User
 from app.schemas.user import UserCreate, UserUpdate
-from app.core.security import get_password_hash
-from app.core.security import verify_password
+from app.core.config import settings
+from app.core.security import get_password_hash, get_password_hash_async
+from app.core.security import verify_password, verify_and_update_password_async
+
+# --- Cache dos utilizadores autenticados ---
+# user_id -> (expira_em, colunas do utilizador). Guardamos só os valores das
+# colunas (e não o objeto ORM) porque a sessão que o carregou é fechada no fim do pedido.
+_user_cache: Dict[int, Tuple[float, dict]] = {}
+_user_cache_lock = threading.Lock()
+_USER_CACHE_COLUMNS = ("id", "email", "is_active", "is_superuser", "created_at", "updated_at")
+
+def invalidate_user_cache(user_id: int):
+    """Remove um utilizador do cache (chamado em cada alteração/remoção)."""
+    with _user_cache_lock:
+        _user_cache.pop(user_id, None)
+
+def _get_cached_user(user_id: int, now: float) -> Optional[User]:
+    with _user_cache_lock:
+        cached = _user_cache.get(user_id)
+    if cached and cached[0] > now:
+        return User(**cached[1])
+    return None
+
+def _cache_user(user_id: int, db_user: Optional[User], now: float) -> Optional[User]:
+    """Guarda as colunas do utilizador no cache e devolve-o desligado da sessão (como num hit)."""
+    if db_user is None:
+        invalidate_user_cache(user_id)
+        return None
+
+    snapshot = {column: getattr(db_user, column) for column in _USER_CACHE_COLUMNS}
+    with _user_cache_lock:
+        if len(_user_cache) >= settings.USER_CACHE_MAX_SIZE:
+            for key in [k for k, (expires, _) in _user_cache.items() if expires <= now]:
+                del _user_cache[key]
+            if len(_user_cache) >= settings.USER_CACHE_MAX_SIZE:
+                # Remove a entrada mais antiga (os dicts mantêm a ordem de inserção)
+                del _user_cache[next(iter(_user_cache))]
+        _user_cache[user_id] = (now + settings.USER_CACHE_TTL_SECONDS, snapshot)
+    return User(**snapshot)
+
+def get_user_cached(db: Session, user_id: int) -> Optional[User]:
+    """
+    Busca um usuário pelo ID, passando por um cache em memória com TTL curto
+    (USER_CACHE_TTL_SECONDS). Evita uma consulta à BD em cada pedido autenticado.
+    Devolve sempre (com ou sem cache) um objeto User desligado da sessão, apenas
+    com as colunas: para o alterar, carregue-o de novo com get_user.
+    """
+    now = time.monotonic()
+    cached = _get_cached_user(user_id, now)
+    if cached is not None:
+        return cached
+
+    return _cache_user(user_id, get_user(db, user_id=user_id), now)
+
+async def get_user_cached_async(db: AsyncSession, user_id: int) -> Optional[User]:
+    """Versão de get_user_cached para uma AsyncSession (partilha o mesmo cache)."""
+    now = time.monotonic()
+    cached = _get_cached_user(user_id, now)
+    if cached is not None:
+        return cached
+
+    return _cache_user(user_id, await db.scalar(select(User).where(User.id == user_id)), now)
+
+async def get_user_by_email_async(db: AsyncSession, email: str) -> Optional[User]:
+    """Busca um usuário pelo email numa AsyncSession."""
+    return await db.scalar(select(User).where(User.email == email).limit(1))
 
 def get_user_by_email(db: Session, email: str):
     """Busca um usuário pelo email."""
     return db.query(User).filter(User.email == email).first()
 
-def create_user(db: Session, user: UserCreate):
+def create_user(db: Session, user: UserCreate, hashed_password: Optional[str] = None):
     """Cria um novo usuário no banco de dados."""
     
-    hashed_password = get_password_hash(user.password)
+    if hashed_password is None:
+        hashed_password = get_password_hash(user.password)
     db_user = User(email=user.email, hashed_password=hashed_password)
     db.add(db_user)
     db.commit()
@@ -30,6 +101,37 @@ def authenticate_user(db: Session, email: str, password: str):
         return False
     return user
 
+async def create_user_async(db: Session, user: UserCreate):
+    """
+    Cria um usuário a partir de um endpoint assíncrono: o hash é calculado
+    no pool de hashing e o acesso à BD corre na threadpool.
+    """
+    hashed_password = await get_password_hash_async(user.password)
+    return await run_in_threadpool(create_user, db, user, hashed_password)
+
+async def authenticate_user_async(db: Session, email: str, password: str):
+    """
+    Versão assíncrona de authenticate_user. Se o hash guardado usar
+    parâmetros antigos, é substituído pelo novo após um login válido.
+    """
+    user = await run_in_threadpool(get_user_by_email, db, email)
+    if not user:
+        return False
+    valid, new_hash = await verify_and_update_password_async(password, user.hashed_password)
+    if not valid:
+        return False
+    if new_hash:
+        await run_in_threadpool(update_password_hash, db, user, new_hash)
+    return user
+
+def update_password_hash(db: Session, db_user: User, hashed_password: str):
+    """Substitui o hash da senha (ex.: migração para novos parâmetros do Argon2)."""
+    db_user.hashed_password = hashed_password
+    db.add(db_user)
+    db.commit()
+    db.refresh(db_user)
+    return db_user
+
 def get_user(db: Session, user_id: int):
     """Busca um único usuário pelo ID."""
     return db.query(User).filter(User.id == user_id).first()
@@ -46,6 +148,7 @@ def update_user(db: Session, db_user: User, user_in: UserUpdate):
     db.add(db_user)
     db.commit()
     db.refresh(db_user)
+    invalidate_user_cache(db_user.id)
     return db_user
 
 def delete_user(db: Session, user_id: int):
@@ -54,4 +157,5 @@ def delete_user(db: Session, user_id: int):
     if db_user:
         db.delete(db_user)
         db.commit()
+        invalidate_user_cache(user_id)
     return db_user
\ No newline at end of file
@@ -0,0 +1,138 @@
+import os
+import uuid
+from typing import List, Optional
+import cv2
+import numpy as np
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.core.database import BackgroundSession
+from app.core.metrics import BACKGROUND_QUEUE_DEPTH
+from app.models.dataset import Image
+from app.services import dataset_service, image_derivative_service
+
+VIDEO_EXTENSIONS = (".mp4", ".avi", ".mov", ".mkv", ".webm", ".m4v")
+
+# Quantos frames extraídos são gravados por commit
+FRAME_COMMIT_BATCH_SIZE = 50
+
+def is_video_filename(filename: str) -> bool:
+    return os.path.splitext(filename)[1].lower() in VIDEO_EXTENSIONS
+
+def dhash(frame: np.ndarray, hash_size: int = 8) -> int:
+    """
+    Hash perceptual por diferenças (dHash): reduz o frame a (hash_size+1)x(hash_size)
+    em tons de cinza e compara cada píxel com o vizinho da direita.
+    Frames quase iguais têm hashes a poucos bits de distância.
+    """
+    gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+    small = cv2.resize(gray, (hash_size + 1, hash_size), interpolation=cv2.INTER_AREA)
+    bits = (small[:, 1:] > small[:, :-1]).flatten()
+    return int.from_bytes(np.packbits(bits).tobytes(), "big")
+
+def hamming_distance(a: int, b: int) -> int:
+    return bin(a ^ b).count("1")
+
+def extract_video_frames(
+    db: Session,
+    dataset_id: int,
+    video_path: str,
+    video_name: str,
+    sample_fps: float,
+    dedup_threshold: int
+) -> List[Image]:
+    """
+    Lê o vídeo em streaming e guarda como imagens do dataset os frames
+    amostrados a sample_fps, saltando os que diferem do último frame guardado
+    em no máximo dedup_threshold bits de dHash.
+    Os frames não amostrados são só avançados com grab(), sem conversão para BGR.
+    """
+    capture = cv2.VideoCapture(video_path)
+    if not capture.isOpened():
+        raise ValueError(f"Não foi possível abrir o vídeo {video_name}")
+
+    native_fps = capture.get(cv2.CAP_PROP_FPS) or 30.0
+    step = max(int(round(native_fps / sample_fps)), 1)
+
+    dataset_dir = os.path.join(dataset_service.UPLOAD_DIRECTORY, str(dataset_id))
+    os.makedirs(dataset_dir, exist_ok=True)
+    # Um prefixo por upload evita colisões se o mesmo vídeo for enviado duas vezes
+    prefix = f"{os.path.splitext(os.path.basename(video_name))[0]}_{uuid.uuid4().hex[:8]}"
+
+    kept: List[Image] = []
+    pending: List[Image] = []
+    last_hash: Optional[int] = None
+    frame_index = -1
+    sampled = skipped = 0
+
+    def flush():
+        if not pending:
+            return
+        db.add_all(pending)
+        dataset_service.mark_annotations_changed(db, dataset_id=dataset_id)
+        db.commit()
+        for db_image in pending:
+            image_derivative_service.schedule_derivatives(
+                dataset_id, db_image.id, os.path.join(dataset_service.UPLOAD_DIRECTORY, db_image.file_path)
+            )
+        kept.extend(pending)
+        pending.clear()
+
+    try:
+        while len(kept) + len(pending) < settings.VIDEO_MAX_FRAMES:
+            if not capture.grab():
+                break
+            frame_index += 1
+            if frame_index % step:
+                continue
+
+            ok, frame = capture.retrieve()
+            if not ok:
+                break
+            sampled += 1
+
+            frame_hash = dhash(frame)
+            if last_hash is not None and hamming_distance(frame_hash, last_hash) <= dedup_threshold:
+                skipped += 1
+                continue
+            last_hash = frame_hash
+
+            file_name = f"{prefix}_f{frame_index:07d}.jpg"
+            cv2.imwrite(
+                os.path.join(dataset_dir, file_name), frame,
+                [cv2.IMWRITE_JPEG_QUALITY, settings.VIDEO_JPEG_QUALITY]
+            )
+            pending.append(Image(
+                file_name=file_name,
+                file_path=os.path.join(str(dataset_id), file_name),
+                dataset_id=dataset_id
+            ))
+            if len(pending) >= FRAME_COMMIT_BATCH_SIZE:
+                flush()
+
+        flush()
+    finally:
+        capture.release()
+
+    print(f"Vídeo {video_name}: {frame_index + 1} frames lidos, {sampled} amostrados, "
+          f"{skipped} duplicados saltados, {len(kept)} guardados.")
+    return kept
+
+def ingest_video(dataset_id: int, video_path: str, video_name: str, sample_fps: float, dedup_threshold: int):
+    """
+    Tarefa em segundo plano: extrai os frames do vídeo e apaga o ficheiro temporário.
+    Usa a sessão de segundo plano da thread (BackgroundSession).
+    """
+    db = BackgroundSession()
+    queue_depth = BACKGROUND_QUEUE_DEPTH.labels(queue="video")
+    queue_depth.inc()
+    try:
+        extract_video_frames(db, dataset_id, video_path, video_name, sample_fps, dedup_threshold)
+    except Exception as e:
+        print(f"Erro ao processar o vídeo {video_name}: {e}")
+        db.rollback()
+    finally:
+        queue_depth.dec()
+        BackgroundSession.remove()
+        if os.path.exists(video_path):
+            os.remove(video_path)
@@ -0,0 +1,318 @@
+"""
+Casos do benchmark: dados sintéticos e as operações medidas.
+Cada caso é uma função sem argumentos; o runner chama-a várias vezes e mede-a.
+"""
+import io
+import os
+import random
+import shutil
+import time
+from typing import Callable, Dict, List, Tuple
+
+import numpy as np
+import torch
+from fastapi import UploadFile
+from fastapi.testclient import TestClient
+from PIL import Image as PILImage
+from sqlalchemy import create_engine, insert
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import NullPool
+from ultralytics.engine.results import Boxes
+
+from app.api.dependencies import get_current_user
+from app.core.base import Base
+from app.core.database import get_async_database_url, get_async_db, get_db
+from app.models.user import User
+from app.models.dataset import Dataset, Image
+from app.models.annotation import Annotation
+from app.models import custom_model
+from app.services import annotation_import_service, dataset_service, dataset_stats_service, ia_service, image_derivative_service
+
+CLASS_LABELS = ["person", "car", "dog", "cat", "bicycle", "truck", "bus", "bird", "boat", "chair"]
+EXPORT_FORMATS = ("yolo", "labelme", "coco", "cvat")
+INSERT_CHUNK_SIZE = 50_000
+
+# Dimensões da imagem sintética (todas as imagens do dataset são hardlinks do mesmo ficheiro)
+IMAGE_SIZE = (640, 480)
+
+class BenchmarkContext:
+    """BD, diretórios de trabalho e sessões partilhados pelos casos."""
+
+    def __init__(self, url: str, workdir: str):
+        self.workdir = workdir
+        self.engine = create_engine(url)
+        self.Session = sessionmaker(bind=self.engine, autoflush=False)
+        # Endpoints de leitura assíncronos; sem pool, porque o TestClient pode mudar de event loop
+        self.async_engine = create_async_engine(get_async_database_url(url), poolclass=NullPool)
+        self.AsyncSession = async_sessionmaker(self.async_engine, autoflush=False, expire_on_commit=False)
+        self.owner_id = 1
+
+        # Os serviços escrevem nestes diretórios (nunca nos da app)
+        dataset_service.UPLOAD_DIRECTORY = os.path.join(workdir, "uploads")
+        image_derivative_service.DERIVATIVE_DIRECTORY = os.path.join(workdir, "derivatives")
+        os.makedirs(dataset_service.UPLOAD_DIRECTORY, exist_ok=True)
+
+        self.sample_jpeg = _make_jpeg(*IMAGE_SIZE)
+        self.sample_path = os.path.join(workdir, "sample.jpg")
+        with open(self.sample_path, "wb") as f:
+            f.write(self.sample_jpeg)
+
+    def reset_schema(self):
+        Base.metadata.drop_all(self.engine)
+        Base.metadata.create_all(self.engine)
+        with self.engine.begin() as conn:
+            conn.execute(insert(User), [{"id": self.owner_id, "email": "bench@example.com", "hashed_password": "x"}])
+
+def drain_background_work():
+    """Espera pelas miniaturas agendadas pelos uploads antes de apagar o diretório de trabalho."""
+    image_derivative_service._executor.shutdown(wait=True)
+
+def _make_jpeg(width: int, height: int) -> bytes:
+    rng = np.random.default_rng(0)
+    pixels = rng.integers(0, 255, (height, width, 3), dtype=np.uint8)
+    buffer = io.BytesIO()
+    PILImage.fromarray(pixels).save(buffer, format="JPEG", quality=85)
+    return buffer.getvalue()
+
+def _link_or_copy(source: str, target: str):
+    try:
+        os.link(source, target)
+    except OSError:
+        shutil.copyfile(source, target)
+
+def populate_dataset(ctx: BenchmarkContext, dataset_id: int, n_images: int, annotations_per_image: int) -> int:
+    """
+    Cria um dataset sintético com n_images imagens (ficheiros reais, em hardlink)
+    e annotations_per_image anotações de deteção/segmentação por imagem.
+    Devolve o nº de anotações inseridas.
+    """
+    rng = random.Random(dataset_id)
+    dataset_dir = os.path.join(dataset_service.UPLOAD_DIRECTORY, str(dataset_id))
+    os.makedirs(dataset_dir, exist_ok=True)
+
+    with ctx.engine.begin() as conn:
+        conn.execute(insert(Dataset), [{
+            "id": dataset_id, "name": f"bench-{n_images}", "owner_id": ctx.owner_id, "model_id": "yolov8n_det"
+        }])
+
+    with ctx.Session() as db:
+        first_image_id = (db.query(Image.id).order_by(Image.id.desc()).limit(1).scalar() or 0) + 1
+        first_annotation_id = (db.query(Annotation.id).order_by(Annotation.id.desc()).limit(1).scalar() or 0) + 1
+
+    image_rows, annotation_rows = [], []
+    annotation_id = first_annotation_id
+    with ctx.engine.begin() as conn:
+        for image_id in range(first_image_id, first_image_id + n_images):
+            file_name = f"{image_id}.jpg"
+            _link_or_copy(ctx.sample_path, os.path.join(dataset_dir, file_name))
+            image_rows.append({
+                "id": image_id,
+                "file_name": file_name,
+                "file_path": os.path.join(str(dataset_id), file_name),
+                "dataset_id": dataset_id,
+                "annotation_provenance": "yolov8n_det|",
+            })
+            for i in range(annotations_per_image):
+                x, y = rng.random() * 0.8 + 0.1, rng.random() * 0.8 + 0.1
+                if i % 4 == 0:
+                    geometry = [[x + 0.05 * np.cos(t), y + 0.05 * np.sin(t)] for t in np.linspace(0, 6.28, 16)]
+                    annotation_type = "segmentation"
+                else:
+                    geometry = {"x": x, "y": y, "width": 0.1, "height": 0.1}
+                    annotation_type = "detection"
+                annotation_rows.append({
+                    "id": annotation_id,
+                    "annotation_type": annotation_type,
+                    "class_label": rng.choice(CLASS_LABELS),
+                    "geometry": geometry,
+                    "confidence": round(rng.random(), 4),
+                    "image_id": image_id,
+                })
+                annotation_id += 1
+
+            if len(image_rows) >= INSERT_CHUNK_SIZE:
+                conn.execute(insert(Image), image_rows)
+                image_rows = []
+            if len(annotation_rows) >= INSERT_CHUNK_SIZE:
+                conn.execute(insert(Annotation), annotation_rows)
+                annotation_rows = []
+
+        if image_rows:
+            conn.execute(insert(Image), image_rows)
+        if annotation_rows:
+            conn.execute(insert(Annotation), annotation_rows)
+
+    with ctx.Session() as db:
+        dataset_stats_service.rebuild_class_counts(db, dataset_id)
+        db.commit()
+    return annotation_id - first_annotation_id
+
+# --- Resultados sintéticos do modelo ---
+
+class _DenseMask:
+    def __init__(self, xyn: np.ndarray):
+        self.xyn = [xyn]
+
+class DenseResults:
+    """Imita os Results do ultralytics (boxes + masks.xyn) com n_objects deteções."""
+
+    def __init__(self, n_objects: int, n_classes: int, with_masks: bool, seed: int = 0):
+        generator = torch.Generator().manual_seed(seed)
+        xy = torch.rand((n_objects, 2), generator=generator) * 560
+        wh = torch.rand((n_objects, 2), generator=generator) * 60 + 10
+        conf = torch.rand((n_objects, 1), generator=generator)
+        cls = torch.randint(0, n_classes, (n_objects, 1), generator=generator).float()
+        self.boxes = Boxes(torch.cat([xy, xy + wh, conf, cls], dim=1), IMAGE_SIZE[::-1])
+        self.masks = None
+        if with_masks:
+            angles = np.linspace(0, 2 * np.pi, 64, endpoint=False)
+            circle = np.stack([np.cos(angles), np.sin(angles)], axis=1).astype(np.float32) * 0.05
+            self.masks = [_DenseMask(circle + np.float32(0.5)) for _ in range(n_objects)]
+
+# --- Casos ---
+
+def build_cases(
+    ctx: BenchmarkContext, sizes: List[int], annotations_per_image: int
+) -> Tuple[Dict[str, Callable[[], object]], Dict[str, float]]:
+    """
+    Prepara os dados de cada tamanho e devolve ({nome do caso: função},
+    {populate[N]: segundos a criar o dataset sintético}).
+    """
+    cases: Dict[str, Callable[[], object]] = {}
+    populate_timings: Dict[str, float] = {}
+
+    for index, n_images in enumerate(sizes, start=1):
+        start = time.perf_counter()
+        populate_dataset(ctx, dataset_id=index, n_images=n_images, annotations_per_image=annotations_per_image)
+        populate_timings[f"populate[{n_images}]"] = time.perf_counter() - start
+        print(f"Dataset sintético de {n_images} imagens criado em {populate_timings[f'populate[{n_images}]']:.1f}s")
+
+        for export_format in EXPORT_FORMATS:
+            cases[f"export.{export_format}[{n_images}]"] = _export_case(ctx, index, export_format)
+            cases[f"import.{export_format}[{n_images}]"] = _import_case(ctx, index, export_format)
+        cases[f"api.dataset_detail[{n_images}]"] = _api_case(ctx, f"/datasets/{index}")
+
+    cases["api.dataset_list"] = _api_case(ctx, "/datasets/")
+    cases["annotations.build_rows.detection[300]"] = _build_rows_case(ctx, "yolov8n_det", n_objects=300)
+    cases["annotations.build_rows.segmentation[100]"] = _build_rows_case(ctx, "yolov8n_seg", n_objects=100)
+    # Parâmetros de inferência do dataset: as deteções abaixo da confiança nem chegam a ser convertidas
+    cases["annotations.build_rows.detection[300,conf=0.5]"] = _build_rows_case(
+        ctx, "yolov8n_det", n_objects=300, min_confidence=0.5
+    )
+    cases["annotations.replace[32x100]"] = _replace_case(ctx, n_images=32, per_image=100)
+    cases["upload.save_uploaded_images[50]"] = _upload_case(ctx, n_files=50)
+    return cases, populate_timings
+
+def _export_case(ctx: BenchmarkContext, dataset_id: int, export_format: str):
+    def run():
+        with ctx.Session() as db:
+            db_dataset = db.get(Dataset, dataset_id)
+            return len(dataset_service._export_annotations(db, db_dataset, export_format))
+    return run
+
+def _import_case(ctx: BenchmarkContext, dataset_id: int, export_format: str):
+    # O arquivo é a exportação do próprio dataset; cada ronda volta a substituir as mesmas anotações
+    archive_path = os.path.join(ctx.workdir, f"import-{dataset_id}.{export_format}.zip")
+    with ctx.Session() as db:
+        with open(archive_path, "wb") as f:
+            f.write(dataset_service._export_annotations(db, db.get(Dataset, dataset_id), export_format))
+
+    def run():
+        with ctx.Session() as db:
+            report = annotation_import_service.import_annotations(
+                db, db.get(Dataset, dataset_id), archive_path, export_format
+            )
+        return report["annotations_imported"]
+    return run
+
+_client = None
+
+def _get_client(ctx: BenchmarkContext) -> TestClient:
+    """TestClient da app, com a BD do benchmark e o utilizador sintético."""
+    global _client
+    if _client is None:
+        from main import app
+
+        def override_get_db():
+            db = ctx.Session()
+            try:
+                yield db
+            finally:
+                db.close()
+
+        async def override_get_async_db():
+            async with ctx.AsyncSession() as db:
+                yield db
+
+        def override_get_current_user():
+            with ctx.Session() as db:
+                return db.get(User, ctx.owner_id)
+
+        app.dependency_overrides[get_db] = override_get_db
+        app.dependency_overrides[get_async_db] = override_get_async_db
+        app.dependency_overrides[get_current_user] = override_get_current_user
+        _client = TestClient(app)
+    return _client
+
+def _api_case(ctx: BenchmarkContext, path: str):
+    client = _get_client(ctx)
+
+    def run():
+        response = client.get(path)
+        response.raise_for_status()
+        return len(response.content)
+    return run
+
+def _build_rows_case(ctx: BenchmarkContext, model_id: str, n_objects: int, min_confidence: float = 0.0):
+    with_masks = model_id == "yolov8n_seg"
+    class_names, _ = ia_service._resolve_class_names(None, model_id)
+    results = DenseResults(n_objects, n_classes=len(class_names), with_masks=with_masks)
+    db_image = Image(id=1, file_name="1.jpg", file_path="1/1.jpg", dataset_id=1)
+
+    def run():
+        return len(ia_service.build_annotation_rows(
+            None, results, db_image, model_id, provenance=model_id, min_confidence=min_confidence
+        ))
+    return run
+
+def _replace_case(ctx: BenchmarkContext, n_images: int, per_image: int):
+    # Reutiliza as primeiras imagens do primeiro dataset; cada ronda substitui as mesmas anotações
+    with ctx.Session() as db:
+        image_ids = [row.id for row in db.query(Image.id).filter(Image.dataset_id == 1).order_by(Image.id).limit(n_images)]
+    rng = random.Random(0)
+    rows = [
+        {
+            "annotation_type": "detection",
+            "class_label": rng.choice(CLASS_LABELS),
+            "confidence": rng.random(),
+            "geometry": {"x": rng.random(), "y": rng.random(), "width": 0.1, "height": 0.1},
+            "provenance": "bench",
+            "image_id": image_id,
+        }
+        for image_id in image_ids for _ in range(per_image)
+    ]
+
+    def run():
+        with ctx.Session() as db:
+            dataset_service.replace_image_annotations(db, 1, image_ids, rows, "bench")
+            db.commit()
+        return len(rows)
+    return run
+
+def _upload_case(ctx: BenchmarkContext, n_files: int):
+    counter = {"round": 0}
+
+    def run():
+        # Cada ronda grava num dataset novo, para não sobrescrever ficheiros
+        counter["round"] += 1
+        with ctx.Session() as db:
+            db_dataset = Dataset(name=f"upload-{counter['round']}", owner_id=ctx.owner_id)
+            db.add(db_dataset)
+            db.commit()
+            files = [
+                UploadFile(file=io.BytesIO(ctx.sample_jpeg), filename=f"upload_{i}.jpg")
+                for i in range(n_files)
+            ]
+            return len(dataset_service.save_uploaded_images(db, db_dataset, files))
+    return run
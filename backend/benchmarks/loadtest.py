@@ -0,0 +1,291 @@
+"""
+Teste de carga da API REST: utilizadores virtuais (asyncio + httpx) com uma
+mistura realista de pedidos, contra uma app já a correr ou arrancada aqui
+(--spawn) com o motor de inferência falso (INFERENCE_BACKEND=stub).
+
+Cenários:
+    mixed        login, listagem e detalhe dos datasets, upload de imagens,
+                 anotação e exportação, com pesos fixos (MIXED_WEIGHTS)
+    login_storm  leitores contínuos; a meio do teste entra uma rajada de logins.
+                 Compara a latência das rotas fora do /auth antes e durante a rajada.
+
+Uso (a partir de backend/):
+    python -m benchmarks.loadtest --spawn --workers 2 --users 20 --duration 60
+    python -m benchmarks.loadtest --base-url http://localhost:8000 --scenario login_storm --storm-users 50
+    python -m benchmarks.loadtest --spawn --output loadtest.json
+
+Reporta, por rota (template) e por fase, o débito e os percentis p50/p95/p99.
+"""
+import os
+import io
+import sys
+import json
+import time
+import uuid
+import random
+import asyncio
+import argparse
+import subprocess
+from collections import defaultdict
+from typing import Dict, List, Optional
+
+import httpx
+from PIL import Image as PILImage
+
+# Pesos das ações de cada utilizador no cenário 'mixed'
+MIXED_WEIGHTS = {
+    "list_datasets": 35,
+    "dataset_detail": 20,
+    "dataset_stats": 10,
+    "upload_images": 15,
+    "annotate": 8,
+    "export": 7,
+    "login": 5,
+}
+
+PASSWORD = "loadtest-password-123"
+
+class Recorder:
+    """Latências por (fase, rota), em segundos."""
+
+    def __init__(self):
+        self.phase = "main"
+        self.samples: Dict[tuple, List[float]] = defaultdict(list)
+        self.errors: Dict[tuple, int] = defaultdict(int)
+        self.phase_durations: Dict[str, float] = defaultdict(float)
+
+    async def request(self, client: httpx.AsyncClient, route: str, method: str, url: str, **kwargs) -> Optional[httpx.Response]:
+        key = (self.phase, route)
+        start = time.perf_counter()
+        try:
+            response = await client.request(method, url, **kwargs)
+        except httpx.HTTPError:
+            self.errors[key] += 1
+            return None
+        self.samples[key].append(time.perf_counter() - start)
+        if response.status_code >= 400:
+            self.errors[key] += 1
+        return response
+
+def percentile(sorted_values: List[float], q: float) -> float:
+    """Percentil pelo método do posto mais próximo."""
+    if not sorted_values:
+        return 0.0
+    index = max(int(round(q / 100 * len(sorted_values) + 0.5)) - 1, 0)
+    return sorted_values[min(index, len(sorted_values) - 1)]
+
+def _make_jpeg() -> bytes:
+    buffer = io.BytesIO()
+    PILImage.new("RGB", (640, 480), (120, 160, 200)).save(buffer, format="JPEG", quality=85)
+    return buffer.getvalue()
+
+async def _register_and_login(client: httpx.AsyncClient, recorder: Recorder, email: str) -> dict:
+    await client.post("/users/", json={"email": email, "password": PASSWORD})
+    response = await recorder.request(
+        client, "POST /auth/token", "POST", "/auth/token", data={"username": email, "password": PASSWORD}
+    )
+    if response is None or response.status_code != 200:
+        raise RuntimeError(f"Falha no login de {email}: {response.status_code if response else 'sem resposta'}")
+    return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+class VirtualUser:
+    """Um utilizador com o seu próprio dataset, que executa ações até ao fim do teste."""
+
+    def __init__(self, index: int, client: httpx.AsyncClient, recorder: Recorder, jpeg: bytes, run_id: str):
+        self.email = f"load-{run_id}-{index}@example.com"
+        self.client = client
+        self.recorder = recorder
+        self.jpeg = jpeg
+        self.rng = random.Random(index)
+        self.headers: dict = {}
+        self.dataset_id: Optional[int] = None
+        self.uploads = 0
+
+    async def setup(self):
+        self.headers = await _register_and_login(self.client, self.recorder, self.email)
+        response = await self.client.post(
+            "/datasets/", json={"name": f"load {self.email}", "model_id": "yolov8n_det"}, headers=self.headers
+        )
+        response.raise_for_status()
+        self.dataset_id = response.json()["id"]
+        await self.upload_images()
+
+    async def run(self, deadline: float, actions: Dict[str, int]):
+        names, weights = list(actions), list(actions.values())
+        while time.perf_counter() < deadline:
+            await getattr(self, self.rng.choices(names, weights)[0])()
+
+    async def list_datasets(self):
+        await self.recorder.request(self.client, "GET /datasets/", "GET", "/datasets/", headers=self.headers)
+
+    async def dataset_detail(self):
+        await self.recorder.request(
+            self.client, "GET /datasets/{id}", "GET", f"/datasets/{self.dataset_id}", headers=self.headers
+        )
+
+    async def dataset_stats(self):
+        await self.recorder.request(
+            self.client, "GET /datasets/{id}/stats", "GET", f"/datasets/{self.dataset_id}/stats", headers=self.headers
+        )
+
+    async def upload_images(self):
+        files = []
+        for _ in range(2):
+            self.uploads += 1
+            files.append(("files", (f"img_{self.uploads}.jpg", self.jpeg, "image/jpeg")))
+        await self.recorder.request(
+            self.client, "POST /datasets/{id}/images/", "POST", f"/datasets/{self.dataset_id}/images/",
+            files=files, headers=self.headers
+        )
+
+    async def annotate(self):
+        await self.recorder.request(
+            self.client, "POST /datasets/{id}/annotate", "POST", f"/datasets/{self.dataset_id}/annotate",
+            headers=self.headers
+        )
+
+    async def export(self):
+        await self.recorder.request(
+            self.client, "GET /datasets/{id}/export/yolo", "GET", f"/datasets/{self.dataset_id}/export/yolo",
+            headers=self.headers
+        )
+
+    async def login(self):
+        await self.recorder.request(
+            self.client, "POST /auth/token", "POST", "/auth/token",
+            data={"username": self.email, "password": PASSWORD}
+        )
+
+async def _login_storm(client: httpx.AsyncClient, recorder: Recorder, email: str, deadline: float):
+    while time.perf_counter() < deadline:
+        await recorder.request(
+            client, "POST /auth/token", "POST", "/auth/token", data={"username": email, "password": PASSWORD}
+        )
+
+async def run_load_test(args) -> Recorder:
+    recorder = Recorder()
+    jpeg = _make_jpeg()
+    run_id = uuid.uuid4().hex[:8]
+    limits = httpx.Limits(max_connections=args.users + args.storm_users + 10)
+
+    async with httpx.AsyncClient(base_url=args.base_url, timeout=args.timeout, limits=limits) as client:
+        recorder.phase = "setup"
+        users = [VirtualUser(i, client, recorder, jpeg, run_id) for i in range(args.users)]
+        await asyncio.gather(*(user.setup() for user in users))
+
+        if args.scenario == "mixed":
+            recorder.phase = "main"
+            start = time.perf_counter()
+            await asyncio.gather(*(user.run(start + args.duration, MIXED_WEIGHTS) for user in users))
+            recorder.phase_durations["main"] = time.perf_counter() - start
+        else:
+            # Só leituras autenticadas: são elas que não devem sofrer com a rajada de logins
+            readers = {"list_datasets": 2, "dataset_detail": 1, "dataset_stats": 1}
+            storm_email = f"storm-{run_id}@example.com"
+            await client.post("/users/", json={"email": storm_email, "password": PASSWORD})
+
+            half = args.duration / 2
+            recorder.phase = "baseline"
+            start = time.perf_counter()
+            await asyncio.gather(*(user.run(start + half, readers) for user in users))
+            recorder.phase_durations["baseline"] = time.perf_counter() - start
+
+            recorder.phase = "storm"
+            start = time.perf_counter()
+            deadline = start + half
+            await asyncio.gather(
+                *(user.run(deadline, readers) for user in users),
+                *(_login_storm(client, recorder, storm_email, deadline) for _ in range(args.storm_users)),
+            )
+            recorder.phase_durations["storm"] = time.perf_counter() - start
+
+    return recorder
+
+def build_report(recorder: Recorder) -> dict:
+    report = {}
+    for (phase, route), samples in sorted(recorder.samples.items()):
+        if phase == "setup":
+            continue
+        samples = sorted(samples)
+        duration = recorder.phase_durations.get(phase) or 1.0
+        report.setdefault(phase, {})[route] = {
+            "requests": len(samples),
+            "errors": recorder.errors.get((phase, route), 0),
+            "rps": len(samples) / duration,
+            "p50_ms": percentile(samples, 50) * 1000,
+            "p95_ms": percentile(samples, 95) * 1000,
+            "p99_ms": percentile(samples, 99) * 1000,
+        }
+    return report
+
+def print_report(report: dict):
+    for phase, routes in report.items():
+        print(f"\n--- fase: {phase} ---")
+        print(f"{'rota':<36} {'pedidos':>8} {'erros':>6} {'req/s':>8} {'p50':>9} {'p95':>9} {'p99':>9}")
+        for route, stats in routes.items():
+            print(f"{route:<36} {stats['requests']:8d} {stats['errors']:6d} {stats['rps']:8.1f} "
+                  f"{stats['p50_ms']:7.1f}ms {stats['p95_ms']:7.1f}ms {stats['p99_ms']:7.1f}ms")
+
+    if "baseline" in report and "storm" in report:
+        print("\n--- p99 das rotas fora do /auth: antes -> durante a rajada de logins ---")
+        for route, stats in report["baseline"].items():
+            if route.startswith("POST /auth") or route not in report["storm"]:
+                continue
+            after = report["storm"][route]["p99_ms"]
+            print(f"{route:<36} {stats['p99_ms']:8.1f}ms -> {after:8.1f}ms ({after / max(stats['p99_ms'], 1e-9):.2f}x)")
+
+def _spawn_app(args) -> subprocess.Popen:
+    """Arranca o uvicorn com o motor de inferência falso e espera que responda."""
+    env = dict(os.environ, INFERENCE_BACKEND="stub")
+    command = [
+        sys.executable, "-m", "uvicorn", "main:app",
+        "--host", "127.0.0.1", "--port", str(args.port), "--workers", str(args.workers), "--log-level", "warning",
+    ]
+    process = subprocess.Popen(command, env=env, cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    for _ in range(120):
+        try:
+            if httpx.get(f"{args.base_url}/health/db", timeout=1).status_code == 200:
+                return process
+        except httpx.HTTPError:
+            pass
+        if process.poll() is not None:
+            raise RuntimeError("O uvicorn terminou antes de ficar pronto.")
+        time.sleep(0.5)
+    process.terminate()
+    raise RuntimeError("A app não ficou pronta a tempo.")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--base-url", default=None, help="URL da app (por omissão http://127.0.0.1:<port>)")
+    parser.add_argument("--spawn", action="store_true", help="Arranca o uvicorn aqui, com INFERENCE_BACKEND=stub")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--workers", type=int, default=1, help="Workers do uvicorn (com --spawn)")
+    parser.add_argument("--scenario", choices=("mixed", "login_storm"), default="mixed")
+    parser.add_argument("--users", type=int, default=10, help="Utilizadores virtuais")
+    parser.add_argument("--storm-users", type=int, default=30, help="Clientes da rajada de logins (login_storm)")
+    parser.add_argument("--duration", type=float, default=30, help="Segundos de carga (o login_storm divide-os em duas fases)")
+    parser.add_argument("--timeout", type=float, default=60)
+    parser.add_argument("--output", default=None, help="Grava o relatório neste JSON")
+    args = parser.parse_args()
+    args.base_url = args.base_url or f"http://127.0.0.1:{args.port}"
+    if args.scenario == "mixed":
+        args.storm_users = 0
+
+    process = _spawn_app(args) if args.spawn else None
+    try:
+        recorder = asyncio.run(run_load_test(args))
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait()
+
+    report = build_report(recorder)
+    print_report(report)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"scenario": args.scenario, "users": args.users, "storm_users": args.storm_users,
+                       "workers": args.workers, "phases": report}, f, indent=2)
+        print(f"\nRelatório gravado em {args.output}")
+
+if __name__ == "__main__":
+    main()
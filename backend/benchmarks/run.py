@@ -0,0 +1,132 @@
+"""
+Benchmark dos caminhos críticos do backend: exportadores, conversão dos
+resultados do modelo em anotações, gravação em massa, upload de imagens e
+serialização da listagem/detalhe dos datasets, sobre datasets sintéticos.
+
+Uso (a partir de backend/):
+    python -m benchmarks.run --sizes 1000,10000 --output benchmarks/baselines/main.json
+    python -m benchmarks.run --sizes 1000,10000 --compare benchmarks/baselines/main.json
+    python -m benchmarks.run --url postgresql://... --sizes 100000 --only export
+
+Com --compare, os casos cuja mediana piorou mais do que --threshold (20% por
+omissão) em relação à baseline são assinalados e o processo termina com código 1.
+Atenção: a BD indicada em --url é APAGADA e recriada.
+"""
+import os
+import sys
+import json
+import time
+import platform
+import argparse
+import tempfile
+import statistics
+import datetime
+from typing import Dict
+
+# Os módulos da app leem a configuração do .env; o benchmark não precisa de uma BD real
+os.environ.setdefault("DATABASE_URL", "sqlite:///./benchmark.db")
+os.environ.setdefault("SECRET_KEY", "benchmark")
+os.environ.setdefault("ALGORITHM", "HS256")
+os.environ.setdefault("ACCESS_TOKEN_EXPIRE_MINUTES", "30")
+
+# Adiciona o diretório raiz do projeto ao path do Python
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.cases import BenchmarkContext, build_cases, drain_background_work
+
+def measure(fn, rounds: int, warmup: int = 1) -> Dict[str, float]:
+    for _ in range(warmup):
+        fn()
+    timings = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return {
+        "median": statistics.median(timings),
+        "min": min(timings),
+        "max": max(timings),
+        "rounds": rounds,
+    }
+
+def compare(results: Dict[str, dict], baseline: Dict[str, dict], threshold: float) -> int:
+    """Imprime a comparação com a baseline e devolve o nº de regressões."""
+    regressions = 0
+    print(f"\n{'caso':<48} {'baseline':>12} {'atual':>12} {'variação':>10}")
+    for name, result in results.items():
+        if name not in baseline:
+            print(f"{name:<48} {'-':>12} {result['median'] * 1000:10.1f}ms {'(novo)':>10}")
+            continue
+        before, after = baseline[name]["median"], result["median"]
+        change = after / max(before, 1e-9) - 1
+        flag = ""
+        if change > threshold:
+            flag = "  <-- REGRESSÃO"
+            regressions += 1
+        elif change < -threshold:
+            flag = "  (melhoria)"
+        print(f"{name:<48} {before * 1000:10.1f}ms {after * 1000:10.1f}ms {change:+9.0%}{flag}")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default=None, help="BD do benchmark (é recriada); por omissão um SQLite temporário")
+    parser.add_argument("--sizes", default="1000", help="Nº de imagens dos datasets sintéticos, separados por vírgulas")
+    parser.add_argument("--annotations-per-image", type=int, default=10)
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--only", default=None, help="Só corre os casos cujo nome contém este texto")
+    parser.add_argument("--output", default=None, help="Grava os resultados neste JSON (ex.: uma nova baseline)")
+    parser.add_argument("--compare", default=None, help="JSON de uma execução anterior com que comparar")
+    parser.add_argument("--threshold", type=float, default=0.2, help="Piora relativa da mediana considerada regressão")
+    args = parser.parse_args()
+
+    sizes = [int(size) for size in args.sizes.split(",") if size]
+    with tempfile.TemporaryDirectory(prefix="adaptlabelx-bench-") as workdir:
+        url = args.url or f"sqlite:///{os.path.join(workdir, 'benchmark.db')}"
+        ctx = BenchmarkContext(url, workdir)
+        ctx.reset_schema()
+
+        cases, populate_timings = build_cases(ctx, sizes, args.annotations_per_image)
+        results: Dict[str, dict] = {
+            name: {"median": seconds, "min": seconds, "max": seconds, "rounds": 1}
+            for name, seconds in populate_timings.items()
+        }
+
+        for name, fn in cases.items():
+            if args.only and args.only not in name:
+                continue
+            results[name] = measure(fn, args.rounds)
+            print(f"{name:<48} mediana {results[name]['median'] * 1000:10.1f} ms "
+                  f"(min {results[name]['min'] * 1000:.1f} ms)")
+
+        drain_background_work()
+        ctx.engine.dispose()
+
+    report = {
+        "meta": {
+            "created_at": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "database": ctx.engine.dialect.name,
+            "sizes": sizes,
+            "annotations_per_image": args.annotations_per_image,
+            "rounds": args.rounds,
+        },
+        "results": results,
+    }
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nResultados gravados em {args.output}")
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            baseline = json.load(f)["results"]
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print(f"\n{regressions} regressão(ões) acima de {args.threshold:.0%}.")
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
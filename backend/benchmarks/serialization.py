@@ -0,0 +1,78 @@
+"""
+Custo de CPU por MB da resposta do detalhe de um dataset (GET /datasets/{id}):
+  pydantic  - o caminho anterior: árvore Dataset -> Image -> Annotation carregada
+              no ORM, validada com from_attributes e serializada pelo Pydantic
+  streamed  - dataset_service.iter_dataset_json: linhas lidas diretamente da BD
+              e geometria copiada como texto JSON, em pedaços
+
+Uso (a partir de backend/):
+    python -m benchmarks.serialization --sizes 1000,10000 --annotations-per-image 20
+"""
+import os
+import sys
+import time
+import argparse
+import tempfile
+import statistics
+
+os.environ.setdefault("DATABASE_URL", "sqlite:///./benchmark.db")
+os.environ.setdefault("SECRET_KEY", "benchmark")
+os.environ.setdefault("ALGORITHM", "HS256")
+os.environ.setdefault("ACCESS_TOKEN_EXPIRE_MINUTES", "30")
+
+# Adiciona o diretório raiz do projeto ao path do Python
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pydantic import TypeAdapter
+
+from benchmarks.cases import BenchmarkContext, populate_dataset
+from app.models.dataset import Dataset
+from app.schemas.dataset import Dataset as DatasetSchema
+from app.services import dataset_service
+
+def serialize_pydantic(ctx: BenchmarkContext, dataset_id: int) -> bytes:
+    adapter = TypeAdapter(DatasetSchema)
+    with ctx.Session() as db:
+        db_dataset = db.get(Dataset, dataset_id)
+        return adapter.dump_json(adapter.validate_python(db_dataset, from_attributes=True))
+
+def serialize_streamed(ctx: BenchmarkContext, dataset_id: int) -> bytes:
+    with ctx.Session() as db:
+        db_dataset = db.get(Dataset, dataset_id)
+        return b"".join(dataset_service.iter_dataset_json(db, db_dataset))
+
+def measure_cpu(fn, rounds: int):
+    """Devolve (mediana do tempo de CPU do processo em segundos, bytes da resposta)."""
+    size = len(fn())
+    timings = []
+    for _ in range(rounds):
+        start = time.process_time()
+        fn()
+        timings.append(time.process_time() - start)
+    return statistics.median(timings), size
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default=None, help="BD do benchmark (é recriada); por omissão um SQLite temporário")
+    parser.add_argument("--sizes", default="1000")
+    parser.add_argument("--annotations-per-image", type=int, default=20)
+    parser.add_argument("--rounds", type=int, default=3)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="adaptlabelx-bench-") as workdir:
+        ctx = BenchmarkContext(args.url or f"sqlite:///{os.path.join(workdir, 'benchmark.db')}", workdir)
+        ctx.reset_schema()
+
+        print(f"{'dataset':<14} {'caminho':<10} {'MB':>8} {'CPU':>10} {'CPU/MB':>12}")
+        for dataset_id, n_images in enumerate((int(size) for size in args.sizes.split(",")), start=1):
+            populate_dataset(ctx, dataset_id, n_images, args.annotations_per_image)
+            for label, fn in (("pydantic", serialize_pydantic), ("streamed", serialize_streamed)):
+                cpu_seconds, size = measure_cpu(lambda: fn(ctx, dataset_id), args.rounds)
+                megabytes = size / 1e6
+                print(f"{n_images:>7} imgs   {label:<10} {megabytes:8.2f} {cpu_seconds * 1000:8.0f}ms "
+                      f"{cpu_seconds * 1000 / megabytes:9.0f}ms/MB")
+
+        ctx.engine.dispose()
+
+if __name__ == "__main__":
+    main()
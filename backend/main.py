@@ -1,18 +1,29 @@
 import os
+import threading
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.cors import CORSMiddleware
 
-from app.core.database import engine, Base
 # Importar todos os seus endpoints
-from app.api.endpoints import users, auth, datasets, models, custom_models
-# Importar os seus modelos da BD para que o create_all funcione
+from app.api.endpoints import users, auth, datasets, models, custom_models, images, health, metrics
+from app.core.config import settings
+from app.core.metrics import MetricsMiddleware
+from app.core.tracing import TracingMiddleware, setup_tracing
+# Importar os seus modelos da BD para que todas as relações fiquem registadas.
+# O esquema é gerido pelo Alembic ('alembic upgrade head'), não pela app.
 from app.models import user, dataset, annotation, custom_model
+from app.services import dataset_service
 
-# Criar tabelas (Isto agora vai criar as tabelas corrigidas)
-Base.metadata.create_all(bind=engine)
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Sem isto, um dataset deixado em 'deleting' por um crash ficava escondido, com as linhas
+    # e os ficheiros em disco, até à próxima remoção. Numa thread, para não atrasar o arranque
+    if settings.DATASET_JANITOR_ON_STARTUP:
+        threading.Thread(target=dataset_service.purge_deleted_datasets, name="dataset-janitor", daemon=True).start()
+    yield
 
-app = FastAPI(title="AdaptLabelX API")
+app = FastAPI(title="AdaptLabelX API", lifespan=lifespan)
 
 # Criar a pasta 'uploads' se ela não existir
 os.makedirs("uploads", exist_ok=True)
@@ -31,12 +42,22 @@ app.add_middleware(
     allow_headers=["*"], # Permite todos os headers
 )
 
+# Latência de cada pedido, por template de rota (exposta em /metrics)
+app.add_middleware(MetricsMiddleware)
+
+# Um span por pedido (TRACING_EXPORTER); os spans das etapas ficam debaixo dele
+setup_tracing()
+app.add_middleware(TracingMiddleware)
+
 # Incluir os routers da API
 app.include_router(auth.router, prefix="/auth", tags=["auth"])
 app.include_router(users.router, prefix="/users", tags=["users"])
 app.include_router(datasets.router, prefix="/datasets", tags=["datasets"])
+app.include_router(images.router, prefix="/images", tags=["images"])
 app.include_router(custom_models.router, prefix="/custom-models", tags=["custom_models"])
 app.include_router(models.router, prefix="/models", tags=["models"]) 
+app.include_router(health.router, prefix="/health", tags=["health"])
+app.include_router(metrics.router, tags=["metrics"])
 
 @app.get("/")
 def read_root():
@@ -0,0 +1,43 @@
+"""
+Extrai os metadados (classes, tarefa, nº de parâmetros, hash) dos modelos
+customizados enviados antes da migração 0007, ou cuja extração falhou.
+
+Uso (a partir de backend/):
+    python scripts/backfill_model_metadata.py
+"""
+import sys
+import os
+import hashlib
+
+# Adiciona o diretório raiz do projeto ao path do Python
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.core.database import SessionLocal
+from app.models.custom_model import CustomModel
+from app.models import user, dataset, annotation
+from app.services import model_metadata_service
+
+def file_sha256(path: str) -> str:
+    sha256 = hashlib.sha256()
+    with open(path, "rb") as f:
+        while chunk := f.read(1024 * 1024):
+            sha256.update(chunk)
+    return sha256.hexdigest()
+
+db = SessionLocal()
+try:
+    models = db.query(CustomModel).filter(
+        CustomModel.metadata_status != model_metadata_service.METADATA_STATUS_READY
+    ).order_by(CustomModel.id).all()
+    print(f"{len(models)} modelo(s) sem metadados.")
+
+    for db_model in models:
+        if not os.path.exists(db_model.file_path):
+            print(f"Modelo {db_model.id}: ficheiro {db_model.file_path} não encontrado.")
+            continue
+        if db_model.file_sha256 is None:
+            db_model.file_sha256 = file_sha256(db_model.file_path)
+            db_model.file_size = os.path.getsize(db_model.file_path)
+        model_metadata_service.apply_model_metadata(db, db_model)
+finally:
+    db.close()
@@ -0,0 +1,196 @@
+"""
+Benchmark das consultas mais pesadas sobre anotações, numa BD sintética,
+com e sem os índices da migração 0003.
+
+Uso (a partir de backend/):
+    python scripts/benchmark_annotation_queries.py --url postgresql://... --annotations 10000000
+    python scripts/benchmark_annotation_queries.py --skip-populate   # reutiliza a BD já criada
+
+Atenção: a BD indicada em --url é APAGADA e recriada (exceto com --skip-populate).
+"""
+import sys
+import os
+import time
+import random
+import argparse
+import statistics
+
+# Adiciona o diretório raiz do projeto ao path do Python
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import create_engine, insert, func
+from sqlalchemy.orm import sessionmaker
+
+from app.core.base import Base
+from app.models.user import User
+from app.models.dataset import Dataset, Image
+from app.models.annotation import Annotation
+from app.models import custom_model
+
+# Índices acrescentados pela migração 0003
+BENCHMARK_INDEXES = (
+    "ix_annotations_image_id",
+    "ix_annotations_class_label_image_id",
+    "ix_images_dataset_id",
+)
+
+CLASS_LABELS = ["person", "car", "dog", "cat", "bicycle", "truck", "bus", "bird", "boat", "chair"]
+INSERT_CHUNK_SIZE = 50_000
+
+def populate(engine, n_datasets: int, n_annotations: int, annotations_per_image: int):
+    """Cria o esquema e insere os dados sintéticos em lotes."""
+    Base.metadata.drop_all(engine)
+    Base.metadata.create_all(engine)
+
+    n_images = max(n_annotations // annotations_per_image, 1)
+    images_per_dataset = max(n_images // n_datasets, 1)
+    print(f"A criar {n_datasets} datasets, {n_images} imagens e {n_annotations} anotações...")
+    start = time.perf_counter()
+
+    with engine.begin() as conn:
+        conn.execute(insert(User), [{"id": 1, "email": "bench@example.com", "hashed_password": "x"}])
+        conn.execute(insert(Dataset), [
+            {"id": i + 1, "name": f"bench-{i + 1}", "owner_id": 1} for i in range(n_datasets)
+        ])
+
+    rng = random.Random(42)
+    image_rows, annotation_rows = [], []
+    annotation_id = 0
+    with engine.begin() as conn:
+        for image_id in range(1, n_images + 1):
+            # ~10% das imagens ficam sem anotações (alvo do filtro "imagens novas")
+            annotated = image_id % 10 != 0
+            image_rows.append({
+                "id": image_id,
+                "file_name": f"{image_id}.jpg",
+                "file_path": f"bench/{image_id}.jpg",
+                "dataset_id": (image_id - 1) // images_per_dataset % n_datasets + 1,
+                "annotation_provenance": "yolov8n_det|" if annotated else None,
+            })
+            if annotated:
+                for _ in range(annotations_per_image):
+                    if annotation_id >= n_annotations:
+                        break
+                    annotation_id += 1
+                    annotation_rows.append({
+                        "id": annotation_id,
+                        "annotation_type": "detection",
+                        "class_label": rng.choice(CLASS_LABELS),
+                        "geometry": {"x": 0.5, "y": 0.5, "width": 0.1, "height": 0.1},
+                        "confidence": 0.9,
+                        "image_id": image_id,
+                    })
+
+            if len(image_rows) >= INSERT_CHUNK_SIZE:
+                conn.execute(insert(Image), image_rows)
+                image_rows = []
+            if len(annotation_rows) >= INSERT_CHUNK_SIZE:
+                conn.execute(insert(Annotation), annotation_rows)
+                annotation_rows = []
+                print(f"  {annotation_id} anotações inseridas...", end="\r")
+
+        if image_rows:
+            conn.execute(insert(Image), image_rows)
+        if annotation_rows:
+            conn.execute(insert(Annotation), annotation_rows)
+
+    print(f"\nBD sintética criada em {time.perf_counter() - start:.1f}s")
+    return n_images
+
+def set_indexes(engine, enabled: bool):
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            if index.name in BENCHMARK_INDEXES:
+                if enabled:
+                    index.create(engine, checkfirst=True)
+                else:
+                    index.drop(engine, checkfirst=True)
+    with engine.begin() as conn:
+        if engine.dialect.name in ("postgresql", "sqlite"):
+            # Atualiza as estatísticas do planeador depois de criar/apagar índices
+            conn.exec_driver_sql("ANALYZE")
+
+def build_queries(db, dataset_id: int, sample_image_ids):
+    """As mesmas consultas que o dataset_service faz (nome -> função)."""
+    def new_images():
+        return db.query(Image.id).filter(
+            Image.dataset_id == dataset_id,
+            Image.annotation_provenance.is_(None),
+            ~Image.annotations.any()
+        ).all()
+
+    def export_class_names():
+        return db.query(Annotation.class_label).join(Image).filter(
+            Image.dataset_id == dataset_id
+        ).distinct().all()
+
+    def per_image_annotations():
+        for image_id in sample_image_ids:
+            db.query(Annotation).filter(Annotation.image_id == image_id).all()
+
+    def class_counts():
+        return db.query(Annotation.class_label, func.count(Annotation.id)).join(Image).filter(
+            Image.dataset_id == dataset_id
+        ).group_by(Annotation.class_label).all()
+
+    def delete_dataset_annotations():
+        image_ids = db.query(Image.id).filter(Image.dataset_id == dataset_id).scalar_subquery()
+        db.query(Annotation).filter(Annotation.image_id.in_(image_ids)).delete(synchronize_session=False)
+        db.rollback()
+
+    return {
+        "imagens novas (NOT EXISTS)": new_images,
+        "classes da exportação (DISTINCT)": export_class_names,
+        f"anotações de {len(sample_image_ids)} imagens": per_image_annotations,
+        "contagem por classe (GROUP BY)": class_counts,
+        "apagar anotações do dataset": delete_dataset_annotations,
+    }
+
+def run_benchmark(engine, n_images: int, dataset_id: int, repeat: int):
+    Session = sessionmaker(bind=engine, autoflush=False)
+    rng = random.Random(7)
+    sample_image_ids = [rng.randint(1, n_images) for _ in range(200)]
+
+    results = {}
+    for label, enabled in (("sem índices", False), ("com índices", True)):
+        print(f"\n--- {label} ---")
+        set_indexes(engine, enabled)
+        db = Session()
+        try:
+            for name, query in build_queries(db, dataset_id, sample_image_ids).items():
+                timings = []
+                for _ in range(repeat):
+                    start = time.perf_counter()
+                    query()
+                    timings.append(time.perf_counter() - start)
+                results[(name, label)] = statistics.median(timings)
+                print(f"{name:<40} {results[(name, label)] * 1000:10.1f} ms")
+        finally:
+            db.close()
+
+    print("\n--- Resumo (mediana) ---")
+    for name in build_queries(None, dataset_id, sample_image_ids):
+        before, after = results[(name, "sem índices")], results[(name, "com índices")]
+        print(f"{name:<40} {before * 1000:10.1f} ms -> {after * 1000:10.1f} ms  ({before / max(after, 1e-9):.1f}x)")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="sqlite:///benchmark.db", help="BD sintética (é recriada)")
+    parser.add_argument("--annotations", type=int, default=10_000_000)
+    parser.add_argument("--annotations-per-image", type=int, default=20)
+    parser.add_argument("--datasets", type=int, default=10)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--skip-populate", action="store_true")
+    args = parser.parse_args()
+
+    engine = create_engine(args.url)
+    if args.skip_populate:
+        with engine.connect() as conn:
+            n_images = conn.execute(func.max(Image.id).select()).scalar() or 0
+    else:
+        n_images = populate(engine, args.datasets, args.annotations, args.annotations_per_image)
+
+    run_benchmark(engine, n_images, dataset_id=1, repeat=args.repeat)
+
+if __name__ == "__main__":
+    main()
@@ -1,17 +1,25 @@
 import pytest
 from fastapi.testclient import TestClient
 from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker
-from sqlalchemy.pool import StaticPool
+from sqlalchemy.pool import NullPool, StaticPool
 
 from main import app # Importa a sua app principal
-from app.core.database import get_db, Base
+from app.core.database import get_async_db, get_db, Base
+from app.core.config import settings
 
 # Importar os seus modelos a partir de 'app.models' (como no seu main.py)
 from app.models import user, dataset, annotation, custom_model
+from app.services import (
+    dataset_service, export_job_service, image_derivative_service, import_job_service, model_upload_service
+)
 
 # --- 1. Configurar a Base de Dados de Teste (SQLite em memória) ---
-SQLALCHEMY_DATABASE_URL = "sqlite:///:memory:"
+# Em 'cache partilhada', para que o motor síncrono e o assíncrono (aiosqlite) vejam
+# a mesma BD. Ela existe enquanto a ligação do StaticPool síncrono estiver aberta.
+SQLALCHEMY_DATABASE_URL = "sqlite:///file:adaptlabelx_test?mode=memory&cache=shared&uri=true"
+ASYNC_SQLALCHEMY_DATABASE_URL = "sqlite+aiosqlite:///file:adaptlabelx_test?mode=memory&cache=shared&uri=true"
 
 engine = create_engine(
     SQLALCHEMY_DATABASE_URL,
@@ -20,6 +28,10 @@ engine = create_engine(
 )
 TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# Sem pool: cada pedido abre a sua ligação no event loop do TestClient que o serve
+async_engine = create_async_engine(ASYNC_SQLALCHEMY_DATABASE_URL, poolclass=NullPool)
+TestingAsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
 # --- 2. Criar as tabelas na BD de teste ---
 Base.metadata.create_all(bind=engine)
 
@@ -34,14 +46,50 @@ def override_get_db():
     finally:
         db.close()
 
+async def override_get_async_db():
+    """
+    A versão assíncrona, sobre a mesma base de dados de teste.
+    """
+    async with TestingAsyncSessionLocal() as db:
+        yield db
+
 # --- 4. Dizer à app FastAPI para USAR a nossa "falsa" BD ---
 app.dependency_overrides[get_db] = override_get_db
+app.dependency_overrides[get_async_db] = override_get_async_db
+
+# O janitor do arranque usaria a BD e as pastas reais (os testes que o cobrem ligam-no)
+settings.DATASET_JANITOR_ON_STARTUP = False
+
+# --- 5. Pastas de ficheiros isoladas por teste ---
+@pytest.fixture(autouse=True)
+def isolated_storage(monkeypatch, tmp_path):
+    """
+    Aponta as pastas de uploads, cache de exportação, derivadas e tarefas para o
+    tmp_path do teste, para nenhum teste escrever nas pastas reais do backend.
+    """
+    monkeypatch.setattr(dataset_service, "UPLOAD_DIRECTORY", str(tmp_path / "uploads"))
+    monkeypatch.setattr(dataset_service, "EXPORT_CACHE_DIRECTORY", str(tmp_path / "export_cache"))
+    monkeypatch.setattr(image_derivative_service, "DERIVATIVE_DIRECTORY", str(tmp_path / "derivatives"))
+    monkeypatch.setattr(model_upload_service, "MODEL_UPLOADS_DIRECTORY", str(tmp_path / "model_uploads"))
+    monkeypatch.setattr(export_job_service._registry, "directory", str(tmp_path / "export_jobs"))
+    monkeypatch.setattr(import_job_service._registry, "directory", str(tmp_path / "import_jobs"))
 
-# --- 5. Criar o "Cliente de Teste" ---
+# --- 6. Criar o "Cliente de Teste" ---
 @pytest.fixture(scope="module")
 def client():
     """
     Disponibiliza um TestClient para os nossos testes.
     """
     with TestClient(app) as c:
-        yield c
\ No newline at end of file
+        yield c
+
+@pytest.fixture()
+def db_session():
+    """
+    Disponibiliza uma sessão direta sobre a base de dados de teste.
+    """
+    db = TestingSessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
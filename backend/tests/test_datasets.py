@@ -0,0 +1,798 @@
+import pytest
+from fastapi.testclient import TestClient
+
+from app.models.annotation import Annotation
+from app.models.dataset import Dataset, Image
+from app.services import dataset_service
+
+
+def _auth_headers(client: TestClient, email: str, password: str = "testpassword123"):
+    client.post("/users/", json={"email": email, "password": password})
+    response = client.post("/auth/token", data={"username": email, "password": password})
+    return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+
+def test_annotation_provenance_ignores_classes_for_custom_models():
+    """
+    O filtro de classes só entra na assinatura dos modelos padrão.
+    """
+    standard = Dataset(model_id="yolov8n_det", classes_to_annotate=["person", "car"])
+    custom = Dataset(model_id="7", classes_to_annotate=["person"])
+
+    assert dataset_service.get_annotation_provenance(standard) == "yolov8n_det|car,person"
+    assert dataset_service.get_annotation_provenance(custom) == "7|"
+
+
+def test_replace_image_annotations_in_bulk(db_session):
+    """
+    As anotações antigas do lote são substituídas e a proveniência é atualizada.
+    """
+    db_dataset = Dataset(name="bulk", model_id="yolov8n_det")
+    db_session.add(db_dataset)
+    db_session.commit()
+    images = [
+        Image(file_name=f"{i}.jpg", file_path=f"bulk/{i}.jpg", dataset_id=db_dataset.id)
+        for i in range(2)
+    ]
+    db_session.add_all(images)
+    db_session.commit()
+    db_session.add(Annotation(class_label="dog", confidence=0.5, geometry={}, image_id=images[0].id))
+    db_session.commit()
+
+    rows = [
+        {"annotation_type": "detection", "class_label": "cat", "confidence": 0.9,
+         "geometry": {"x": 0.5, "y": 0.5, "width": 0.1, "height": 0.1},
+         "provenance": "yolov8n_det|", "image_id": image.id}
+        for image in images
+    ]
+    dataset_service.replace_image_annotations(db_session, db_dataset.id, [img.id for img in images], rows, "yolov8n_det|")
+    db_session.commit()
+
+    labels = [a.class_label for a in db_session.query(Annotation).filter(
+        Annotation.image_id.in_([img.id for img in images]))]
+    assert labels == ["cat", "cat"]
+    for image in images:
+        db_session.refresh(image)
+        assert image.annotation_provenance == "yolov8n_det|"
+
+
+def test_reannotate_updates_dataset_config(client: TestClient):
+    """
+    A rota de re-anotação grava o novo modelo e devolve a nova assinatura.
+    """
+    headers = _auth_headers(client, "reannotate@example.com")
+    response = client.post("/datasets/", json={"name": "ds", "model_id": "yolov8n_det"}, headers=headers)
+    dataset_id = response.json()["id"]
+
+    response = client.post(
+        f"/datasets/{dataset_id}/reannotate",
+        json={"model_id": "yolov8n_seg", "classes_to_annotate": ["person"]},
+        headers=headers,
+    )
+
+    assert response.status_code == 202
+    assert response.json()["provenance"] == "yolov8n_seg|person"
+    assert client.get(f"/datasets/{dataset_id}", headers=headers).json()["model_id"] == "yolov8n_seg"
+
+
+def test_reannotate_without_a_model_keeps_the_dataset_config(client: TestClient):
+    """
+    Um pedido que deixaria o dataset sem modelo é recusado antes de gravar a configuração.
+    """
+    headers = _auth_headers(client, "reannotate-nomodel@example.com")
+    response = client.post("/datasets/", json={"name": "ds", "model_id": "yolov8n_det"}, headers=headers)
+    dataset_id = response.json()["id"]
+
+    response = client.post(
+        f"/datasets/{dataset_id}/reannotate",
+        json={"model_id": None, "classes_to_annotate": ["person"]},
+        headers=headers,
+    )
+
+    assert response.status_code == 400
+    assert client.get(f"/datasets/{dataset_id}", headers=headers).json()["model_id"] == "yolov8n_det"
+
+
+def _create_annotated_dataset(db_session, name: str, n_images: int = 3):
+    db_dataset = Dataset(name=name, model_id="yolov8n_det")
+    db_session.add(db_dataset)
+    db_session.commit()
+    images = [
+        Image(file_name=f"{i}.jpg", file_path=f"{name}/{i}.jpg", dataset_id=db_dataset.id)
+        for i in range(n_images)
+    ]
+    db_session.add_all(images)
+    db_session.commit()
+    rows = [
+        {"annotation_type": "detection", "class_label": "cat", "confidence": 0.9,
+         "geometry": {"x": 0.5, "y": 0.5, "width": 0.2, "height": 0.2},
+         "provenance": "yolov8n_det|", "image_id": image.id}
+        for image in images
+    ]
+    dataset_service.replace_image_annotations(db_session, db_dataset.id, [img.id for img in images], rows, "yolov8n_det|")
+    db_session.commit()
+    db_session.refresh(db_dataset)
+    return db_dataset, images
+
+
+def test_reannotation_keeps_imported_annotations_unless_requested(db_session, monkeypatch):
+    """
+    A re-anotação não substitui anotações importadas ("import:<formato>"), exceto com include_imported.
+    """
+    from sqlalchemy.orm import scoped_session
+    from tests.conftest import TestingSessionLocal
+
+    db_dataset, images = _create_annotated_dataset(db_session, "reannotate-imported")
+    images[1].annotation_provenance = "import:coco"
+    db_dataset.model_id = "yolov8n_seg"
+    db_session.commit()
+
+    annotated = []
+    monkeypatch.setattr(dataset_service, "BackgroundSession", scoped_session(TestingSessionLocal))
+    monkeypatch.setattr(dataset_service, "_annotate_images_in_batches", lambda db, dataset, image_ids: annotated.append(image_ids))
+
+    dataset_service.run_reannotation_for_dataset(db_dataset.id)
+    dataset_service.run_reannotation_for_dataset(db_dataset.id, include_imported=True)
+
+    assert annotated == [[images[0].id, images[2].id], [image.id for image in images]]
+
+
+def test_export_cache_rebuilds_only_dirty_fragments(db_session, monkeypatch, tmp_path):
+    """
+    Uma segunda exportação só regenera os fragmentos das imagens alteradas.
+    """
+    import os
+    import zipfile
+    from app.services import export_cache_service
+
+    monkeypatch.setattr(dataset_service, "EXPORT_CACHE_DIRECTORY", str(tmp_path))
+    db_dataset, images = _create_annotated_dataset(db_session, "cache")
+    built = []
+    original_build = dataset_service.build_export_fragment
+
+    def counting_build(export_format, image, class_map, **kwargs):
+        built.append(image.id)
+        return original_build(export_format, image, class_map, **kwargs)
+
+    monkeypatch.setattr(dataset_service, "build_export_fragment", counting_build)
+
+    first_path = export_cache_service.get_export_artifact(db_session, db_dataset, "yolo")
+    assert sorted(built) == sorted(img.id for img in images)
+    assert export_cache_service.get_export_artifact(db_session, db_dataset, "yolo") == first_path
+
+    built.clear()
+    dataset_service.mark_annotations_changed(db_session, db_dataset.id, image_ids=[images[0].id])
+    db_session.commit()
+    db_session.refresh(db_dataset)
+    second_path = export_cache_service.get_export_artifact(db_session, db_dataset, "yolo")
+
+    assert built == [images[0].id]
+    with zipfile.ZipFile(second_path) as zip_file:
+        assert zip_file.read("labels/1.txt").decode() == "0 0.500000 0.500000 0.200000 0.200000"
+
+    # A revisão anterior só é apagada na montagem seguinte (pode estar a ser descarregada)
+    assert os.path.exists(first_path)
+    dataset_service.mark_annotations_changed(db_session, db_dataset.id, image_ids=[images[1].id])
+    db_session.commit()
+    db_session.refresh(db_dataset)
+    third_path = export_cache_service.get_export_artifact(db_session, db_dataset, "yolo")
+    assert not os.path.exists(first_path)
+    assert os.path.exists(second_path) and os.path.exists(third_path)
+
+
+def test_export_endpoint_honours_if_none_match(client: TestClient, monkeypatch, tmp_path):
+    """
+    Um pedido com o ETag atual recebe 304 sem corpo.
+    """
+    from app.services import export_cache_service
+
+    monkeypatch.setattr(dataset_service, "EXPORT_CACHE_DIRECTORY", str(tmp_path))
+    headers = _auth_headers(client, "export@example.com")
+    dataset_id = client.post("/datasets/", json={"name": "exp"}, headers=headers).json()["id"]
+
+    response = client.get(f"/datasets/{dataset_id}/export/coco", headers=headers)
+    assert response.status_code == 200
+    etag = response.headers["etag"]
+
+    response = client.get(f"/datasets/{dataset_id}/export/coco", headers={**headers, "If-None-Match": etag})
+    assert response.status_code == 304
+
+    # Comparação fraca, listas de ETags e "*" (RFC 9110)
+    for if_none_match in (f'"other", W/{etag}', f"{etag},{etag}", "*"):
+        response = client.get(f"/datasets/{dataset_id}/export/coco", headers={**headers, "If-None-Match": if_none_match})
+        assert response.status_code == 304
+    response = client.get(f"/datasets/{dataset_id}/export/coco", headers={**headers, "If-None-Match": '"other"'})
+    assert response.status_code == 200
+
+
+def test_coco_export_compact_output(db_session):
+    """
+    O COCO em streaming gera JSON válido, com IDs de anotação sequenciais.
+    """
+    import io
+    import json
+    import zipfile
+
+    db_dataset, images = _create_annotated_dataset(db_session, "coco")
+    zip_bytes = dataset_service.export_annotations_coco(db_session, db_dataset, pretty=False)
+
+    with zipfile.ZipFile(io.BytesIO(zip_bytes)) as zip_file:
+        content = zip_file.read("annotations.json").decode()
+    coco = json.loads(content)
+
+    assert "\n" not in content
+    assert [img["id"] for img in coco["images"]] == [img.id for img in images]
+    assert [ann["id"] for ann in coco["annotations"]] == [1, 2, 3]
+    assert coco["categories"] == [{"id": 1, "name": "cat", "supercategory": "object"}]
+
+
+def test_coco_export_entry_uses_zip64_beyond_the_limit(db_session, monkeypatch):
+    """
+    As entradas annotations.json (COCO) e annotations.xml (CVAT) são escritas em streaming
+    (tamanho desconhecido à partida): têm de ser abertas em ZIP64 para poder passar dos 2 GiB.
+    """
+    import io
+    import json
+    import zipfile
+
+    monkeypatch.setattr(zipfile, "ZIP64_LIMIT", 64)
+    db_dataset, images = _create_annotated_dataset(db_session, "coco_zip64")
+    zip_bytes = dataset_service.export_annotations_coco(db_session, db_dataset)
+
+    with zipfile.ZipFile(io.BytesIO(zip_bytes)) as zip_file:
+        coco = json.loads(zip_file.read("annotations.json"))
+    assert len(coco["annotations"]) == len(images)
+
+    # O mesmo para o annotations.xml do CVAT
+    with zipfile.ZipFile(io.BytesIO(dataset_service.export_annotations_cvat(db_session, db_dataset))) as zip_file:
+        assert zip_file.read("annotations.xml").count(b"<box ") == len(images)
+
+def test_export_job_lifecycle_with_range_download(client: TestClient, monkeypatch, tmp_path):
+    """
+    Submeter, consultar e descarregar (parcialmente) uma exportação assíncrona.
+    """
+    import time
+    from app.services import export_cache_service, export_job_service
+    from sqlalchemy.orm import scoped_session
+    from tests.conftest import TestingSessionLocal
+
+    monkeypatch.setattr(dataset_service, "EXPORT_CACHE_DIRECTORY", str(tmp_path / "cache"))
+    monkeypatch.setattr(export_job_service._registry, "directory", str(tmp_path / "jobs"))
+    monkeypatch.setattr(export_job_service, "BackgroundSession", scoped_session(TestingSessionLocal))
+
+    headers = _auth_headers(client, "jobs@example.com")
+    dataset_id = client.post("/datasets/", json={"name": "jobs"}, headers=headers).json()["id"]
+
+    job = client.post(f"/datasets/{dataset_id}/export-jobs", json={"export_format": "yolo"}, headers=headers).json()
+    duplicate = client.post(f"/datasets/{dataset_id}/export-jobs", json={"export_format": "yolo"}, headers=headers).json()
+    assert duplicate["id"] == job["id"]
+
+    for _ in range(100):
+        job = client.get(f"/datasets/{dataset_id}/export-jobs/{job['id']}", headers=headers).json()
+        if job["status"] in ("done", "failed"):
+            break
+        time.sleep(0.05)
+    assert job["status"] == "done"
+
+    url = f"/datasets/{dataset_id}/export-jobs/{job['id']}/download"
+    full = client.get(url, headers=headers)
+    partial = client.get(url, headers={**headers, "Range": "bytes=0-9"})
+
+    assert full.status_code == 200
+    assert len(full.content) == job["size"]
+    assert partial.status_code == 206
+    assert partial.content == full.content[:10]
+    assert partial.headers["content-range"] == f"bytes 0-9/{job['size']}"
+
+
+def test_job_registry_shares_state_across_workers_and_expires_on_read(monkeypatch, tmp_path):
+    """
+    O estado gravado ao lado dos ficheiros serve qualquer worker; a consulta também limpa as tarefas expiradas.
+    """
+    import time
+    from fastapi import HTTPException
+    from app.core.config import settings
+    from app.services import job_registry
+
+    registry = job_registry.JobRegistry(str(tmp_path), "EXPORT_ARTIFACT_TTL_SECONDS", "Tarefa não encontrada.")
+    other_worker = job_registry.JobRegistry(str(tmp_path), "EXPORT_ARTIFACT_TTL_SECONDS", "Tarefa não encontrada.")
+    job_id = "a" * 32
+    registry.add({"id": job_id, "owner_id": 1, "status": "pending", "finished_at": None})
+    (tmp_path / f"{job_id}.zip").write_bytes(b"zip")
+    registry.update(job_id, status="done", finished_at=time.time() - 10)
+
+    assert other_worker.get(job_id, owner_id=1)["status"] == "done"
+    with pytest.raises(HTTPException):
+        other_worker.get(job_id, owner_id=2)
+
+    monkeypatch.setattr(settings, "EXPORT_ARTIFACT_TTL_SECONDS", 5)
+    monkeypatch.setattr(job_registry, "CLEANUP_INTERVAL_SECONDS", 0)
+    with pytest.raises(HTTPException):
+        registry.get(job_id, owner_id=1)
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_job_registry_fails_jobs_interrupted_by_a_restart(tmp_path):
+    """
+    Uma tarefa "running" cujo worker morreu (heartbeat parado) passa a "failed" ao ser lida.
+    """
+    import os
+    import time
+    from app.services import job_registry
+
+    registry = job_registry.JobRegistry(str(tmp_path), "EXPORT_ARTIFACT_TTL_SECONDS", "Tarefa não encontrada.")
+    after_restart = job_registry.JobRegistry(str(tmp_path), "EXPORT_ARTIFACT_TTL_SECONDS", "Tarefa não encontrada.")
+    job_id = "b" * 32
+    registry.add({"id": job_id, "owner_id": 1, "status": "pending", "error": None, "finished_at": None})
+    registry.update(job_id, status="running")
+    state_path = registry.get_path(job_id, ".json")
+
+    # Com o heartbeat em dia, outro worker vê a tarefa a correr
+    assert after_restart.get(job_id, owner_id=1)["status"] == "running"
+
+    stale = time.time() - job_registry.ORPHANED_AFTER_SECONDS - 1
+    os.utime(state_path, (stale, stale))
+    registry.touch_unfinished()
+    assert after_restart.get(job_id, owner_id=1)["status"] == "running"
+
+    # O processo dono desapareceu: o JSON deixa de ser tocado
+    os.utime(state_path, (stale, stale))
+    job = after_restart.get(job_id, owner_id=1)
+    assert job["status"] == "failed"
+    assert job["error"] == job_registry.ORPHANED_JOB_ERROR
+    assert job["finished_at"] is not None
+    assert after_restart.get(job_id, owner_id=1)["status"] == "failed"
+    assert sorted(p.name for p in tmp_path.iterdir()) == [f"{job_id}.json"]
+
+
+def test_export_job_spans_share_the_request_trace(client: TestClient, monkeypatch, tmp_path):
+    """
+    Os spans da tarefa de exportação (noutra thread) ficam no trace do pedido que a criou.
+    """
+    import time
+    from opentelemetry.sdk.trace import TracerProvider
+    from opentelemetry.sdk.trace.export import SimpleSpanProcessor
+    from opentelemetry.sdk.trace.export.in_memory_span_exporter import InMemorySpanExporter
+    from app.core import tracing
+    from app.services import export_cache_service, export_job_service
+    from sqlalchemy.orm import scoped_session
+    from tests.conftest import TestingSessionLocal
+
+    exporter = InMemorySpanExporter()
+    provider = TracerProvider()
+    provider.add_span_processor(SimpleSpanProcessor(exporter))
+    monkeypatch.setattr(tracing, "_tracer", provider.get_tracer("test"))
+    monkeypatch.setattr(dataset_service, "EXPORT_CACHE_DIRECTORY", str(tmp_path / "cache"))
+    monkeypatch.setattr(export_job_service._registry, "directory", str(tmp_path / "jobs"))
+    monkeypatch.setattr(export_job_service, "BackgroundSession", scoped_session(TestingSessionLocal))
+
+    headers = _auth_headers(client, "tracing@example.com")
+    dataset_id = client.post("/datasets/", json={"name": "tracing"}, headers=headers).json()["id"]
+    job = client.post(f"/datasets/{dataset_id}/export-jobs", json={"export_format": "labelme"}, headers=headers).json()
+
+    for _ in range(100):
+        spans = {span.name: span for span in exporter.get_finished_spans()}
+        if "export.job" in spans:
+            break
+        time.sleep(0.05)
+
+    request_span = spans["POST /datasets/{dataset_id}/export-jobs"]
+    assert spans["export.job"].parent.span_id == request_span.context.span_id
+    assert spans["export.build"].parent.span_id == spans["export.job"].context.span_id
+    assert spans["export.build"].context.trace_id == request_span.context.trace_id
+    assert spans["export.job"].attributes["job_id"] == job["id"]
+
+
+def test_image_thumbnail_is_generated_and_cached(client: TestClient, monkeypatch, tmp_path):
+    """
+    A miniatura é servida já reduzida, com cabeçalhos de cache.
+    """
+    import io
+    from PIL import Image as PILImage
+    from app.services import image_derivative_service
+
+    monkeypatch.setattr(image_derivative_service, "DERIVATIVE_DIRECTORY", str(tmp_path))
+
+    headers = _auth_headers(client, "thumbs@example.com")
+    dataset_id = client.post("/datasets/", json={"name": "thumbs"}, headers=headers).json()["id"]
+    buffer = io.BytesIO()
+    PILImage.new("RGB", (1200, 600), "red").save(buffer, format="JPEG")
+    image = client.post(
+        f"/datasets/{dataset_id}/images/",
+        files={"files": ("big.jpg", buffer.getvalue(), "image/jpeg")},
+        headers=headers,
+    ).json()[0]
+
+    # Os IDs são sequenciais: sem o token assinado do URL, a imagem não é servida
+    assert client.get(f"/images/{image['id']}/thumbnail").status_code == 422
+    assert client.get(f"/images/{image['id']}/thumbnail?token=0").status_code == 404
+    assert client.get(image["preview_url"].replace("preview", "thumbnail", 1)).status_code == 404
+
+    response = client.get(image["thumbnail_url"])
+    assert response.status_code == 200
+    assert response.headers["cache-control"] == "private, max-age=604800"
+    assert max(PILImage.open(io.BytesIO(response.content)).size) == 256
+
+    cached = client.get(image["thumbnail_url"], headers={"If-None-Match": response.headers["etag"]})
+    assert cached.status_code == 304
+
+
+def test_concurrent_derivative_generation_never_shares_a_temp_file(monkeypatch, tmp_path):
+    """
+    Várias threads a gerar a mesma imagem: todas terminam bem e não fica nenhum .tmp para trás.
+    """
+    import os
+    from concurrent.futures import ThreadPoolExecutor
+    from PIL import Image as PILImage
+    from app.services import image_derivative_service
+
+    monkeypatch.setattr(image_derivative_service, "DERIVATIVE_DIRECTORY", str(tmp_path / "derivatives"))
+    source_path = tmp_path / "source.jpg"
+    PILImage.new("RGB", (1600, 900), "blue").save(source_path)
+
+    def generate(_):
+        for variant in image_derivative_service.DERIVATIVE_SIZES:
+            try:
+                # Força nova geração enquanto outras threads esperam pelo lock
+                os.remove(image_derivative_service.get_derivative_path(1, 7, variant))
+            except FileNotFoundError:
+                pass
+        return image_derivative_service.generate_derivatives(1, 7, str(source_path))
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        assert all(executor.map(generate, range(32)))
+    assert not list((tmp_path / "derivatives").rglob("*.tmp"))
+    assert image_derivative_service._get_lock(7) is image_derivative_service._get_lock(7)
+
+
+def test_delete_dataset_returns_immediately_and_janitor_purges(client: TestClient, db_session, monkeypatch, tmp_path):
+    """
+    A rota marca o dataset como 'deleting'; o janitor apaga as linhas e os ficheiros.
+    """
+    from sqlalchemy.orm import scoped_session
+    from app.services import image_derivative_service
+    from tests.conftest import TestingSessionLocal
+
+    monkeypatch.setattr(dataset_service, "BackgroundSession", scoped_session(TestingSessionLocal))
+    monkeypatch.setattr(dataset_service, "UPLOAD_DIRECTORY", str(tmp_path / "uploads"))
+    monkeypatch.setattr(dataset_service, "EXPORT_CACHE_DIRECTORY", str(tmp_path / "cache"))
+    monkeypatch.setattr(image_derivative_service, "DERIVATIVE_DIRECTORY", str(tmp_path / "derivatives"))
+    monkeypatch.setattr(dataset_service, "DELETE_BATCH_SIZE", 2)
+
+    headers = _auth_headers(client, "delete@example.com")
+    dataset_id = client.post("/datasets/", json={"name": "to-delete"}, headers=headers).json()["id"]
+    images = [
+        Image(file_name=f"{i}.jpg", file_path=f"delete/{i}.jpg", dataset_id=dataset_id)
+        for i in range(5)
+    ]
+    db_session.add_all(images)
+    db_session.commit()
+    db_session.add_all([Annotation(class_label="cat", geometry={}, image_id=image.id) for image in images])
+    db_session.commit()
+    image_ids = [image.id for image in images]
+    (tmp_path / "uploads" / str(dataset_id)).mkdir(parents=True)
+    (tmp_path / "uploads" / "999999").mkdir()
+
+    # Marcar sem correr o janitor: o dataset desaparece logo das listagens
+    dataset_service.delete_dataset(db_session, dataset_id=dataset_id, owner_id=db_session.get(Dataset, dataset_id).owner_id)
+    assert dataset_id not in [d["id"] for d in client.get("/datasets/", headers=headers).json()]
+    assert client.get(f"/datasets/{dataset_id}", headers=headers).status_code == 404
+    assert client.delete(f"/datasets/{dataset_id}", headers=headers).status_code == 404
+
+    dataset_service.purge_deleted_datasets()
+
+    db_session.expire_all()
+    assert db_session.get(Dataset, dataset_id) is None
+    assert db_session.query(Image).filter(Image.id.in_(image_ids)).count() == 0
+    assert db_session.query(Annotation).filter(Annotation.image_id.in_(image_ids)).count() == 0
+    assert not (tmp_path / "uploads" / str(dataset_id)).exists()
+    assert not (tmp_path / "uploads" / "999999").exists()
+
+    other_id = client.post("/datasets/", json={"name": "other"}, headers=headers).json()["id"]
+    response = client.delete(f"/datasets/{other_id}", headers=headers)
+    assert response.status_code == 202
+    assert response.json() == {"id": other_id, "status": "deleting"}
+    assert db_session.get(Dataset, other_id) is None
+
+
+def test_app_startup_runs_the_dataset_janitor(monkeypatch):
+    """
+    Datasets deixados em 'deleting' por um reinício são apagados no arranque, sem esperar por outra remoção.
+    """
+    import threading
+    from app.core.config import settings
+    from main import app
+
+    purged = threading.Event()
+    monkeypatch.setattr(settings, "DATASET_JANITOR_ON_STARTUP", True)
+    monkeypatch.setattr(dataset_service, "purge_deleted_datasets", purged.set)
+
+    with TestClient(app):
+        assert purged.wait(timeout=5)
+
+
+def test_dataset_stats_match_materialized_and_live_counts(client: TestClient, db_session, monkeypatch):
+    """
+    As contagens por classe materializadas acompanham as substituições de anotações.
+    """
+    from app.core.config import settings
+
+    headers = _auth_headers(client, "stats@example.com")
+    dataset_id = client.post("/datasets/", json={"name": "stats"}, headers=headers).json()["id"]
+    images = [
+        Image(file_name=f"{i}.jpg", file_path=f"stats/{i}.jpg", dataset_id=dataset_id)
+        for i in range(3)
+    ]
+    db_session.add_all(images)
+    db_session.commit()
+
+    def row(image, label, confidence):
+        return {"annotation_type": "detection", "class_label": label, "confidence": confidence,
+                "geometry": {}, "provenance": "p", "image_id": image.id}
+
+    dataset_service.replace_image_annotations(db_session, dataset_id, [images[0].id, images[1].id], [
+        row(images[0], "cat", 0.95), row(images[0], "dog", 0.35), row(images[1], "cat", 0.55),
+    ], "p")
+    db_session.commit()
+    # Substitui as anotações da primeira imagem: o 'dog' desaparece
+    dataset_service.replace_image_annotations(db_session, dataset_id, [images[0].id], [
+        row(images[0], "cat", 1.0),
+    ], "p")
+    db_session.commit()
+
+    stats = client.get(f"/datasets/{dataset_id}/stats", headers=headers).json()
+    assert stats["image_count"] == 3
+    assert stats["annotated_image_count"] == 2
+    assert stats["unannotated_image_count"] == 1
+    assert stats["annotation_count"] == 2
+    assert stats["class_counts"] == [{"class_label": "cat", "count": 2, "mean_confidence": 0.775}]
+    assert stats["density"] == [{"annotations": 0, "images": 1}, {"annotations": 1, "images": 2}]
+    histogram = {bucket["lower"]: bucket["count"] for bucket in stats["confidence_histogram"]}
+    assert histogram[0.5] == 1 and histogram[0.9] == 1 and sum(histogram.values()) == 2
+
+    monkeypatch.setattr(settings, "DATASET_STATS_MATERIALIZED", False)
+    live = client.get(f"/datasets/{dataset_id}/stats", headers=headers).json()
+    assert live["class_counts"] == stats["class_counts"]
+
+    # Uma anotação sem confiança (ex.: manual ou importada do LabelMe) conta, mas não baixa a média
+    monkeypatch.setattr(settings, "DATASET_STATS_MATERIALIZED", True)
+    dataset_service.replace_image_annotations(db_session, dataset_id, [images[2].id], [
+        row(images[2], "cat", None),
+    ], "p")
+    db_session.commit()
+    expected = [{"class_label": "cat", "count": 3, "mean_confidence": 0.775}]
+    assert client.get(f"/datasets/{dataset_id}/stats", headers=headers).json()["class_counts"] == expected
+    monkeypatch.setattr(settings, "DATASET_STATS_MATERIALIZED", False)
+    assert client.get(f"/datasets/{dataset_id}/stats", headers=headers).json()["class_counts"] == expected
+
+
+def test_confidence_histogram_floors_and_clamps_buckets(db_session):
+    """
+    O intervalo é FLOOR(confiança * bins) em qualquer BD (0.15 -> [0.1, 0.2)) e a confiança 1.0 fica no último.
+    """
+    from sqlalchemy.dialects import postgresql
+    from app.services import dataset_stats_service
+
+    db_dataset, images = _create_annotated_dataset(db_session, "histogram", n_images=4)
+    for annotation, confidence in zip(
+        db_session.query(Annotation).filter(Annotation.image_id.in_([image.id for image in images])).order_by(Annotation.id),
+        (0.15, 0.95, 1.0, 0.0),
+    ):
+        annotation.confidence = confidence
+    db_session.commit()
+
+    histogram = dataset_stats_service._get_confidence_histogram(db_session, db_dataset.id, 10)
+    assert [bucket["count"] for bucket in histogram] == [1, 1, 0, 0, 0, 0, 0, 0, 0, 2]
+    compiled = str(dataset_stats_service._confidence_bucket(10).compile(dialect=postgresql.dialect()))
+    assert "floor(" in compiled
+
+
+def test_class_count_deltas_upsert_existing_rows(db_session):
+    """
+    Classes novas e existentes passam pelo mesmo INSERT ... ON CONFLICT: os deltas acumulam.
+    """
+    from app.models.dataset import DatasetClassCount
+    from app.services import dataset_stats_service
+
+    db_dataset, _ = _create_annotated_dataset(db_session, "upsert", n_images=1)
+    dataset_stats_service.apply_class_count_deltas(db_session, db_dataset.id, {"cat": (2, 2, 1.5), "dog": (1, 1, 0.5)})
+    dataset_stats_service.apply_class_count_deltas(db_session, db_dataset.id, {"cat": (3, 2, 1.0), "dog": (-1, -1, -0.5)})
+    db_session.commit()
+
+    # O 'cat' já vinha com 1 anotação (0.9) do dataset de teste; o 'dog' volta a 0 e é apagado
+    rows = db_session.query(DatasetClassCount).filter(DatasetClassCount.dataset_id == db_dataset.id).all()
+    assert [(row.class_label, row.annotation_count, row.confidence_count) for row in rows] == [("cat", 6, 5)]
+    assert rows[0].confidence_sum == pytest.approx(3.4)
+
+
+def test_video_upload_samples_and_deduplicates_frames(client: TestClient, db_session, monkeypatch, tmp_path):
+    """
+    Só os frames amostrados e visualmente distintos ficam como imagens do dataset.
+    """
+    import cv2
+    import numpy as np
+    from sqlalchemy.orm import scoped_session
+    from app.services import image_derivative_service, video_service
+    from tests.conftest import TestingSessionLocal
+
+    monkeypatch.setattr(video_service, "BackgroundSession", scoped_session(TestingSessionLocal))
+    monkeypatch.setattr(dataset_service, "UPLOAD_DIRECTORY", str(tmp_path / "uploads"))
+    monkeypatch.setattr(image_derivative_service, "schedule_derivatives", lambda *args: None)
+
+    # 4 s a 10 fps: duas cenas diferentes, cada uma com 2 s de frames iguais
+    video_path = str(tmp_path / "clip.avi")
+    writer = cv2.VideoWriter(video_path, cv2.VideoWriter_fourcc(*"MJPG"), 10, (64, 48))
+    gradient = np.tile(np.linspace(0, 255, 64, dtype=np.uint8), (48, 1))
+    for scene in (gradient, gradient[:, ::-1]):
+        for _ in range(20):
+            writer.write(cv2.cvtColor(np.ascontiguousarray(scene), cv2.COLOR_GRAY2BGR))
+    writer.release()
+
+    headers = _auth_headers(client, "video@example.com")
+    dataset_id = client.post("/datasets/", json={"name": "video"}, headers=headers).json()["id"]
+    with open(video_path, "rb") as f:
+        response = client.post(
+            f"/datasets/{dataset_id}/videos/?sample_fps=2",
+            files={"file": ("clip.avi", f.read(), "video/x-msvideo")},
+            headers=headers,
+        )
+    assert response.status_code == 202
+
+    images = db_session.query(Image).filter(Image.dataset_id == dataset_id).order_by(Image.id).all()
+    assert [image.file_name.rsplit("_f", 1)[1] for image in images] == ["0000000.jpg", "0000020.jpg"]
+    assert all((tmp_path / "uploads" / image.file_path).exists() for image in images)
+
+    rejected = client.post(
+        f"/datasets/{dataset_id}/videos/", files={"file": ("notes.txt", b"x", "text/plain")}, headers=headers
+    )
+    assert rejected.status_code == 400
+
+
+def test_streamed_dataset_json_matches_schema(client: TestClient, db_session):
+    """
+    O JSON em streaming do detalhe é igual ao do schema Dataset, também entre pedaços.
+    """
+    import json
+    from app.schemas.dataset import Dataset as DatasetSchema
+
+    db_dataset, images = _create_annotated_dataset(db_session, "streamed", n_images=5)
+    db_dataset.owner_id = 1
+    db_session.add(Annotation(
+        annotation_type="segmentation", class_label="dog", confidence=0.5,
+        geometry=[[0.1, 0.2], [0.3, 0.4], [0.5, 0.25]], image_id=images[1].id
+    ))
+    db_session.commit()
+    db_session.refresh(db_dataset)
+
+    streamed = b"".join(dataset_service.iter_dataset_json(db_session, db_dataset, chunk_size=2))
+    expected = DatasetSchema.model_validate(db_dataset).model_dump(mode="json")
+    assert json.loads(streamed) == expected
+
+    headers = _auth_headers(client, "streamed@example.com")
+    dataset_id = client.post("/datasets/", json={"name": "empty"}, headers=headers).json()["id"]
+    detail = client.get(f"/datasets/{dataset_id}", headers=headers)
+    assert detail.headers["content-type"] == "application/json"
+    assert detail.json()["images"] == []
+    assert any(item["id"] == dataset_id for item in client.get("/datasets/", headers=headers).json())
+
+
+def test_import_round_trips_every_export_format(db_session, monkeypatch, tmp_path):
+    """
+    Exportar um dataset e importar o .zip noutro com as mesmas imagens devolve as mesmas anotações.
+    """
+    import pytest
+    from PIL import Image as PILImage
+    from app.services import annotation_import_service
+    from app.models.dataset import DatasetClassCount
+
+    monkeypatch.setattr(dataset_service, "UPLOAD_DIRECTORY", str(tmp_path))
+    source, images = _create_annotated_dataset(db_session, "import-source", n_images=3)
+    db_session.add(Annotation(
+        annotation_type="segmentation", class_label="dog", confidence=0.8, image_id=images[0].id,
+        geometry=[[0.1, 0.1], [0.4, 0.1], [0.4, 0.3], [0.1, 0.3]],
+    ))
+    db_session.commit()
+    for image in images:
+        (tmp_path / image.file_path).parent.mkdir(parents=True, exist_ok=True)
+        PILImage.new("RGB", (200, 100)).save(tmp_path / image.file_path)
+
+    def annotations_by_file(dataset_id):
+        rows = db_session.query(Image.file_name, Annotation).join(Annotation).filter(Image.dataset_id == dataset_id)
+        return sorted(
+            (file_name, ann.class_label, ann.annotation_type, ann.geometry) for file_name, ann in rows
+        )
+
+    expected = annotations_by_file(source.id)
+    for export_format in annotation_import_service.IMPORT_FORMATS:
+        archive = tmp_path / f"{export_format}.zip"
+        archive.write_bytes(dataset_service._export_annotations(db_session, source, export_format))
+
+        target = Dataset(name=f"import-{export_format}", model_id="yolov8n_det")
+        db_session.add(target)
+        db_session.commit()
+        db_session.add_all([
+            Image(file_name=image.file_name, file_path=f"{target.id}/{image.file_name}", dataset_id=target.id)
+            for image in images
+        ] + [Image(file_name="extra.jpg", file_path=f"{target.id}/extra.jpg", dataset_id=target.id)])
+        db_session.commit()
+
+        report = annotation_import_service.import_annotations(
+            db_session, target, str(archive), export_format, batch_size=2
+        )
+
+        assert report["annotations_imported"] == len(expected)
+        assert report["annotations_skipped"] == 0
+        imported = annotations_by_file(target.id)
+        for (name, label, kind, geometry), (exp_name, exp_label, exp_kind, exp_geometry) in zip(imported, expected):
+            assert (name, label, kind) == (exp_name, exp_label, exp_kind)
+            if kind == "detection":
+                assert geometry == pytest.approx(exp_geometry, abs=1e-2)
+            else:
+                assert [p for point in geometry for p in point] == pytest.approx(
+                    [p for point in exp_geometry for p in point], abs=1e-2
+                )
+        counts = {
+            row.class_label: row.annotation_count
+            for row in db_session.query(DatasetClassCount).filter(DatasetClassCount.dataset_id == target.id)
+        }
+        assert counts == {"cat": 3, "dog": 1}
+
+
+def test_import_job_replaces_annotations_of_matched_images(client: TestClient, db_session, monkeypatch, tmp_path):
+    """
+    Uma importação via API substitui as anotações das imagens presentes no arquivo e reporta o débito.
+    """
+    import io
+    import time
+    import zipfile
+    from sqlalchemy import create_engine
+    from sqlalchemy.orm import scoped_session, sessionmaker
+    from sqlalchemy.pool import NullPool
+    from app.models.user import User
+    from app.services import import_job_service
+    from tests.conftest import SQLALCHEMY_DATABASE_URL
+
+    # O worker escreve: precisa da sua própria ligação, senão o rollback que fecha a
+    # sessão do pedido (na ligação única do StaticPool) desfaz a transação do worker
+    worker_engine = create_engine(SQLALCHEMY_DATABASE_URL, poolclass=NullPool)
+    monkeypatch.setattr(import_job_service._registry, "directory", str(tmp_path / "imports"))
+    monkeypatch.setattr(import_job_service, "BackgroundSession", scoped_session(sessionmaker(bind=worker_engine, autoflush=False)))
+
+    headers = _auth_headers(client, "imports@example.com")
+    db_dataset, images = _create_annotated_dataset(db_session, "import-job", n_images=2)
+    db_dataset.owner_id = db_session.query(User).filter(User.email == "imports@example.com").one().id
+    db_session.commit()
+
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w") as zip_file:
+        zip_file.writestr("data.yaml", "names: ['person', 'car']\nnc: 2\n")
+        zip_file.writestr("labels/0.txt", "1 0.5 0.5 0.2 0.2\n0 0.1 0.1 0.3 0.1 0.3 0.3\n")
+        zip_file.writestr("labels/unknown.txt", "0 0.5 0.5 0.1 0.1\n")
+
+    job = client.post(
+        f"/datasets/{db_dataset.id}/import-jobs", data={"import_format": "yolo"},
+        files={"file": ("labels.zip", buffer.getvalue(), "application/zip")}, headers=headers,
+    ).json()
+    for _ in range(100):
+        job = client.get(f"/datasets/{db_dataset.id}/import-jobs/{job['id']}", headers=headers).json()
+        if job["status"] in ("done", "failed"):
+            break
+        time.sleep(0.05)
+
+    assert job["status"] == "done"
+    assert (job["images_matched"], job["images_unmatched"], job["annotations_imported"]) == (1, 1, 2)
+    assert job["annotations_per_second"] > 0
+
+    db_session.expire_all()
+    labels = {
+        image.file_name: sorted(ann.class_label for ann in image.annotations)
+        for image in db_session.query(Image).filter(Image.dataset_id == db_dataset.id)
+    }
+    assert labels == {"0.jpg": ["car", "person"], "1.jpg": ["cat"]}
+    assert db_session.get(Image, images[0].id).annotation_provenance == "import:yolo"
+
+    invalid = client.post(
+        f"/datasets/{db_dataset.id}/import-jobs", data={"import_format": "yolo"},
+        files={"file": ("labels.zip", b"not a zip", "application/zip")}, headers=headers,
+    )
+    assert invalid.status_code == 400
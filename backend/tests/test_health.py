@@ -0,0 +1,54 @@
+from fastapi.testclient import TestClient
+
+from app.core.database import get_async_database_url
+
+def test_db_health_is_public_but_pool_status_needs_a_superuser(client: TestClient, db_session):
+    """
+    O /health/db só diz se a BD responde; as estatísticas do pool exigem um superutilizador.
+    """
+    from app.models.user import User
+    from app.services import user_service
+
+    response = client.get("/health/db")
+    assert response.status_code == 200
+    assert response.json() == {"status": "ok"}
+    assert client.get("/health/db/pool").status_code == 401
+
+    client.post("/users/", json={"email": "ops@example.com", "password": "testpassword123"})
+    token = client.post(
+        "/auth/token", data={"username": "ops@example.com", "password": "testpassword123"}
+    ).json()["access_token"]
+    headers = {"Authorization": f"Bearer {token}"}
+    assert client.get("/health/db/pool", headers=headers).status_code == 403
+
+    db_user = db_session.query(User).filter(User.email == "ops@example.com").one()
+    db_user.is_superuser = True
+    db_session.commit()
+    user_service.invalidate_user_cache(db_user.id)
+
+    response = client.get("/health/db/pool", headers=headers)
+    assert response.status_code == 200
+    assert response.json()["checkouts"] >= 0
+    assert "pool_class" in response.json()
+
+def test_metrics_endpoint_exposes_route_latency(client: TestClient):
+    """
+    O /metrics expõe a latência dos pedidos pelo template da rota.
+    """
+    client.get("/health/db")
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    assert 'route="/health/db"' in response.text
+    assert "adaptlabelx_model_cache_requests_total" in response.text
+
+def test_async_database_url_uses_async_drivers():
+    """
+    O motor assíncrono usa o mesmo DATABASE_URL, com o asyncpg/aiosqlite e os parâmetros de SSL traduzidos.
+    """
+    url = get_async_database_url("postgresql://u:p@db.example.com/app?sslmode=require&channel_binding=require")
+    assert url.drivername == "postgresql+asyncpg"
+    assert dict(url.query) == {"ssl": "require"}
+    assert get_async_database_url("postgresql+psycopg2://u:p@localhost/app").drivername == "postgresql+asyncpg"
+    assert get_async_database_url("sqlite:///./app.db").drivername == "sqlite+aiosqlite"
+
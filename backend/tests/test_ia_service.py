@@ -0,0 +1,369 @@
+import os
+import pytest
+import numpy as np
+import torch
+from PIL import Image as PILImage
+from ultralytics.engine.results import Boxes
+
+from app.models.dataset import Image
+from app.services import ia_service
+
+
+class _FakeResults:
+    def __init__(self, boxes):
+        self.boxes = boxes
+        self.masks = None
+
+
+class _FakeTileModel:
+    """Devolve, em coordenadas do mosaico, um único objeto fixo da imagem sempre que ele cabe no mosaico."""
+    names = {0: "car"}
+
+    def __init__(self, target, origins):
+        self.target = target
+        self.origins = origins
+        self.calls = []
+
+    def __call__(self, tiles, **kwargs):
+        self.calls.append(len(tiles))
+        results = []
+        for tile in tiles:
+            x, y = self.origins.pop(0)
+            x1, y1, x2, y2 = self.target
+            h, w = tile.shape[:2]
+            data = torch.zeros((0, 6))
+            if x <= x1 and y <= y1 and x2 <= x + w and y2 <= y + h:
+                data = torch.tensor([[x1 - x, y1 - y, x2 - x, y2 - y, 0.9, 0.0]])
+            results.append(_FakeResults(Boxes(data, (h, w))))
+        return results
+
+
+def test_tile_origins_cover_the_whole_axis():
+    assert ia_service._get_tile_origins(500, 640, 512) == [0]
+    assert ia_service._get_tile_origins(1000, 512, 256) == [0, 256, 488]
+
+
+def test_tiled_inference_merges_duplicates_across_tiles(monkeypatch, tmp_path):
+    """
+    Um objeto visto em vários mosaicos sobrepostos fica com uma única caixa, nas coordenadas da imagem.
+    """
+    from app.core.config import settings
+
+    image_path = tmp_path / "aerial.png"
+    PILImage.new("RGB", (1000, 600), "white").save(image_path)
+
+    origins = [
+        (x, y)
+        for y in ia_service._get_tile_origins(600, 512, 256)
+        for x in ia_service._get_tile_origins(1000, 512, 256)
+    ]
+    model = _FakeTileModel(target=(400, 100, 480, 180), origins=list(origins))
+    monkeypatch.setattr(ia_service, "_select_model", lambda *args, **kwargs: (model, {}))
+    monkeypatch.setattr(settings, "TILE_BATCH_SIZE", 4)
+
+    results = ia_service.run_tiled_inference(
+        None, str(image_path), "yolov8n_det", tile_size=512, tile_overlap=0.5
+    )
+
+    assert model.calls == [4, 2]
+    assert len(results.boxes) == 1
+    assert results.boxes.xyxy[0].tolist() == [400, 100, 480, 180]
+
+    monkeypatch.setattr(ia_service, "_resolve_class_names", lambda *args, **kwargs: (model.names, "detection"))
+    rows = ia_service.build_annotation_rows(None, results, Image(id=1, file_name="aerial.png"), "yolov8n_det")
+    assert len(rows) == 1
+    assert rows[0]["class_label"] == "car"
+    assert np.allclose(
+        [rows[0]["geometry"][k] for k in ("x", "y", "width", "height")], [0.44, 0.2333333, 0.08, 0.1333333]
+    )
+
+
+def test_tiled_inference_reads_images_above_pil_pixel_limit(monkeypatch, tmp_path):
+    """
+    O modo em mosaico existe para imagens enormes: não pode falhar no limite anti "decompression bomb" do PIL.
+    """
+    image_path = tmp_path / "orthophoto.png"
+    PILImage.new("RGB", (1000, 600), "white").save(image_path)
+    monkeypatch.setattr(PILImage, "MAX_IMAGE_PIXELS", 1000)
+
+    origins = [(x, y) for y in ia_service._get_tile_origins(600, 640, 512) for x in ia_service._get_tile_origins(1000, 640, 512)]
+    model = _FakeTileModel(target=(700, 400, 760, 460), origins=list(origins))
+    monkeypatch.setattr(ia_service, "_select_model", lambda *args, **kwargs: (model, {}))
+
+    results = ia_service.run_tiled_inference(None, str(image_path), "yolov8n_det", tile_size=640, tile_overlap=0.2)
+
+    assert results.boxes.orig_shape == (600, 1000)
+    assert results.boxes.xyxy.tolist() == [[700, 400, 760, 460]]
+
+
+def test_tiled_inference_rejects_images_above_the_pixel_cap(monkeypatch, tmp_path):
+    """
+    Acima de TILE_MAX_IMAGE_PIXELS a imagem é recusada pelo cabeçalho, sem ser descodificada.
+    """
+    from app.core.config import settings
+
+    image_path = tmp_path / "orthophoto.png"
+    PILImage.new("RGB", (1000, 600), "white").save(image_path)
+    assert ia_service._read_image_size(str(image_path)) == (1000, 600)
+
+    monkeypatch.setattr(settings, "TILE_MAX_IMAGE_PIXELS", 1000 * 600 - 1)
+    monkeypatch.setattr(ia_service, "_select_model", lambda *args, **kwargs: (_FakeTileModel(None, []), {}))
+    monkeypatch.setattr(ia_service.cv2, "imread", lambda *args, **kwargs: pytest.fail("a imagem foi descodificada"))
+
+    assert ia_service.run_tiled_inference(None, str(image_path), "yolov8n_det") is None
+
+
+def test_stub_backend_annotates_without_model_weights(monkeypatch, tmp_path):
+    """
+    Com INFERENCE_BACKEND='stub' o pipeline corre sem pesos, incluindo o SAM e o filtro de classes.
+    """
+    from app.core.config import settings
+
+    monkeypatch.setattr(settings, "INFERENCE_BACKEND", "stub")
+    monkeypatch.setattr(settings, "INFERENCE_STUB_LATENCY_MS", 0)
+    monkeypatch.setattr(ia_service, "_standard_models", {})
+
+    image_path = tmp_path / "street.png"
+    PILImage.new("RGB", (400, 200), "white").save(image_path)
+    db_image = Image(id=1, file_name="street.png", file_path="street.png", dataset_id=1)
+
+    results = ia_service.run_model_on_image(None, str(image_path), "yolov8n_det", selected_classes=["car"])
+    rows = ia_service.build_annotation_rows(None, results, db_image, "yolov8n_det")
+    assert [row["class_label"] for row in rows] == ["car"]
+    assert rows[0]["geometry"]["width"] == pytest.approx(0.4)
+
+    results = ia_service.run_model_on_image(None, str(image_path), "sam")
+    rows = ia_service.build_annotation_rows(None, results, db_image, "sam")
+    assert {row["annotation_type"] for row in rows} == {"segmentation"}
+    assert len(rows) == 3
+
+
+def test_dataset_inference_parameters_filter_detections_before_conversion(client, monkeypatch, tmp_path):
+    """
+    A confiança mínima e o máximo de deteções do dataset chegam à chamada ao modelo e
+    descartam as deteções antes da conversão; valores fora dos limites são recusados.
+    """
+    from app.core.config import settings
+    from app.models.dataset import Dataset
+    from app.services import dataset_service
+    from tests.test_datasets import _auth_headers
+
+    # Recusados na criação do dataset
+    headers = _auth_headers(client, "params@example.com")
+    for invalid in ({"confidence_threshold": 1.5}, {"max_detections": 0}, {"input_size": 650}):
+        assert client.post("/datasets/", json={"name": "inválido", **invalid}, headers=headers).status_code == 422
+    created = client.post("/datasets/", json={"name": "denso", "confidence_threshold": 0.5, "input_size": 320}, headers=headers)
+    assert created.json()["confidence_threshold"] == 0.5 and created.json()["input_size"] == 320
+
+    db_dataset = Dataset(model_id="yolov8n_det", confidence_threshold=0.5, max_detections=2, input_size=320)
+    assert dataset_service.get_inference_args(db_dataset) == {"conf": 0.5, "iou": 0.7, "max_det": 2, "half": False, "imgsz": 320}
+    assert dataset_service.get_annotation_provenance(db_dataset) == "yolov8n_det||conf=0.5,half=0,imgsz=320,iou=0.7,max_det=2"
+    assert dataset_service.get_annotation_provenance(Dataset(model_id="yolov8n_det")) == "yolov8n_det|"
+
+    # Aplicados na chamada ao modelo (o stub só devolve as caixas acima de conf)
+    monkeypatch.setattr(settings, "INFERENCE_BACKEND", "stub")
+    monkeypatch.setattr(settings, "INFERENCE_STUB_LATENCY_MS", 0)
+    monkeypatch.setattr(ia_service, "_standard_models", {})
+    image_path = tmp_path / "street.png"
+    PILImage.new("RGB", (400, 200), "white").save(image_path)
+    results = ia_service.run_model_on_image(
+        None, str(image_path), "yolov8n_det", inference_args=dataset_service.get_inference_args(db_dataset)
+    )
+    assert results.boxes.conf.tolist() == pytest.approx([0.91, 0.76])
+
+    # E de novo antes da conversão: só as max_detections mais confiantes acima do limiar
+    data = torch.tensor([[0, 0, 10, 10, conf, 0.0] for conf in (0.3, 0.95, 0.6, 0.8, 0.55)])
+    monkeypatch.setattr(ia_service, "_resolve_class_names", lambda *args, **kwargs: ({0: "car"}, "detection"))
+    rows = ia_service.build_annotation_rows(
+        None, _FakeResults(Boxes(data, (100, 100))), Image(id=1, file_name="1.jpg"), "yolov8n_det",
+        min_confidence=0.5, max_detections=2,
+    )
+    assert [row["confidence"] for row in rows] == pytest.approx([0.95, 0.8])
+
+def test_custom_model_metadata_is_extracted_once_at_upload(client, monkeypatch, tmp_path):
+    """
+    O upload guarda as classes e a tarefa do .pt; listar os modelos e as classes não volta a carregá-lo.
+    """
+    import hashlib
+    from sqlalchemy.orm import scoped_session
+    from app.services import custom_model_service, model_metadata_service
+    from tests.conftest import TestingSessionLocal
+    from tests.test_datasets import _auth_headers
+
+    monkeypatch.setattr(custom_model_service, "UPLOAD_DIR", str(tmp_path))
+    monkeypatch.setattr(model_metadata_service, "BackgroundSession", scoped_session(TestingSessionLocal))
+    weights = open(os.path.join(ia_service.MODEL_DIR, "yolov8n.pt"), "rb").read()
+    headers = _auth_headers(client, "models@example.com")
+
+    response = client.post(
+        "/custom-models/", data={"name": "meu yolo", "model_type": "segmentation"},
+        files={"file": ("meu_yolo.pt", weights)}, headers=headers,
+    )
+    assert response.status_code == 201
+    model_id = response.json()["id"]
+    assert response.json()["file_sha256"] == hashlib.sha256(weights).hexdigest()
+
+    def fail_to_load(*args, **kwargs):
+        raise AssertionError("o modelo não devia ser carregado")
+    monkeypatch.setattr(ia_service, "_get_model", fail_to_load)
+
+    classes = client.get(f"/models/{model_id}/classes", headers=headers).json()
+    assert classes["metadata_status"] == "ready"
+    assert classes["task"] == "detect"
+    expected_names = model_metadata_service.class_names_to_list(ia_service.get_standard_model("yolov8n_det").names)
+    assert classes["classes"] == expected_names
+
+    listed = {model["id"]: model for model in client.get("/custom-models/", headers=headers).json()}
+    assert listed[model_id]["model_type"] == "detection" # corrigido a partir da tarefa do .pt
+    assert listed[model_id]["parameter_count"] > 0
+    assert {"id": model_id, "name": "meu yolo (Customizado)", "task": "detect"} in client.get("/models/", headers=headers).json()
+
+    with TestingSessionLocal() as db:
+        class_names, annotation_type = ia_service._resolve_class_names(db, str(model_id), owner_id=listed[model_id]["owner_id"])
+    assert class_names[2] == expected_names[2] and annotation_type == "detection"
+
+def test_chunked_model_upload_resumes_and_verifies_hash(client, monkeypatch, tmp_path):
+    """
+    Um upload em partes recusa partes corrompidas ou fora de ordem, retoma pelo offset
+    e só regista o modelo se o SHA-256 do ficheiro inteiro corresponder.
+    """
+    import hashlib
+    from sqlalchemy.orm import scoped_session
+    from app.core.config import settings
+    from app.services import custom_model_service, model_metadata_service, model_upload_service
+    from tests.conftest import TestingSessionLocal
+    from tests.test_datasets import _auth_headers
+
+    monkeypatch.setattr(custom_model_service, "UPLOAD_DIR", str(tmp_path / "models"))
+    monkeypatch.setattr(model_upload_service, "MODEL_UPLOADS_DIRECTORY", str(tmp_path / "uploads"))
+    monkeypatch.setattr(model_metadata_service, "BackgroundSession", scoped_session(TestingSessionLocal))
+    monkeypatch.setattr(settings, "MODEL_UPLOAD_CHUNK_SIZE", 1024 * 1024)
+    weights = open(os.path.join(ia_service.MODEL_DIR, "yolov8n.pt"), "rb").read()
+    sha256 = hashlib.sha256(weights).hexdigest()
+    headers = _auth_headers(client, "chunks@example.com")
+
+    upload = client.post("/custom-models/uploads", json={
+        "name": "grande", "model_type": "detection", "filename": "grande.pt", "file_size": len(weights), "sha256": sha256,
+    }, headers=headers).json()
+    chunk_size = upload["chunk_size"]
+    assert upload["offset"] == 0
+
+    def put_chunk(offset, data, checksum=None):
+        return client.put(
+            f"/custom-models/uploads/{upload['id']}/chunks", params={"offset": offset}, content=data,
+            headers={**headers, "X-Chunk-SHA256": checksum or hashlib.sha256(data).hexdigest()},
+        )
+
+    assert put_chunk(0, weights[:chunk_size]).json()["offset"] == chunk_size
+    assert put_chunk(chunk_size, weights[chunk_size:2 * chunk_size], checksum="0" * 64).status_code == 400
+    assert put_chunk(0, weights[:chunk_size]).status_code == 409 # parte repetida
+    assert client.post(f"/custom-models/uploads/{upload['id']}/complete", headers=headers).status_code == 400
+
+    # Retoma a partir do offset guardado em disco
+    offset = client.get(f"/custom-models/uploads/{upload['id']}", headers=headers).json()["offset"]
+    while offset < len(weights):
+        offset = put_chunk(offset, weights[offset:offset + chunk_size]).json()["offset"]
+
+    response = client.post(f"/custom-models/uploads/{upload['id']}/complete", headers=headers)
+    assert response.status_code == 201
+    model = response.json()
+    assert model["file_sha256"] == sha256 and model["file_size"] == len(weights)
+    assert open(model["file_path"], "rb").read() == weights
+    assert client.get(f"/models/{model['id']}/classes", headers=headers).json()["metadata_status"] == "ready"
+    assert client.get(f"/custom-models/uploads/{upload['id']}", headers=headers).status_code == 404
+
+    # Um ficheiro montado com outro conteúdo é rejeitado no fim
+    bad = client.post("/custom-models/uploads", json={
+        "name": "corrompido", "model_type": "detection", "filename": "corrompido.pt", "file_size": 4, "sha256": sha256,
+    }, headers=headers).json()
+    client.put(f"/custom-models/uploads/{bad['id']}/chunks", params={"offset": 0}, content=b"abcd", headers=headers)
+    assert client.post(f"/custom-models/uploads/{bad['id']}/complete", headers=headers).status_code == 400
+    assert not os.path.exists(os.path.join(tmp_path, "models", str(model["owner_id"]), "corrompido.pt"))
+
+def test_custom_model_int8_variant_is_reported_and_selected_per_dataset(client, db_session, monkeypatch, tmp_path):
+    """
+    A quantização produz o .int8.onnx ao lado do .pt com um relatório de latência e
+    concordância, e os datasets em 'int8' passam a correr essa variante.
+    """
+    import shutil
+    from sqlalchemy.orm import scoped_session
+    from ultralytics.utils import ASSETS
+    from app.core.config import settings
+    from app.models.user import User
+    from app.services import custom_model_service, dataset_service, model_metadata_service, model_quantization_service
+    from tests.conftest import TestingSessionLocal
+    from tests.test_datasets import _auth_headers, _create_annotated_dataset
+
+    monkeypatch.setattr(custom_model_service, "UPLOAD_DIR", str(tmp_path / "models"))
+    monkeypatch.setattr(dataset_service, "UPLOAD_DIRECTORY", str(tmp_path / "uploads"))
+    monkeypatch.setattr(model_metadata_service, "BackgroundSession", scoped_session(TestingSessionLocal))
+    monkeypatch.setattr(model_quantization_service, "BackgroundSession", scoped_session(TestingSessionLocal))
+    monkeypatch.setattr(settings, "MODEL_QUANTIZATION_CALIBRATION_IMAGES", 2)
+    monkeypatch.setattr(settings, "MODEL_QUANTIZATION_EVAL_IMAGES", 2)
+    headers = _auth_headers(client, "int8@example.com")
+
+    # Imagens do usuário: as de calibração e as de avaliação saem daqui
+    db_dataset, images = _create_annotated_dataset(db_session, "calibracao", n_images=4)
+    db_dataset.owner_id = db_session.query(User).filter(User.email == "int8@example.com").one().id
+    db_session.commit()
+    os.makedirs(tmp_path / "uploads" / "calibracao")
+    for i, image in enumerate(images):
+        shutil.copyfile(ASSETS / ("bus.jpg" if i % 2 else "zidane.jpg"), tmp_path / "uploads" / image.file_path)
+
+    weights = open(os.path.join(ia_service.MODEL_DIR, "yolov8n.pt"), "rb").read()
+    response = client.post(
+        "/custom-models/", data={"name": "yolo cpu", "model_type": "detection", "quantize": "true"},
+        files={"file": ("yolo_cpu.pt", weights)}, headers=headers,
+    )
+    assert response.status_code == 201 and response.json()["quantization_status"] == "pending"
+    model_id = response.json()["id"]
+
+    model = {m["id"]: m for m in client.get("/custom-models/", headers=headers).json()}[model_id]
+    assert model["quantization_status"] == "ready", model["quantization_report"]
+    report = model["quantization_report"]
+    assert report["calibration_images"] == 2 and report["eval_images"] == 2
+    assert report["int8_ms"] > 0 and report["fp32_ms"] > 0 and 0.0 <= report["f1_vs_fp32"] <= 1.0
+    assert report["int8_file_size"] < report["fp32_file_size"]
+    quantized_path = os.path.join(tmp_path, "models", str(model["owner_id"]), "yolo_cpu.int8.onnx")
+    assert os.path.exists(quantized_path)
+
+    # Selecionada por dataset; entra na proveniência para a re-anotação
+    db_dataset.model_id = str(model_id)
+    db_dataset.model_precision = "int8"
+    db_session.commit()
+    assert dataset_service.get_annotation_provenance(db_dataset) == f"{model_id}||int8"
+    results = ia_service.run_model_on_image(
+        db_session, str(tmp_path / "uploads" / images[1].file_path), str(model_id),
+        owner_id=model["owner_id"], precision="int8",
+    )
+    assert results is not None and quantized_path in ia_service.custom_model_cache
+
+    assert client.delete(f"/custom-models/{model_id}", headers=headers).status_code == 204
+    assert not os.path.exists(quantized_path)
+
+def test_stale_pending_quantization_does_not_block_a_new_request(db_session):
+    """
+    Um 'pending' recente devolve 409; um mais antigo que o timeout (tarefa perdida) pode ser refeito.
+    """
+    import datetime
+    from fastapi import HTTPException
+    from app.core.config import settings
+    from app.models.custom_model import CustomModel
+    from app.services import model_quantization_service
+
+    db_model = CustomModel(name="perdido", model_type="detection", file_path="models/perdido.pt")
+    db_session.add(db_model)
+    db_session.commit()
+
+    model_quantization_service.request_quantization(db_session, db_model)
+    assert db_model.quantization_status == "pending"
+    with pytest.raises(HTTPException) as error:
+        model_quantization_service.request_quantization(db_session, db_model)
+    assert error.value.status_code == 409
+
+    db_model.quantization_requested_at = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(
+        seconds=settings.MODEL_QUANTIZATION_TIMEOUT_SECONDS + 60
+    )
+    db_session.commit()
+    model_quantization_service.request_quantization(db_session, db_model)
+    assert db_model.quantization_status == "pending"
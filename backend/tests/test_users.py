@@ -31,4 +31,68 @@ def test_create_duplicate_user(client: TestClient):
     data = response.json()
     
     # Verificar a mensagem de erro em Português
-    assert data["detail"] == "Email já registrado."
\ No newline at end of file
+    assert data["detail"] == "Email já registrado."
+def test_token_lookup_uses_user_cache(client: TestClient, db_session):
+    """
+    O utilizador resolvido pelo token fica em cache até ser invalidado.
+    """
+    from app.models.user import User
+    from app.services import user_service
+
+    client.post("/users/", json={"email": "cached@example.com", "password": "testpassword123"})
+    token = client.post(
+        "/auth/token", data={"username": "cached@example.com", "password": "testpassword123"}
+    ).json()["access_token"]
+    headers = {"Authorization": f"Bearer {token}"}
+    user_id = client.get("/users/me", headers=headers).json()["id"]
+
+    db_user = db_session.query(User).filter(User.id == user_id).first()
+    db_user.is_superuser = True
+    db_session.commit()
+
+    # Alteração feita por fora do user_service: o cache ainda não a vê
+    assert client.get("/users/me", headers=headers).json()["is_superuser"] is False
+
+    user_service.invalidate_user_cache(user_id)
+    assert client.get("/users/me", headers=headers).json()["is_superuser"] is True
+
+def test_login_rehashes_legacy_password_hash(client: TestClient, db_session):
+    """
+    Um hash com parâmetros antigos do Argon2 é refeito no login.
+    """
+    from passlib.context import CryptContext
+    from app.core.security import pwd_context
+    from app.models.user import User
+
+    legacy_hash = CryptContext(schemes=["argon2"], argon2__time_cost=1, argon2__memory_cost=8192).hash("legacypass123")
+    db_session.add(User(email="legacy@example.com", hashed_password=legacy_hash))
+    db_session.commit()
+
+    response = client.post("/auth/token", data={"username": "legacy@example.com", "password": "legacypass123"})
+    assert response.status_code == 200
+
+    db_session.expire_all()
+    new_hash = db_session.query(User).filter(User.email == "legacy@example.com").first().hashed_password
+    assert new_hash != legacy_hash
+    assert not pwd_context.needs_update(new_hash)
+    assert pwd_context.verify("legacypass123", new_hash)
+
+def test_cached_user_lookup_returns_detached_users_on_miss_and_hit(db_session):
+    """
+    Com ou sem cache, get_user_cached devolve um User desligado da sessão.
+    """
+    from sqlalchemy import inspect
+    from app.models.user import User
+    from app.services import user_service
+
+    db_user = User(email="detached@example.com", hashed_password="x")
+    db_session.add(db_user)
+    db_session.commit()
+    user_service.invalidate_user_cache(db_user.id)
+
+    miss = user_service.get_user_cached(db_session, user_id=db_user.id)
+    hit = user_service.get_user_cached(db_session, user_id=db_user.id)
+
+    for user in (miss, hit):
+        assert user is not db_user and inspect(user).session is None
+        assert (user.id, user.email) == (db_user.id, "detached@example.com")
@@ -21,7 +21,8 @@ export function AnnotationViewerModal({ show, handleClose, image }: AnnotationVi
             if (ctx) {
                 const img = new window.Image();
                 
-                img.src = `/uploads/${image.file_path.replace(/\\/g, '/')}`;
+                // A pré-visualização chega para desenhar: as anotações estão em coordenadas normalizadas
+                img.src = `/api${image.preview_url}`;
                 
                 img.onload = () => {
                     canvas.width = img.width;
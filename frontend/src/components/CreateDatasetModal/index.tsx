@@ -1,5 +1,5 @@
 import { useState, useEffect } from 'react';
-import { Modal, Button, Form, Alert } from 'react-bootstrap';
+import { Modal, Button, Form, Alert, Row, Col } from 'react-bootstrap';
 import api from '../../services/api';
 import { Dataset } from '../../types';
 
@@ -7,6 +7,7 @@ import { Dataset } from '../../types';
 interface ModelOption {
   id: string | number;
   name: string;
+  quantized?: boolean; // tem variante INT8 pronta
 }
 
 // Os IDs dos modelos que devem mostrar o seletor de classes
@@ -50,6 +51,17 @@ export function CreateDatasetModal({ show, handleClose, onDatasetCreated }: Crea
   // --- FIM DO ESTADO ---
 
   const [selectedClasses, setSelectedClasses] = useState<string[]>([]);
+
+  // Inferência na imagem inteira ou em mosaicos (imagens aéreas/muito grandes)
+  const [inferenceMode, setInferenceMode] = useState<'full' | 'tiled'>('full');
+  const [tileSize, setTileSize] = useState<number>(640);
+
+  // Precisão do modelo customizado: 'int8' usa a variante quantizada (mais rápida em CPU)
+  const [modelPrecision, setModelPrecision] = useState<'fp32' | 'int8'>('fp32');
+
+  // Parâmetros da inferência: deteções abaixo da confiança (ou além do máximo) não são guardadas
+  const [confidenceThreshold, setConfidenceThreshold] = useState<number>(0.1);
+  const [maxDetections, setMaxDetections] = useState<number>(300);
   
   // Lógica para mostrar/esconder o seletor de classes
   const isStandardModel = STANDARD_MODELS.includes(selectedModel);
@@ -62,6 +74,11 @@ export function CreateDatasetModal({ show, handleClose, onDatasetCreated }: Crea
       setDescription('');
       setSelectedModel('yolov8n_det');
       setSelectedClasses([]);
+      setInferenceMode('full');
+      setTileSize(640);
+      setModelPrecision('fp32');
+      setConfidenceThreshold(0.1);
+      setMaxDetections(300);
       setErrorMessage('');
       
       // Busca os modelos customizados
@@ -73,7 +90,8 @@ export function CreateDatasetModal({ show, handleClose, onDatasetCreated }: Crea
           // para o tipo ModelOption
           const fetchedModels: ModelOption[] = response.data.map((model: any) => ({
             id: model.id.toString(), // O 'value' do <option> deve ser string
-            name: `(Custom) ${model.name}` // Adiciona um prefixo para clareza
+            name: `(Custom) ${model.name}`, // Adiciona um prefixo para clareza
+            quantized: model.quantization_status === 'ready'
           }));
           setCustomModels(fetchedModels);
         } catch (error) {
@@ -112,7 +130,12 @@ export function CreateDatasetModal({ show, handleClose, onDatasetCreated }: Crea
       name: name,
       description: description,
       model_id: selectedModel,
-      classes_to_annotate: isStandardModel ? selectedClasses : null
+      classes_to_annotate: isStandardModel ? selectedClasses : null,
+      inference_mode: inferenceMode,
+      tile_size: tileSize,
+      model_precision: isStandardModel ? 'fp32' : modelPrecision,
+      confidence_threshold: confidenceThreshold,
+      max_detections: maxDetections
     };
 
     try {
@@ -215,6 +238,68 @@ export function CreateDatasetModal({ show, handleClose, onDatasetCreated }: Crea
             </Form.Group>
           )}
           
+          {customModels.find(model => model.id === selectedModel)?.quantized && (
+            <Form.Group className="mb-3">
+              <Form.Label>Precisão do Modelo</Form.Label>
+              <Form.Select
+                value={modelPrecision}
+                onChange={(e) => setModelPrecision(e.target.value as 'fp32' | 'int8')}
+              >
+                <option value="fp32">FP32 (original)</option>
+                <option value="int8">INT8 (quantizado, mais rápido em CPU)</option>
+              </Form.Select>
+            </Form.Group>
+          )}
+
+          <Row className="mb-3">
+            <Form.Group as={Col}>
+              <Form.Label>Confiança Mínima</Form.Label>
+              <Form.Control
+                type="number"
+                min={0}
+                max={1}
+                step={0.05}
+                value={confidenceThreshold}
+                onChange={(e) => setConfidenceThreshold(Number(e.target.value))}
+              />
+            </Form.Group>
+            <Form.Group as={Col}>
+              <Form.Label>Máx. Deteções por Imagem</Form.Label>
+              <Form.Control
+                type="number"
+                min={1}
+                max={10000}
+                value={maxDetections}
+                onChange={(e) => setMaxDetections(Number(e.target.value))}
+              />
+            </Form.Group>
+          </Row>
+
+          <Form.Group className="mb-3">
+            <Form.Label>Modo de Inferência</Form.Label>
+            <Form.Select
+              value={inferenceMode}
+              onChange={(e) => setInferenceMode(e.target.value as 'full' | 'tiled')}
+            >
+              <option value="full">Imagem inteira</option>
+              <option value="tiled">Mosaicos (imagens muito grandes)</option>
+            </Form.Select>
+          </Form.Group>
+
+          {inferenceMode === 'tiled' && (
+            <Form.Group className="mb-3">
+              <Form.Label>Tamanho do Mosaico (px)</Form.Label>
+              <Form.Control
+                type="number"
+                min={128}
+                max={4096}
+                step={32}
+                value={tileSize}
+                onChange={(e) => setTileSize(Number(e.target.value))}
+              />
+            </Form.Group>
+          )}
+          
           <Form.Control type="submit" className="d-none" />
         </Form>
       </Modal.Body>
@@ -1,13 +1,43 @@
 import { useState, useEffect } from 'react';
-import { Container, Button, Form, Card, Row, Col, Alert, ListGroup, Spinner } from 'react-bootstrap';
+import { Container, Button, Form, Card, Row, Col, Alert, ListGroup, Spinner, ProgressBar } from 'react-bootstrap';
 import api from '../../services/api'; 
 
+// Estado de um upload em partes, devolvido pelo backend
+interface ModelUpload {
+  id: string;
+  offset: number;
+  chunk_size: number;
+  file_size: number;
+}
+
+// Tentativas por parte antes de desistir (o upload pode ser retomado depois)
+const CHUNK_RETRIES = 3;
+
+// SHA-256 em hexadecimal; o crypto.subtle só existe em contextos seguros (HTTPS/localhost)
+async function sha256Hex(data: ArrayBuffer): Promise<string | undefined> {
+  if (!window.crypto?.subtle) return undefined;
+  const digest = await window.crypto.subtle.digest('SHA-256', data);
+  return Array.from(new Uint8Array(digest)).map(b => b.toString(16).padStart(2, '0')).join('');
+}
+
+// O id do upload fica guardado para retomar o mesmo ficheiro depois de uma falha
+const uploadStorageKey = (file: File) => `@AdaptlabelX:upload:${file.name}:${file.size}:${file.lastModified}`;
+
 // Tipagem para o modelo customizado
 interface CustomModel {
   id: number;
   name: string;
   model_type: string;
   file_path: string;
+  quantization_status: 'none' | 'pending' | 'ready' | 'failed';
+  quantization_report?: {
+    fp32_ms?: number;
+    int8_ms?: number;
+    speedup?: number;
+    f1_vs_fp32?: number;
+    eval_images?: number;
+    error?: string;
+  } | null;
 }
 
 export function CustomModelsPage() {
@@ -20,6 +50,7 @@ export function CustomModelsPage() {
   const [modelType, setModelType] = useState('detection');
   const [file, setFile] = useState<File | null>(null);
   const [isUploading, setIsUploading] = useState(false);
+  const [uploadProgress, setUploadProgress] = useState(0);
 
   // Função para buscar os modelos
   const fetchModels = async () => {
@@ -49,14 +80,45 @@ export function CustomModelsPage() {
 
     setIsUploading(true);
     setMessage('');
-
-    const formData = new FormData();
-    formData.append('name', name);
-    formData.append('model_type', modelType);
-    formData.append('file', file);
+    setUploadProgress(0);
 
     try {
-      await api.post('/custom-models/', formData);
+      // Envia o .pt em partes: retoma um upload anterior do mesmo ficheiro, se existir
+      const storageKey = uploadStorageKey(file);
+      let upload: ModelUpload | null = null;
+      const previousId = localStorage.getItem(storageKey);
+      if (previousId) {
+        upload = await api.get(`/custom-models/uploads/${previousId}`).then(r => r.data).catch(() => null);
+      }
+      if (!upload) {
+        upload = (await api.post('/custom-models/uploads', {
+          name, model_type: modelType, filename: file.name, file_size: file.size,
+        })).data as ModelUpload;
+        localStorage.setItem(storageKey, upload.id);
+      }
+
+      let offset = upload.offset;
+      let failures = 0;
+      while (offset < file.size) {
+        const chunk = await file.slice(offset, offset + upload.chunk_size).arrayBuffer();
+        const checksum = await sha256Hex(chunk);
+        try {
+          const response = await api.put(`/custom-models/uploads/${upload.id}/chunks`, chunk, {
+            params: { offset },
+            headers: { 'Content-Type': 'application/octet-stream', ...(checksum ? { 'X-Chunk-SHA256': checksum } : {}) },
+          });
+          offset = response.data.offset;
+          failures = 0;
+        } catch (error: any) {
+          if (++failures > CHUNK_RETRIES) throw error;
+          // Resposta perdida ou parte fora de ordem: continua a partir do que o servidor tem
+          offset = (await api.get(`/custom-models/uploads/${upload.id}`)).data.offset;
+        }
+        setUploadProgress(Math.round((offset / file.size) * 100));
+      }
+
+      await api.post(`/custom-models/uploads/${upload.id}/complete`);
+      localStorage.removeItem(storageKey);
       setMessage('Upload realizado com sucesso!');
       // Limpar formulário e recarregar lista
       setName('');
@@ -65,12 +127,24 @@ export function CustomModelsPage() {
       fetchModels(); 
     } catch (error: any) {
       console.error("Falha no upload", error);
-      setMessage(error.response?.data?.detail || 'Erro no upload.');
+      setMessage(error.response?.data?.detail || 'Erro no upload. Envie o mesmo ficheiro para retomar.');
     } finally {
       setIsUploading(false);
     }
   };
 
+  // Produz a variante INT8 em segundo plano (calibrada com as imagens dos seus datasets)
+  const handleQuantize = async (modelId: number) => {
+    try {
+      await api.post(`/custom-models/${modelId}/quantization`);
+      setMessage('Quantização iniciada com sucesso. Atualize a lista para ver o relatório.');
+      fetchModels();
+    } catch (error: any) {
+      console.error("Falha ao quantizar", error);
+      setMessage(error.response?.data?.detail || 'Falha ao iniciar a quantização.');
+    }
+  };
+
   // Handler para deletar
   const handleDelete = async (modelId: number) => {
     if (window.confirm('Tem certeza que deseja excluir este modelo?')) {
@@ -103,10 +177,30 @@ export function CustomModelsPage() {
                     <div>
                       <strong>{model.name}</strong>
                       <small className="d-block text-muted">Tipo: {model.model_type}</small>
+                      {model.quantization_status === 'ready' && model.quantization_report && (
+                        <small className="d-block text-muted">
+                          INT8: {model.quantization_report.int8_ms} ms vs {model.quantization_report.fp32_ms} ms
+                          (F1 vs FP32 {model.quantization_report.f1_vs_fp32}, {model.quantization_report.eval_images} imagens)
+                        </small>
+                      )}
+                      {model.quantization_status === 'pending' && <small className="d-block text-muted">INT8: a quantizar...</small>}
+                      {model.quantization_status === 'failed' && (
+                        <small className="d-block text-danger">INT8: {model.quantization_report?.error}</small>
+                      )}
+                    </div>
+                    <div className="d-flex gap-2">
+                      <Button
+                        variant="outline-secondary"
+                        size="sm"
+                        disabled={model.quantization_status === 'pending'}
+                        onClick={() => handleQuantize(model.id)}
+                      >
+                        Quantizar (INT8)
+                      </Button>
+                      <Button variant="outline-danger" size="sm" onClick={() => handleDelete(model.id)}>
+                        Excluir
+                      </Button>
                     </div>
-                    <Button variant="outline-danger" size="sm" onClick={() => handleDelete(model.id)}>
-                      Excluir
-                    </Button>
                   </ListGroup.Item>
                 )) : <p>Você ainda não fez upload de nenhum modelo.</p>}
               </ListGroup>
@@ -145,6 +239,7 @@ export function CustomModelsPage() {
                       required
                     />
                   </Form.Group>
+                  {isUploading && <ProgressBar now={uploadProgress} label={`${uploadProgress}%`} className="mb-3" />}
                   <Button variant="primary" type="submit" disabled={isUploading}>
                     {isUploading ? <Spinner as="span" size="sm" /> : 'Enviar'}
                   </Button>
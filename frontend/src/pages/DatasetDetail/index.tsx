@@ -3,7 +3,7 @@ import { useParams, Link } from 'react-router-dom';
 import { Container, Button, Card, Row, Col, Form, Alert, Spinner } from 'react-bootstrap';
 import api from '../../services/api';
 import { AnnotationViewerModal } from '../../components/AnnotationViewerModal';
-import { Image, Dataset } from '../../types'; 
+import { Image, Dataset, DatasetStats } from '../../types'; 
 
 export function DatasetDetailPage() {
     const { datasetId } = useParams<{ datasetId: string }>();
@@ -62,14 +62,26 @@ export function DatasetDetailPage() {
         
         setMessage('A enviar imagens...');
         
-        const formData = new FormData();
-        for (let i = 0; i < selectedFiles.length; i++) {
-            formData.append("files", selectedFiles[i]);
-        }
+        // Os vídeos vão para um endpoint próprio (os frames são extraídos em segundo plano)
+        const files = Array.from(selectedFiles);
+        const imageFiles = files.filter(file => !file.type.startsWith('video/'));
+        const videoFiles = files.filter(file => file.type.startsWith('video/'));
+
         try {
-            const response = await api.post(`/datasets/${datasetId}/images/`, formData);
-            setDataset(prev => prev ? { ...prev, images: [...prev.images, ...response.data] } : null);
-            setMessage('Upload realizado com sucesso!');
+            if (imageFiles.length > 0) {
+                const formData = new FormData();
+                imageFiles.forEach(file => formData.append("files", file));
+                const response = await api.post(`/datasets/${datasetId}/images/`, formData);
+                setDataset(prev => prev ? { ...prev, images: [...prev.images, ...response.data] } : null);
+            }
+            for (const video of videoFiles) {
+                const formData = new FormData();
+                formData.append("file", video);
+                await api.post(`/datasets/${datasetId}/videos/`, formData);
+            }
+            setMessage(videoFiles.length > 0
+                ? 'Upload realizado! Os frames dos vídeos estão a ser extraídos; recarregue a página dentro de momentos.'
+                : 'Upload realizado com sucesso!');
             setSelectedFiles(null);
             
             const fileInput = document.getElementById('file-upload-input') as HTMLInputElement;
@@ -86,7 +98,13 @@ export function DatasetDetailPage() {
         setIsAnnotating(true);
         setMessage('Iniciando anotação... Isso pode levar alguns minutos.');
 
-        const initialTotal = dataset?.images.reduce((sum, img) => sum + img.annotations.length, 0) || 0;
+        // As contagens vêm do endpoint de estatísticas (agregadas na BD), não do dataset completo
+        const fetchAnnotationCount = async () => {
+            const { data: stats } = await api.get<DatasetStats>(`/datasets/${datasetId}/stats`);
+            return stats.annotation_count;
+        };
+
+        const initialTotal = await fetchAnnotationCount().catch(() => 0);
         initialTotalAnnsRef.current = initialTotal;
         previousTotalAnnsRef.current = initialTotal;
         pollCountRef.current = 0;
@@ -97,19 +115,18 @@ export function DatasetDetailPage() {
             // Inicia o polling
             pollingRef.current = window.setInterval(async () => {
                 pollCountRef.current += 1;
-                const updatedDataset = await fetchDataset();
+                const newTotal = await fetchAnnotationCount().catch(() => null);
                 
-                if (updatedDataset) {
-                    const newTotal = updatedDataset.images.reduce((sum: number, img: Image) => sum + img.annotations.length, 0);
-                    
+                if (newTotal !== null) {
                     if (newTotal > previousTotalAnnsRef.current) {
                         // Se encontramos novas anotações, atualizamos a contagem
                         previousTotalAnnsRef.current = newTotal;
                     } else if (newTotal === previousTotalAnnsRef.current && newTotal > initialTotalAnnsRef.current) {
-                        // Se a contagem parou de aumentar (e é > 0), terminamos
+                        // Se a contagem parou de aumentar (e é > 0), terminamos e só então recarregamos o dataset
                         clearInterval(pollingRef.current);
                         setIsAnnotating(false);
                         setMessage('Anotações concluídas com sucesso!');
+                        fetchDataset();
                     } else if (pollCountRef.current > 5 && newTotal === initialTotalAnnsRef.current) {
                         // Se depois de ~25s não encontramos nada, paramos
                         clearInterval(pollingRef.current);
@@ -130,10 +147,21 @@ export function DatasetDetailPage() {
         }
     };
 
-    // Função genérica para lidar com downloads de arquivos
-    const handleDownload = async (url: string, defaultFilename: string) => {
+    // Função genérica para lidar com downloads: pede a exportação em segundo plano,
+    // espera que fique pronta e só depois descarrega o arquivo
+    const handleDownload = async (exportFormat: string, defaultFilename: string) => {
         try {
-            const response = await api.get(url, {
+            setMessage('A preparar a exportação...');
+            let { data: job } = await api.post(`/datasets/${datasetId}/export-jobs`, { export_format: exportFormat });
+            while (job.status === 'pending' || job.status === 'running') {
+                await new Promise(resolve => setTimeout(resolve, 2000));
+                ({ data: job } = await api.get(`/datasets/${datasetId}/export-jobs/${job.id}`));
+            }
+            if (job.status !== 'done') {
+                throw new Error(job.error);
+            }
+
+            const response = await api.get(`/datasets/${datasetId}/export-jobs/${job.id}/download`, {
                 responseType: 'blob',
             });
             const blobUrl = window.URL.createObjectURL(new Blob([response.data]));
@@ -152,6 +180,7 @@ export function DatasetDetailPage() {
             document.body.appendChild(link);
             link.click();
             link.parentNode?.removeChild(link);
+            setMessage('');
         } catch (error) {
             console.error(`Falha ao baixar ${defaultFilename}:`, error);
             setMessage("Erro ao preparar o arquivo para download.");
@@ -159,10 +188,10 @@ export function DatasetDetailPage() {
     };
 
     // Funções específicas de download
-    const handleDownloadYolo = () => handleDownload(`/datasets/${datasetId}/export/yolo`, `dataset_${datasetId}_yolo.zip`);
-    const handleDownloadLabelMe = () => handleDownload(`/datasets/${datasetId}/export/labelme`, `dataset_${datasetId}_labelme.zip`);
-    const handleDownloadCoco = () => handleDownload(`/datasets/${datasetId}/export/coco`, `dataset_${datasetId}_coco.zip`);
-    const handleDownloadCvat = () => handleDownload(`/datasets/${datasetId}/export/cvat`, `dataset_${datasetId}_cvat.zip`);
+    const handleDownloadYolo = () => handleDownload('yolo', `dataset_${datasetId}_yolo.zip`);
+    const handleDownloadLabelMe = () => handleDownload('labelme', `dataset_${datasetId}_labelme.zip`);
+    const handleDownloadCoco = () => handleDownload('coco', `dataset_${datasetId}_coco.zip`);
+    const handleDownloadCvat = () => handleDownload('cvat', `dataset_${datasetId}_cvat.zip`);
 
     // Funções para controlar o modal
     const handleImageClick = (image: Image) => setSelectedImage(image);
@@ -194,6 +223,7 @@ export function DatasetDetailPage() {
                                 <Form.Control 
                                     type="file" 
                                     multiple 
+                                    accept="image/*,video/*"
                                     onChange={handleFileChange}
                                     id="file-upload-input"
                                 />
@@ -239,7 +269,8 @@ export function DatasetDetailPage() {
                                 
                                 <Card.Img 
                                     variant="top" 
-                                    src={`/uploads/${image.file_path.replace(/\\/g, '/')}`} 
+                                    src={`/api${image.thumbnail_url}`}
+                                    loading="lazy" 
                                     alt={image.file_name}
                                     style={{ height: '200px', objectFit: 'cover' }}
                                 />
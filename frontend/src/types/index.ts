@@ -22,6 +22,9 @@ export interface Image {
   id: number;
   file_name: string;
   file_path: string;
+  // URLs assinados das miniaturas (relativos à API)
+  thumbnail_url: string;
+  preview_url: string;
   annotations: Annotation[];
 }
 
@@ -30,4 +33,33 @@ export interface Dataset {
   name: string;
   description: string;
   images: Image[];
-}
\ No newline at end of file
+  inference_mode?: 'full' | 'tiled';
+  tile_size?: number;
+  tile_overlap?: number;
+  model_precision?: 'fp32' | 'int8';
+  confidence_threshold?: number;
+  iou_threshold?: number;
+  max_detections?: number;
+  input_size?: number | null;
+  half_precision?: boolean;
+}
+
+// Estatísticas agregadas do dataset (GET /datasets/{id}/stats)
+export interface ClassCount {
+  class_label: string;
+  count: number;
+  mean_confidence: number | null;
+}
+
+export interface DatasetStats {
+  dataset_id: number;
+  image_count: number;
+  annotated_image_count: number;
+  unannotated_image_count: number;
+  annotation_count: number;
+  mean_annotations_per_image: number;
+  max_annotations_per_image: number;
+  class_counts: ClassCount[];
+  density: { annotations: number; images: number }[];
+  confidence_histogram: { lower: number; upper: number; count: number }[];
+}